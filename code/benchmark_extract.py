@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##     This file compares the backends of the extraction (regex and DOM) on the       ##
+##   pages of the synthetic site or on the pages of a crawl: pages/s of each backend  ##
+##             for each type of page and pages where the records differ.              ##
+##                                                                                    ##
+##   Synthetic pages:                                                                 ##
+##       python benchmark_extract.py                                                  ##
+##   Pages of a crawl (at most 500 pages per type):                                   ##
+##       python benchmark_extract.py --data-folder ../data/ --max-pages 500           ##
+##                                                                                    ##
+########################################################################################
+
+from classes.extract import Extractor, lxml
+from classes.stub_site import SyntheticSite
+from classes.pagestore import open_store
+import argparse
+import random
+import time
+
+
+def synthetic_pages(site):
+    """
+    Render all the pages of the synthetic site that go through the extraction
+
+    :param site: SyntheticSite
+    :return: Dict type of page -> list of HTML
+    """
+
+    urls = {'place_list': [], 'brewery': [], 'beer': [], 'member': []}
+
+    for country, code, region, code_region in site.places:
+        query = 'c_id={}&'.format(code)
+        if code_region is not None:
+            query += 's_id={}&'.format(code_region)
+        for start in range(0, max(len(site.open_breweries((country, code, region, code_region))), 1), 20):
+            urls['place_list'].append('/place/list/?start={:d}&{}brewery=Y&sort=name'.format(start, query))
+
+    for brewery in site.breweries.values():
+        urls['brewery'].append('/beer/profile/{:d}/'.format(brewery['id']))
+
+    for beer in site.beers.values():
+        for start in range(0, max(len(beer['ratings']), 1), 25):
+            urls['beer'].append('/beer/profile/{:d}/{:d}/?start={:d}'.format(beer['brewery']['id'], beer['id'], start))
+
+    for user in site.users:
+        urls['member'].append('/community/members/{}/'.format(user['user_id']))
+
+    return dict((page, [site.render(url)[1].decode('utf-8') for url in list_]) for page, list_ in urls.items())
+
+
+def crawled_pages(data_folder, max_pages, seed=0):
+    """
+    Read a sample of the pages of a crawl
+
+    :param data_folder: Folder with the data
+    :param max_pages: Maximum number of pages per type
+    :param seed: Seed of the sample
+    :return: Dict type of page -> list of HTML
+    """
+
+    store = open_store(data_folder)
+    rng = random.Random(seed)
+
+    pages = {}
+    for page, prefix in [('place_list', 'places/'), ('brewery', 'breweries/'), ('beer', 'beers/'),
+                         ('member', 'users/')]:
+        files = html_files(store, prefix)
+        if len(files) > max_pages:
+            files = rng.sample(files, max_pages)
+        pages[page] = [store.get(file).decode('utf-8') for file in files]
+
+    return pages
+
+
+def html_files(store, prefix):
+    """
+    All the HTML files under a prefix of the store
+
+    :param store: Page store
+    :param prefix: Prefix ending with a '/'
+    :return: List of keys
+    """
+
+    files = []
+    for name in store.list(prefix):
+        if name.endswith('.html'):
+            files.append(prefix + name)
+        else:
+            files += html_files(store, prefix + name + '/')
+
+    return files
+
+
+def benchmark(extractor, page, pages, repeat):
+    """
+    Extract all the fields of the pages and return the number of pages per second
+
+    :param extractor: Extractor
+    :param page: Type of page
+    :param pages: List of HTML
+    :param repeat: Number of times the pages are extracted
+    :return: (pages per second, list of the records of each page)
+    """
+
+    records = []
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        records = [extractor.extract(page, html_txt) for html_txt in pages]
+    duration = time.perf_counter() - start
+
+    return repeat * len(pages) / duration, records
+
+
+def run():
+    """
+    Run the benchmark
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark of the backends of the extraction')
+    parser.add_argument('--data-folder', default=None, help='Pages of a crawl (default: pages of the synthetic site)')
+    parser.add_argument('--max-pages', type=int, default=500, help='Maximum number of pages per type of a crawl')
+    parser.add_argument('--page-size', type=int, default=0, help='Minimum size in bytes of the synthetic pages')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times the pages are extracted')
+    args = parser.parse_args()
+
+    if args.data_folder is None:
+        pages = synthetic_pages(SyntheticSite(page_size=args.page_size))
+    else:
+        pages = crawled_pages(args.data_folder, args.max_pages)
+
+    backends = ['regex', 'dom']
+    if lxml is None:
+        print('The package lxml is not installed: only the regex backend is measured')
+        backends = ['regex']
+
+    print('{:>10s} {:>7s} {:>10s}'.format('Page', 'Pages', 'KB/page') +
+          ''.join(' {:>12s}'.format(backend + ' (p/s)') for backend in backends) + ' {:>10s}'.format('Differ'))
+
+    for page, list_ in pages.items():
+        if len(list_) == 0:
+            continue
+
+        speeds = []
+        records = []
+        for backend in backends:
+            speed, records_ = benchmark(Extractor(backend), page, list_, args.repeat)
+            speeds.append(speed)
+            records.append(records_)
+
+        # Pages where the backends do not give the same records
+        differ = sum(1 for values in zip(*records) if any(v != values[0] for v in values[1:]))
+
+        print('{:>10s} {:7d} {:10.1f}'.format(page, len(list_), sum(len(p) for p in list_) / len(list_) / 1000) +
+              ''.join(' {:12.0f}'.format(speed) for speed in speeds) + ' {:10d}'.format(differ))
+
+
+if __name__ == '__main__':
+    run()
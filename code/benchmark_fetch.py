@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##      This file compares the throughput of the sequential mode of the crawler       ##
+##            with the concurrent mode against a local stub HTTP server.              ##
+##                                                                                    ##
+########################################################################################
+
+from classes.crawler import Crawler
+from classes.rate import RateLimiter, RateController
+from classes.stub_server import StubServer
+import time
+
+
+def benchmark(crawler, urls):
+    """
+    Fetch all the urls with the crawler and return the number of pages per second
+
+    :param crawler: Crawler to use
+    :param urls: List of urls
+    :return: Number of pages per second
+    """
+
+    start = time.time()
+
+    nbr = 0
+    for url, r in crawler.fetch_pages(urls):
+        if r is not None and r.status_code == 200:
+            nbr += 1
+
+    return nbr / (time.time() - start)
+
+
+def run():
+    """
+    Run the benchmark
+    """
+
+    # Server answering after 50ms, like a slow page of the real website
+    server = StubServer(latency=0.05, page_size=20000)
+    server.start()
+
+    nbr_pages = 200
+    urls = [server.url + '/beer/profile/1/{:d}'.format(i) for i in range(nbr_pages)]
+
+    # No waiting time between the requests, such that we only measure the crawler
+    delta_t = 0
+
+    print('Sequential mode: {:.1f} pages/s'.format(benchmark(Crawler(delta_t), urls)))
+
+    for concurrency in [2, 4, 8, 16]:
+        crawler = Crawler(delta_t, concurrency=concurrency)
+        print('Concurrent mode ({:d} requests in flight): {:.1f} pages/s'.format(concurrency,
+                                                                                benchmark(crawler, urls)))
+
+    # With a global cap on the rate
+    max_rate = 50
+    crawler = Crawler(delta_t, concurrency=16, rate_controller=RateLimiter(max_rate))
+    print('Concurrent mode (16 requests in flight, cap at {:d} requests/s): {:.1f} pages/s'.format(
+        max_rate, benchmark(crawler, urls)))
+
+    # With the adaptive rate, starting slowly
+    rate = RateController(initial_rate=10, max_rate=200, increase=20, verbose=False)
+    crawler = Crawler(delta_t, concurrency=16, rate_controller=rate)
+    print('Concurrent mode (16 requests in flight, adaptive rate): {:.1f} pages/s ({})'.format(
+        benchmark(crawler, urls), rate))
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    run()
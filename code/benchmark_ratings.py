@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##     This file compares the readers of the file ratings.txt.gz: the old parser      ##
+##    (line by line), the new parse (by chunks) and read_columns (typed arrays),      ##
+##         and checks that they give the same records.                                ##
+##                                                                                    ##
+##   Synthetic file with 200'000 ratings:                                             ##
+##       python benchmark_ratings.py --records 200000                                 ##
+##   File of a crawl, read_columns with 4 processes:                                  ##
+##       python benchmark_ratings.py --file ../data/parsed/ratings.txt.gz -p 4        ##
+##                                                                                    ##
+########################################################################################
+
+from classes.helpers import RATING_COLUMNS, parse, read_columns
+import numpy as np
+import argparse
+import tempfile
+import random
+import gzip
+import time
+import os
+
+
+def legacy_parse(filename):
+    """
+    The function parse before the chunks (a decode and a strip in Python for each line), as a reference
+
+    :param filename: name of the file
+    :return: Generator to go through the file
+    """
+    file = gzip.open(filename, 'rb')
+    entry = {}
+    for line in file:
+        line = line.decode("utf-8").strip()
+        colon_pos = line.find(":")
+        if colon_pos == -1:
+            yield entry
+            entry = {}
+            continue
+        key = line[:colon_pos]
+        value = line[colon_pos + 2:]
+        entry[key] = value
+
+
+def synthetic_file(filename, nbr, seed=0):
+    """
+    Write a file of ratings with random values (same keys and format as the step 11)
+
+    :param filename: txt.gz file
+    :param nbr: Number of ratings
+    :param seed: Seed of the values
+    """
+
+    rng = random.Random(seed)
+    words = ['hoppy', 'malty', 'pours', 'a', 'golden', 'color', 'with', 'white', 'head', 'citrus', 'pine', 'finish',
+             'bitter', 'sweet', 'caramel', 'smooth', 'crisp', 'light', 'body', 'notes', 'of', 'the', 'and']
+
+    with gzip.open(filename, 'wb') as f:
+        for i in range(nbr):
+            beer_id = rng.randint(1, 300000)
+            aspects = [rng.choice(['nan', '{:.2f}'.format(rng.randint(4, 20) / 4)]) for j in range(5)]
+            text = 'nan'
+            if rng.random() < 0.6:
+                text = ' '.join(rng.choice(words) for j in range(rng.randint(10, 150)))
+            values = {'beer_name': 'Beer {:d}'.format(beer_id), 'beer_id': str(beer_id),
+                      'brewery_name': 'Brewery {:d}'.format(beer_id // 20), 'brewery_id': str(beer_id // 20),
+                      'style': rng.choice(['American IPA', 'Stout', 'Saison', 'nan']),
+                      'abv': rng.choice(['nan', '{:.1f}'.format(rng.randint(30, 120) / 10)]),
+                      'date': str(rng.randint(1000000000, 1500000000)), 'user_name': 'user{:d}'.format(i % 5000),
+                      'user_id': 'user{:d}.{:d}'.format(i % 5000, i % 5000 + 1000),
+                      'appearance': aspects[0], 'aroma': aspects[1], 'palate': aspects[2], 'taste': aspects[3],
+                      'overall': aspects[4], 'rating': '{:.2f}'.format(rng.randint(100, 500) / 100), 'text': text,
+                      'review': str(len(text) >= 150)}
+            lines = ['{}: {}'.format(name, values[name]) for name, type_ in RATING_COLUMNS]
+            f.write(('\n'.join(lines) + '\n\n').encode('utf-8'))
+
+
+def timed(function):
+    """
+    Run a function and measure its time
+
+    :param function: Function without argument
+    :return: (result, seconds)
+    """
+
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def run():
+    """
+    Run the benchmark
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark of the readers of ratings.txt.gz')
+    parser.add_argument('--file', default=None, help='File of ratings (default: a synthetic file)')
+    parser.add_argument('--records', type=int, default=200000, help='Number of ratings of the synthetic file')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Processes of read_columns')
+    args = parser.parse_args()
+
+    filename = args.file
+    if filename is None:
+        filename = os.path.join(tempfile.mkdtemp(prefix='ba_ratings_'), 'ratings.txt.gz')
+        synthetic_file(filename, args.records)
+
+    columns = ['beer_id', 'user_id', 'rating', 'date']
+
+    legacy, seconds_legacy = timed(lambda: list(legacy_parse(filename)))
+    nbr = len(legacy)
+
+    print('{:d} ratings, {:.1f} MB compressed'.format(nbr, os.path.getsize(filename) / 1024 ** 2))
+    print('{:46s} {:>8s} {:>12s} {:>8s}'.format('Reader', 'Seconds', 'Ratings/s', 'Speedup'))
+
+    def show(name, seconds):
+        print('{:46s} {:8.2f} {:12.0f} {:7.1f}x'.format(name, seconds, nbr / seconds, seconds_legacy / seconds))
+
+    show('old parse (list of dicts)', seconds_legacy)
+
+    entries, seconds = timed(lambda: list(parse(filename)))
+    show('parse (list of dicts)', seconds)
+    same = entries == legacy
+    del entries
+
+    values, seconds = timed(lambda: read_columns(filename))
+    show('read_columns (all the columns)', seconds)
+
+    values, seconds = timed(lambda: read_columns(filename, columns))
+    show('read_columns ({})'.format(', '.join(columns)), seconds)
+
+    if args.processes != 1:
+        values, seconds = timed(lambda: read_columns(filename, columns, args.processes))
+        show('read_columns ({:d} processes)'.format(args.processes), seconds)
+
+    # The arrays have the values of the old parser with their types
+    types = dict(RATING_COLUMNS)
+    for column in columns:
+        if types[column] == 'str':
+            same = same and list(values[column]) == [item[column] for item in legacy]
+        elif types[column] == 'date':
+            same = same and np.array_equal(values[column].astype(np.int64),
+                                           [int(item[column]) for item in legacy])
+        else:
+            same = same and np.array_equal(values[column], [float(item[column]) for item in legacy], equal_nan=True)
+
+    print('')
+    print('Same records as the old parser: {}'.format(same))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Extension of the files of each codec and default level
+extensions = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4', 'none': ''}
+levels = {'gzip': 6, 'zstd': 3, 'lz4': 0, 'none': None}
+
+
+class BlockWriter:
+    """
+    Writer of a compressed file, block by block on a pool of threads (like pigz)
+
+    The data is cut in blocks of block_size bytes and each block is compressed on its own as one member of the file
+    (a gzip member, a zstd frame or a lz4 frame): the file is a valid multi-member file, read by gzip.open (or
+    open_blocks) as one stream. The compression of zlib, zstandard and lz4 releases the GIL, so the blocks are
+    compressed by the threads while the caller prepares the next records. The blocks are written in order, with at
+    most two blocks per thread waiting in memory.
+
+    With the mode 'ab', the blocks are appended to an existing file. flush() writes what was given so far as complete
+    blocks, such that the file can be read up to there even if the process is killed afterwards.
+    """
+
+    def __init__(self, filename, codec=None, level=None, block_size=1024 * 1024, threads=None, mode='wb'):
+        """
+        Initialize the class
+
+        :param filename: File to write
+        :param codec: 'gzip', 'zstd', 'lz4' or 'none' (default: from the extension of the file)
+        :param level: Level of compression (default: 6 for gzip, 3 for zstd and 0 for lz4)
+        :param block_size: Number of bytes of the blocks before the compression
+        :param threads: Number of threads compressing the blocks (default: the number of CPUs)
+        :param mode: 'wb' or 'ab'
+        """
+
+        if codec is None:
+            codec = codec_of(filename)
+
+        if codec not in extensions:
+            raise ValueError('Unknown codec {} (one of {})'.format(codec, ', '.join(sorted(extensions))))
+
+        if codec == 'zstd' and zstandard is None:
+            raise ImportError('The package zstandard is needed to write the file {}'.format(filename))
+
+        if codec == 'lz4' and lz4 is None:
+            raise ImportError('The package lz4 is needed to write the file {}'.format(filename))
+
+        if level is None:
+            level = levels[codec]
+
+        if threads is None:
+            threads = os.cpu_count() or 1
+
+        self.name = filename
+        self.codec = codec
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads
+
+        self.file = open(filename, mode)
+
+        # Data of the next block
+        self.buffer = []
+        self.buffered = 0
+
+        # Blocks being compressed, in the order of the file
+        self.pending = collections.deque()
+        self.executor = None
+        if codec != 'none':
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def write(self, data):
+        """
+        Add some data (e.g. all the records of a beer at once)
+
+        :param data: bytes
+        """
+
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+        if self.buffered >= self.block_size:
+            self.submit()
+
+    def submit(self):
+        """
+        Send the data of the buffer to the threads as one block
+        """
+
+        if self.buffered == 0:
+            return
+
+        block = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+        if self.executor is None:
+            self.file.write(block)
+            return
+
+        self.pending.append(self.executor.submit(compress, block, self.codec, self.level))
+
+        # Write the blocks already compressed, and wait if too many blocks are in memory
+        while len(self.pending) > 0 and (self.pending[0].done() or len(self.pending) > 2 * self.threads):
+            self.file.write(self.pending.popleft().result())
+
+    def flush(self):
+        """
+        Compress and write everything that was given so far
+        """
+
+        self.submit()
+        while len(self.pending) > 0:
+            self.file.write(self.pending.popleft().result())
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def compress(data, codec, level):
+    """
+    Compress a block as one complete member of a file
+
+    :param data: bytes
+    :param codec: 'gzip', 'zstd', 'lz4' or 'none'
+    :param level: Level of compression
+    :return: bytes
+    """
+
+    if codec == 'gzip':
+        # mtime=0: the same data always gives the same file
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    elif codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    elif codec == 'lz4':
+        return lz4.frame.compress(data, compression_level=level)
+
+    return data
+
+
+def codec_of(filename):
+    """
+    Codec of a file from its extension
+
+    :param filename: Name of the file
+    :return: 'gzip', 'zstd', 'lz4' or 'none'
+    """
+
+    for codec, extension in extensions.items():
+        if extension != '' and filename.endswith(extension):
+            return codec
+
+    return 'none'
+
+
+def open_blocks(filename):
+    """
+    Open a file written by BlockWriter (or by gzip.open) to read it decompressed
+
+    :param filename: Name of the file
+    :return: File object in binary mode (also a context manager)
+    """
+
+    codec = codec_of(filename)
+
+    if codec == 'gzip':
+        return gzip.open(filename, 'rb')
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ImportError('The package zstandard is needed to read the file {}'.format(filename))
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True)
+    elif codec == 'lz4':
+        if lz4 is None:
+            raise ImportError('The package lz4 is needed to read the file {}'.format(filename))
+        return lz4.frame.open(filename, 'rb')
+
+    return open(filename, 'rb')
+
+
+def output_file(prefix):
+    """
+    Existing file of some output with any codec (e.g. ratings.txt.gz, ratings.txt.zst, ratings.txt.lz4 or
+    ratings.txt for the prefix ratings.txt)
+
+    :param prefix: Name of the file without the extension of the codec
+    :return: Name of the file (the one of gzip if none exists)
+    """
+
+    for codec in ['gzip', 'zstd', 'lz4', 'none']:
+        if os.path.exists(prefix + extensions[codec]):
+            return prefix + extensions[codec]
+
+    return prefix + extensions['gzip']
@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Short-lived cache of the responses of the fetcher
+
+    Identical requests in flight at the same time are merged: only the first one goes to the server and the other
+    ones wait for its response. The good responses (status code 200) are then kept in an LRU bounded in size, and
+    they expire after ttl seconds. Only the plain requests (no cookies nor headers, full page in memory) are cached.
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20, ttl=600):
+        """
+        Initialize the class
+
+        :param max_bytes: Maximum size in bytes of the responses kept in the cache
+        :param ttl: Time in seconds after which a response expires
+        """
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+
+        # url -> (time of the fetch, response, size), from the least to the most recently used
+        self.entries = OrderedDict()
+        self.size = 0
+
+        # url -> _Call for the requests in flight
+        self.in_flight = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _fresh(self, url):
+        """
+        Response in the cache if it did not expire. The lock must be held.
+
+        :param url: url of the request
+        :return: response or None
+        """
+
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+
+        fetched_at, r, size = entry
+        if time.time() - fetched_at > self.ttl:
+            del self.entries[url]
+            self.size -= size
+            self.expirations += 1
+            return None
+
+        self.entries.move_to_end(url)
+        return r
+
+    def lookup(self, url):
+        """
+        Get a response without fetching it. If the same request is in flight, wait for its response.
+
+        :param url: url of the request
+        :return: response or None if it has to be fetched
+        """
+
+        with self.lock:
+            r = self._fresh(url)
+            if r is not None:
+                self.hits += 1
+                return r
+
+            call = self.in_flight.get(url)
+            if call is None:
+                return None
+            self.coalesced += 1
+
+        # If the request in flight fails, this one is done again
+        call.event.wait()
+        return call.response if call.error is None else None
+
+    def get(self, url, fetch):
+        """
+        Get a response from the cache, from an identical request in flight or with the function fetch
+
+        :param url: url of the request
+        :param fetch: Function doing the request, fetch() -> response
+        :return: response
+        """
+
+        leader = False
+
+        with self.lock:
+            r = self._fresh(url)
+            if r is not None:
+                self.hits += 1
+                return r
+
+            call = self.in_flight.get(url)
+            if call is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                call = self.in_flight[url] = _Call()
+                leader = True
+
+        # Another thread is doing the same request
+        if not leader:
+            return call.wait()
+
+        try:
+            r = fetch()
+            call.response = r
+        except BaseException as e:
+            # Also KeyboardInterrupt: the identical requests must not wait for a response that never comes
+            call.error = e
+            raise
+        finally:
+            try:
+                with self.lock:
+                    del self.in_flight[url]
+                    if call.error is None and call.response is not None and call.response.status_code == 200:
+                        self._add(url, call.response)
+            finally:
+                call.event.set()
+
+        return r
+
+    def _add(self, url, r):
+        """
+        Add a response and evict the least recently used ones if the cache is too large. The lock must be held.
+
+        :param url: url of the request
+        :param r: response
+        """
+
+        size = len(r.content)
+        if size > self.max_bytes:
+            return
+
+        if url in self.entries:
+            self.size -= self.entries.pop(url)[2]
+
+        self.entries[url] = (time.time(), r, size)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, _, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Statistics of the cache
+
+        :return: Dict with the numbers of hits, misses, coalesced requests, evictions and expirations, the hit rate
+                 and the size of the cache
+        """
+
+        with self.lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'hit_rate': (self.hits + self.coalesced) / requests if requests > 0 else 0.0,
+                    'entries': len(self.entries),
+                    'bytes': self.size}
+
+    def __str__(self):
+        stats = self.stats()
+        return 'Cache: {:d} hits, {:d} coalesced, {:d} misses ({:.1%} saved), {:d} evictions'.format(
+            stats['hits'], stats['coalesced'], stats['misses'], stats['hit_rate'], stats['evictions'])
+
+
+class _Call:
+    """
+    Request in flight, shared by the identical requests
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.helpers import RATING_COLUMNS, read_chunks, parse_chunks, chunk_columns, pyarrow
+from classes.blocks import open_blocks
+import os
+
+
+class ColumnarWriter:
+    """
+    Writer of the ratings or the reviews in a typed columnar file (same records as ratings.txt.gz and reviews.txt.gz)
+
+    The columns have the types of RATING_COLUMNS: integers, floats, booleans and timestamps in seconds, with nulls for
+    the missing values (no 'nan' strings). The records are kept in memory and written every row_group_size records,
+    as one row group of a Parquet file (compressed with zstd, the strings with a dictionary) or as one record batch of
+    an Arrow IPC file (not compressed, such that it can be memory-mapped). The format comes from the extension of the
+    file. The files are read with read_ratings in classes/helpers.py.
+    """
+
+    formats = ['arrow', 'parquet']
+
+    def __init__(self, filename, with_review=True, row_group_size=100000):
+        """
+        Initialize the class
+
+        :param filename: .parquet or .arrow file
+        :param with_review: Add the column review (only in the ratings)
+        :param row_group_size: Number of records of each row group (or record batch)
+        """
+
+        format_ = os.path.splitext(filename)[1][1:]
+        if format_ not in self.formats:
+            raise ValueError('Unknown columnar format {} (one of {})'.format(format_, ', '.join(self.formats)))
+
+        if pyarrow is None:
+            raise ImportError('The package pyarrow is needed to write the file {}'.format(filename))
+
+        self.filename = filename
+        self.format = format_
+        self.row_group_size = row_group_size
+
+        types = {'str': pyarrow.string(), 'int': pyarrow.int64(), 'float': pyarrow.float64(),
+                 'bool': pyarrow.bool_(), 'date': pyarrow.timestamp('s')}
+
+        self.columns = [(name, type_) for name, type_ in RATING_COLUMNS if with_review or name != 'review']
+        self.schema = pyarrow.schema([(name, types[type_]) for name, type_ in self.columns])
+
+        # Values of the records not written yet, by column
+        self.buffer = dict((name, []) for name, type_ in self.columns)
+        self.nbr_buffered = 0
+        self.nbr_written = 0
+
+        if self.format == 'parquet':
+            self.sink = None
+            self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema, compression='zstd')
+        else:
+            self.sink = pyarrow.OSFile(filename, 'wb')
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def write(self, beer, rating):
+        """
+        Add a rating
+
+        :param beer: Dict (or row) of the beer with the beer_name, beer_id, brewery_name, brewery_id, style and abv
+        :param rating: Dict of the rating (see Parser.parse_review_page)
+        """
+
+        for name, values in self.buffer.items():
+            if name in rating:
+                values.append(rating[name])
+            else:
+                values.append(beer[name])
+
+        self.nbr_buffered += 1
+        if self.nbr_buffered >= self.row_group_size:
+            self.flush()
+
+    def write_columns(self, values):
+        """
+        Add some ratings given by columns, after the ones in memory
+
+        :param values: Dict column -> list or NumPy array (see read_columns in classes/helpers.py)
+        """
+
+        self.flush()
+        self.write_batch(values)
+
+    def flush(self):
+        """
+        Write the records in memory as one row group
+        """
+
+        if self.nbr_buffered == 0:
+            return
+
+        self.write_batch(self.buffer)
+
+        self.buffer = dict((name, []) for name in self.buffer)
+        self.nbr_buffered = 0
+
+    def write_batch(self, values):
+        # from_pandas: the NaN are nulls
+        arrays = [pyarrow.array(values[field.name], type=field.type, from_pandas=True) for field in self.schema]
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+        if self.format == 'parquet':
+            self.writer.write_batch(batch, row_group_size=self.row_group_size)
+        else:
+            self.writer.write_batch(batch)
+
+        self.nbr_written += batch.num_rows
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+
+def convert(src, dst, row_group_size=100000):
+    """
+    Write the records of a txt.gz file (e.g. ratings.txt.gz) in a columnar file, one chunk of the file at a time
+
+    :param src: txt.gz file (or another codec, see open_blocks)
+    :param dst: .parquet or .arrow file
+    :param row_group_size: Maximum number of records of each row group
+    :return: Number of records
+    """
+
+    writer = None
+    try:
+        with open_blocks(src) as file:
+            for chunk in read_chunks(file):
+                if writer is None:
+                    writer = ColumnarWriter(dst, 'review' in next(parse_chunks([chunk]), {}), row_group_size)
+
+                writer.write_columns(chunk_columns(chunk, [name for name, type_ in writer.columns]))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # No record: the file still has the columns
+        ColumnarWriter(dst, True, row_group_size).close()
+        return 0
+
+    return writer.nbr_written
@@ -5,26 +5,84 @@
 #
 # Distributed under terms of the MIT license.
 
+from classes.engine import FetchEngine, task_url
+from classes.rate import RateLimiter, RateController
+from classes.retry import RetryPolicy, CircuitBreaker, is_ok, page_size
+from classes.shard import shard_of, beer_key, frontier_file
+from classes.pagestore import open_store
+from classes.frontier import Frontier
+from classes.prober import BreweryProber
+from classes.planner import Progress
+from classes.fetcher import Fetcher
+from classes.cache import ResponseCache
+from classes.metrics import Metrics
+from classes.tracing import Tracer
 from classes.helpers import round_
+from classes.dedup import RatingIndex
+from classes.blocks import output_file
 import pandas as pd
-import numpy as np
 import requests
+import datetime
+import hashlib
 import time
 import re
 import os
 
+# Start of the main column of a user page, below the location and the joining date (see user_stop_after). Checked on
+# the synthetic site only.
+PROFILE_COLUMN = b'<div class="mainProfileColumn">'
+
+# Step of the frontier for the incremental crawl of the reviews, apart from the pages of the step 9
+NEW_REVIEWS_STEP = 90
+
 
 class Crawler:
     """
     Crawler for BeerAdvocate website
     """
 
-    def __init__(self, delta_t, data_folder=None):
+    def __init__(self, delta_t=1.0, data_folder=None, concurrency=1, max_rate=None, fetcher=None,
+                 rate_controller=None, frontier=None, shard=0, nbr_shards=1, base_url=None, store=None, stream=True,
+                 user_stop_after=None, progress=True, priority=None,
+                 work_stealing=True, metrics=None, tracer=None, retry_policy=None, breaker=None, cookies=None):
         """
         Initialize the class.
         
-        :param delta_t: Average time in seconds between two requests
+        :param delta_t: Average time in seconds between two requests at the beginning (0 to not wait at all without
+                        max_rate)
         :param data_folder: Folder to save the data
+        :param concurrency: Number of requests in flight at the same time (1 for the sequential mode)
+        :param max_rate: Ceiling for the number of requests per second (default: 4/delta_t)
+        :param fetcher: Fetcher with the pooled HTTP session (default: one connection per request in flight and a
+                        ResponseCache)
+        :param rate_controller: RateController adapting the rate to the server (default: AIMD between delta_t
+                                and max_rate)
+        :param frontier: Frontier with the state of the pages to crawl (default: misc/frontier.sqlite, or one file
+                         per shard)
+        :param shard: Shard crawled by this worker (steps 9, 13 and 15)
+        :param nbr_shards: Number of shards. The beers and the users are partitioned between the workers.
+        :param base_url: url of the website (default: https://www.beeradvocate.com)
+        :param store: Page store where the pages are saved (default: packed store if the data folder has one, HTML
+                      files otherwise)
+        :param stream: Write the pages of the frontier in the page store chunk by chunk as they arrive instead of
+                       keeping them in memory
+        :param user_stop_after: Byte pattern after which a user page is not kept, e.g. PROFILE_COLUMN (the location
+                                and the joining date must be above it). The connection stays alive if the rest is
+                                small (see Fetcher.get). Default: None, the full pages are kept.
+        :param progress: Print a progress line with the rate and the estimated time left during the crawl steps
+        :param priority: Function priority(step, row) giving the priority of a beer (step 9, row of beers.csv) or of
+                         a user (steps 13 and 15, row of users.csv). The highest priorities are crawled first, then
+                         the largest beers. Default: the largest beers first.
+        :param work_stealing: Once its shard is done, a worker crawls the pending pages of the other shards
+        :param metrics: Metrics of the crawl (requests, bytes, latency, retries, pages left), shared with the fetcher
+                        and the engine (see MetricsServer to export them)
+        :param tracer: Tracer for the spans of the fetches and of the saves (default: no tracing)
+        :param retry_policy: RetryPolicy deciding which pages are fetched again and when (default: 5 attempts with
+                             exponential backoff and jitter)
+        :param breaker: CircuitBreaker pausing the crawl when the error rate spikes (default: breaker with the
+                        default settings)
+        :param cookies: Dict with the cookies of a connection with an account on BeerAdvocate, only sent by the
+                        step 15 (None if the step 15 is not run)
         """
 
         if data_folder is None:
@@ -32,7 +90,85 @@ class Crawler:
         else:
             self.data_folder = data_folder
 
-        self.delta_t = delta_t
+        if base_url is None:
+            self.base_url = 'https://www.beeradvocate.com'
+        else:
+            self.base_url = base_url
+
+        if metrics is None:
+            self.metrics = Metrics()
+        else:
+            self.metrics = metrics
+
+        if tracer is None:
+            self.tracer = Tracer()
+        else:
+            self.tracer = tracer
+
+        # HTTP layer, the connections are kept alive between the requests and the duplicate requests are merged
+        if fetcher is None:
+            self.fetcher = Fetcher(max_per_host=max(concurrency, 10), cache=ResponseCache(), metrics=self.metrics)
+        else:
+            self.fetcher = fetcher
+            if self.fetcher.metrics is None:
+                self.fetcher.metrics = self.metrics
+
+        # Rate of the requests, shared by the sequential and the concurrent mode
+        if rate_controller is not None:
+            self.rate = rate_controller
+        elif delta_t == 0 and max_rate is None:
+            # No waiting at all (e.g. for the benchmarks)
+            self.rate = RateLimiter()
+        else:
+            initial_rate = 1.0 / delta_t if delta_t > 0 else 1.0
+            if max_rate is None:
+                # Room for the AIMD to go above the start rate
+                max_rate = 4 * initial_rate
+            self.rate = RateController(initial_rate, max_rate)
+
+        self.metrics.gauge('ba_rate', lambda: self.rate.rate or 0)
+
+        # Retries of the bad responses, shared by the sequential and the concurrent mode
+        if retry_policy is None:
+            self.retry_policy = RetryPolicy()
+        else:
+            self.retry_policy = retry_policy
+
+        if breaker is None:
+            self.breaker = CircuitBreaker(metrics=self.metrics)
+        else:
+            self.breaker = breaker
+
+        # Where the pages are saved
+        if store is None:
+            self.store = open_store(self.data_folder)
+        else:
+            self.store = store
+
+        self.stream = stream
+        # Second pooled session for the step 15, created with the cookies when the step is run
+        self.cookies = cookies
+        self.cookie_fetcher = None
+        self.user_stop_after = user_stop_after
+        self.progress = progress
+        self.priority = priority
+        self.work_stealing = work_stealing
+
+        # Partition of the work between several workers
+        self.shard = shard
+        self.nbr_shards = nbr_shards
+
+        # Persistent state of the crawl
+        if frontier is None:
+            self.frontier = Frontier(frontier_file(self.data_folder, shard, nbr_shards))
+        else:
+            self.frontier = frontier
+
+        # Engine for the concurrent mode. None means that we use the sequential mode.
+        if concurrency > 1:
+            self.engine = FetchEngine(concurrency, self.rate, self.metrics, self.retry_policy, self.breaker)
+        else:
+            self.engine = None
 
         self.special_places = ['Canada', 'United States', 'United Kingdom']
 
@@ -49,66 +185,62 @@ class Crawler:
         Crawl all the places
         """
 
-        url_countries = 'https://www.beeradvocate.com/place/directory/?show=all'
-
-        # Create folder for all the HTML pages
-        folder = self.data_folder + 'misc/'
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        url_countries = self.base_url + '/place/directory/?show=all'
 
         # Crawl the countries
-        r = self.request_and_wait(url_countries)
-        with open(folder + 'countries.html', 'wb') as output:
-            output.write(r.content)
+        [(_, r)] = list(self.fetch_pages([url_countries]))
+        if not is_ok(r):
+            print('---------------------------------------------------------------------')
+            print('')
+            print('Problem downloading the countries {}'.format(url_countries))
+            print('---------------------------------------------------------------------')
+            print('')
+            return
 
-        # Create folder for all the places
-        folder = self.data_folder + 'places/'
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        self.save_page('misc/countries.html', r)
 
         # Parse the countries
-        html = open(self.data_folder + 'misc/countries.html', 'rb').read().decode('utf8')
+        html = self.store.get('misc/countries.html').decode('utf8')
 
         str_ = '<a href="/place/directory/0/(.+?)/">(.+?)</a>'
 
         grp = re.finditer(str_, str(html))
 
+        # Pages with the number of breweries for the countries
+        tasks = []
         for g in grp:
-
-            folder = self.data_folder + 'places/'
-
             # Get the country name
             country = g.group(2).replace('<b>', '').replace('</b>', '')
             nbr = country[::-1].find(' ') + 1
             country = country[:-nbr]
 
+            url = self.base_url + '/place/directory/0/{}/'.format(g.group(1))
+            tasks.append((url, country, g.group(1)))
+
+        # Pages with the number of breweries for the regions of the special places
+        tasks_regions = []
+        # First pages of the lists of breweries
+        tasks_lists = []
+
+        for (url, country, code), r in self.fetch_pages(tasks):
+            if not is_ok(r):
+                self.print_problem(url)
+                continue
+
             # Check if it's special or not
             if country not in self.special_places:
-                # Download the page with the number of breweries
-                url = 'https://www.beeradvocate.com/place/directory/0/{}/'.format(g.group(1))
-                r = self.request_and_wait(url)
                 # Get the number of breweries
                 str_ = 'Brewery \((\d+)\)'
                 test = re.search(str_, str(r.content))
                 # Check if it's more than 0
                 if int(test.group(1)) > 0:
                     # Save the first page in this case
-                    url = 'https://www.beeradvocate.com/place/list/?start=0&c_id={}&brewery=Y&sort=name'.format(
-                        g.group(1))
-                    r = self.request_and_wait(url)
-
-                    if not os.path.exists(folder + country):
-                        os.makedirs(folder + country)
-
-                    with open(folder + country + '/0.html', 'wb') as output:
-                        output.write(r.content)
+                    url = self.base_url + '/place/list/?start=0&c_id={}&brewery=Y&sort=name'.format(code)
+                    tasks_lists.append((url, country))
             else:
-                # Download the page with all the regions
-                url = 'https://www.beeradvocate.com/place/directory/0/{}/'.format(g.group(1))
-                r = self.request_and_wait(url)
                 html_spec = r.content
                 # Get all the regions
-                str_spec = '<a href="/place/directory/0/{}/(.+?)/">(.+?)</a>'.format(g.group(1))
+                str_spec = '<a href="/place/directory/0/{}/(.+?)/">(.+?)</a>'.format(code)
                 grp_spec = re.finditer(str_spec, str(html_spec))
                 for g_spec in grp_spec:
                     if '#' not in g_spec.group(1):
@@ -117,25 +249,30 @@ class Crawler:
                         nbr = place[::-1].find(' ') + 1
                         place = place[:-nbr]
                         # Download the page with the number of breweries
-                        url = 'https://www.beeradvocate.com/place/directory/0/{}/{}/'.format(g.group(1),
-                                                                                             g_spec.group(1))
-                        r = self.request_and_wait(url)
-
-                        # Get the number of breweries
-                        str_ = 'Brewery \((\d+)\)'
-                        test = re.search(str_, str(r.content))
-                        # Check if it's more than 0
-                        if int(test.group(1)) > 0:
-                            # Save the first page in this case
-                            url = 'https://www.beeradvocate.com/place/list/?start=0&c_id={}&s_id={}&brewery=Y' \
-                                  '&sort=name'.format(g.group(1), g_spec.group(1))
-                            r = self.request_and_wait(url)
-                            name = country + '/' + place
-
-                            if not os.path.exists(folder + name):
-                                os.makedirs(folder + name)
-                            with open(folder + name + '/0.html', 'wb') as output:
-                                output.write(r.content)
+                        url = self.base_url + '/place/directory/0/{}/{}/'.format(code, g_spec.group(1))
+                        tasks_regions.append((url, country + '/' + place, code, g_spec.group(1)))
+
+        for (url, name, code, code_region), r in self.fetch_pages(tasks_regions):
+            if not is_ok(r):
+                self.print_problem(url)
+                continue
+
+            # Get the number of breweries
+            str_ = 'Brewery \((\d+)\)'
+            test = re.search(str_, str(r.content))
+            # Check if it's more than 0
+            if int(test.group(1)) > 0:
+                # Save the first page in this case
+                url = self.base_url + '/place/list/?start=0&c_id={}&s_id={}&brewery=Y' \
+                      '&sort=name'.format(code, code_region)
+                tasks_lists.append((url, name))
+
+        for (url, name), r in self.fetch_pages(tasks_lists):
+            if not is_ok(r):
+                self.print_problem(url)
+                continue
+
+            self.save_page('places/' + name + '/0.html', r)
 
     ########################################################################################
     ##                                                                                    ##
@@ -150,17 +287,16 @@ class Crawler:
         Crawl the missing pages with the breweries from the different places
         """
 
-        folder = self.data_folder + 'places/'
+        folder = 'places/'
 
-        list_ = os.listdir(folder)
+        list_ = self.store.list(folder)
 
         step = 20
 
+        tasks = []
         for dir_ in list_:
-            folder = self.data_folder + 'places/'
-
             if dir_ not in self.special_places:
-                html = open(folder + dir_ + '/0.html', 'rb').read().decode('utf8')
+                html = self.store.get(folder + dir_ + '/0.html').decode('utf8')
 
                 # Get the code from the country
                 str_ = 'c_id=(.+?)&'
@@ -175,18 +311,14 @@ class Crawler:
                 # Download the remaining breweries
                 for i in range(1, int(nbr / step) + 1):
                     start = i * step
-                    url = 'https://www.beeradvocate.com/place/list/?start={:d}&c_id={}&brewery=Y&sort=name'.format(
+                    url = self.base_url + '/place/list/?start={:d}&c_id={}&brewery=Y&sort=name'.format(
                         start,
                         code)
-                    r = self.request_and_wait(url)
-
-                    # Save it
-                    with open(folder + dir_ + '/{:d}.html'.format(start), 'wb') as output:
-                        output.write(r.content)
+                    tasks.append((url, folder + dir_ + '/{:d}.html'.format(start)))
             else:
-                list_2 = os.listdir(folder + dir_)
+                list_2 = self.store.list(folder + dir_ + '/')
                 for dir_2 in list_2:
-                    html = open(folder + dir_ + '/' + dir_2 + '/0.html', 'rb').read().decode('utf8')
+                    html = self.store.get(folder + dir_ + '/' + dir_2 + '/0.html').decode('utf8')
 
                     # Get the code from the country
                     str_ = 'c_id=(.+?)&'
@@ -206,13 +338,17 @@ class Crawler:
                     # Download the remaining breweries
                     for i in range(1, int(nbr / step) + 1):
                         start = i * step
-                        url = 'https://www.beeradvocate.com/place/list/?start={:d}&c_id={}&s_id={}&brewery=Y' \
+                        url = self.base_url + '/place/list/?start={:d}&c_id={}&s_id={}&brewery=Y' \
                               '&sort=name'.format(start, code, code_region)
-                        r = self.request_and_wait(url)
+                        tasks.append((url, folder + dir_ + '/' + dir_2 + '/{:d}.html'.format(start)))
 
-                        # Save it
-                        with open(folder + dir_ + '/' + dir_2 + '/{:d}.html'.format(start), 'wb') as output:
-                            output.write(r.content)
+        for (url, file), r in self.fetch_pages(tasks):
+            if not is_ok(r):
+                self.print_problem(url)
+                continue
+
+            # Save it
+            self.save_page(file, r)
 
     ########################################################################################
     ##                                                                                    ##
@@ -229,28 +365,32 @@ class Crawler:
         !!! Make sure step 3 was done with the parser !!!
         """
 
-        df = pd.read_csv(self.data_folder + 'parsed/breweries.csv')
+        # The pages already crawled are not crawled again
+        self.frontier.add(4, self.brewery_tasks(), self.store)
+
+        self.crawl_frontier(4, self.save_page)
+
+    def brewery_tasks(self):
+        """
+        USED BY STEP 4
 
-        folder = self.data_folder + 'breweries/'
-        # Create folder for all the HTML pages
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        Pages of all the breweries of breweries.csv
+
+        :return: List of (url, file)
+        """
+
+        df = pd.read_csv(self.data_folder + 'parsed/breweries.csv')
 
+        tasks = []
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
             id_ = row['id']
 
-            folder = self.data_folder + 'breweries/'
+            # Get the HTML page
+            url = self.base_url + '/beer/profile/{:d}/?view=beers&show=all'.format(id_)
+            tasks.append((url, 'breweries/{}.html'.format(id_)))
 
-            # Check if file already exists
-            if not os.path.exists(folder + str(id_) + '.html'):
-                # Get the HTML page
-                url = 'https://www.beeradvocate.com/beer/profile/{:d}/?view=beers&show=all'.format(id_)
-                r = self.request_and_wait(url)
-
-                # Save it
-                with open(folder + str(id_) + '.html', 'wb') as output:
-                    output.write(r.content)
+        return tasks
 
     ########################################################################################
     ##                                                                                    ##
@@ -263,177 +403,293 @@ class Crawler:
         STEP 5
 
         Crawl the closed breweries (Not in the breweries.csv file)
+
+        The missing ids are probed concurrently (see BreweryProber) and only the pages of the breweries are
+        downloaded entirely.
         """
 
-        df = pd.read_csv(self.data_folder + 'parsed/breweries.csv')
+        prober = BreweryProber(self)
 
-        df = df.sort_values(by='id')
+        # Only the beginning of the pages is downloaded to know which ids are breweries
+        counts = prober.probe()
+        print('Probes: {}'.format(', '.join('{:d} {}'.format(n, result) for result, n in sorted(counts.items()))))
 
-        # Last id
-        last = df['id'].ix[df.index[-1]]
+        # Then the full pages of the breweries
+        self.crawl_frontier(5, self.save_page)
 
-        # All ids
-        all_ids = list(range(1, last + 1))
+    ########################################################################################
+    ##                                                                                    ##
+    ##                              Crawl all the beers                                   ##
+    ##                                                                                    ##
+    ########################################################################################
 
-        # The ids we already have
-        got = list(df['id'])
+    def crawl_all_beers_and_reviews(self):
+        """
+        STEP 9
+
+        Crawl all the reviews from all the beers.
 
-        # The missing ones
-        missing = list(set(all_ids) - set(got))
+        The first page of each beer gives the number of ratings and therefore the pages with the reviews that have
+        to be crawled. These pages are added to the frontier as soon as the first page is saved.
 
-        for id_ in missing:
+        !!! Make sure steps 6, 7 and 8 were done with the parser !!!
+        """
 
-            folder = self.data_folder + 'breweries/'
+        # First time with the frontier. The pages crawled before are added as done.
+        first_time = self.frontier.count(9) == 0
 
-            # Check if file already exists
-            if not os.path.exists(folder + str(id_) + '.html'):
-                url = 'https://www.beeradvocate.com/beer/profile/{:d}/?view=beers&show=all'.format(id_)
+        # Get the first page of all the beers
+        tasks = self.beer_tasks()
 
-                r = self.request_and_wait(url)
+        self.frontier.add(9, tasks, self.store)
 
-                html = r.content
+        if first_time:
+            # Get the pages with the reviews for the beers whose first page was already there
+            for url, file, _, _ in tasks:
+                if self.store.size(file):
+                    html_txt = self.store.get(file).decode('utf-8')
+                    self.frontier.add(9, self.review_pages(url, file, html_txt), self.store)
 
-                # Search if it's a brewery
-                str_ = '<b>Type:</b> (.+?)\\\\n\\\\t\\\\t<br>'
-                grp = re.search(str_, str(html))
-                try:
-                    types = grp.group(1).split(', ')
-
-                    if 'Brewery' in types:
-                        with open(folder + str(id_) + '.html', 'wb') as output:
-                            output.write(r.content)
-                except AttributeError:
-                    print('---------------------------------------------------------------------')
-                    print('')
-                    print('ERROR WITH BREWERY_ID {}'.format(id_))
-                    print('---------------------------------------------------------------------')
-                    print('')
-                    pass
+        self.crawl_frontier(9, self.save_beer_page)
+
+        # Help the workers of the other shards to finish
+        if self.work_stealing and self.nbr_shards > 1:
+            self.steal_work(9, self.save_beer_page)
+
+    def beer_tasks(self, with_reviews=False):
+        """
+        USED BY STEP 9
+
+        First pages of all the beers of beers.csv in the shard of this worker
+
+        The priority of a beer is given by the function priority of the crawler and its cost is its number of pages
+        (from its number of ratings if known, otherwise 1). The pages with the reviews have the same priority and
+        cost as the first page.
+
+        :param with_reviews: Also give the pages with the reviews, from the number of ratings in beers.csv (only
+                             after step 10)
+        :return: List of (url, file, priority, cost)
+        """
+
+        df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
+
+        tasks = []
+        for i in df.index:
+            row = df.loc[i]
+            brewery_id = row['brewery_id']
+            beer_id = row['beer_id']
+
+            # The beer is crawled by another worker
+            if not self.in_shard(beer_key(brewery_id, beer_id)):
+                continue
+
+            url = self.base_url + '/beer/profile/{:d}/{:d}'.format(brewery_id, beer_id)
+            file = 'beers/{:d}/{:d}/0.html'.format(brewery_id, beer_id)
+
+            reviews = []
+            if 'nbr_ratings' in row and not pd.isnull(row['nbr_ratings']):
+                reviews = self.review_tasks(url, file, row['nbr_ratings'])
+
+            priority = self.priority(9, row) if self.priority is not None else 0
+            cost = len(reviews) + 1
+
+            tasks.append((url, file, priority, cost))
+
+            if with_reviews:
+                tasks += [(url_, file_, priority, cost) for url_, file_ in reviews]
+
+        return tasks
+
+    def review_tasks(self, url, file, nbr_ratings):
+        """
+        USED BY STEP 9
+
+        Pages with the reviews of a beer after the first one
+
+        :param url: url of the first page of the beer
+        :param file: file of the first page of the beer
+        :param nbr_ratings: Number of ratings of the beer
+        :return: List of (url, file)
+        """
+
+        step = 25
+
+        folder = os.path.dirname(file) + '/'
+
+        nbr = round_(nbr_ratings - 1, step)
+
+        tasks = []
+        for j in range(1, int(nbr / step) + 1):
+            tmp = j * step
+            tasks.append((url + '/?view=beer&sort=&start=' + str(tmp), folder + str(tmp) + '.html'))
+
+        return tasks
+
+    def review_pages(self, url, file, html_txt):
+        """
+        USED BY STEP 9
+
+        Get the pages with the reviews and ratings of a beer from its first page
+
+        :param url: url of the first page of the beer
+        :param file: file of the first page of the beer
+        :param html_txt: HTML of the first page of the beer
+        :return: List of (url, file, priority, cost) with the priority of the first page
+        """
+
+        # Parse it to get the number of Ratings
+        str_ = '</i> Ratings: (.+?)</b>'
+        grp = re.search(str_, str(html_txt))
+
+        try:
+            nbr_ratings = int(grp.group(1).replace(',', ''))
+        except Exception as e:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('Cannot read file {}'.format(file))
+            print('---------------------------------------------------------------------')
+            print('')
+
+            nbr_ratings = 1
+
+        tasks = self.review_tasks(url, file, nbr_ratings)
+
+        # The pages of a large beer are crawled right away
+        priority, _ = self.frontier.priority(9, url)
+        cost = len(tasks) + 1
+
+        return [(url_, file_, priority, cost) for url_, file_ in tasks]
+
+    def save_beer_page(self, file, r):
+        """
+        USED BY STEP 9
+
+        Save a page of a beer. For the first page, the pages with the reviews are added to the frontier.
+
+        :param file: File relative to the data folder
+        :param r: the request (always a good one, see crawl_frontier)
+        """
+
+        self.save_page(file, r)
+
+        if file.endswith('/0.html'):
+            brewery_id, beer_id = file.split('/')[1:3]
+            url = self.base_url + '/beer/profile/{}/{}'.format(brewery_id, beer_id)
+            # The page was streamed to the store
+            html = self.store.get(file) if getattr(r, 'streamed', False) else r.content
+            self.frontier.add(9, self.review_pages(url, file, html.decode('utf-8')))
 
     ########################################################################################
     ##                                                                                    ##
-    ##                              Crawl all the beers                                   ##
+    ##                        Crawl the new reviews of the beers                          ##
     ##                                                                                    ##
     ########################################################################################
 
-    def crawl_all_beers_and_reviews(self):
+    def crawl_new_reviews(self, known=None):
         """
-        STEP 9
+        STEP 9 (INCREMENTAL)
 
-        Crawl all the reviews from all the beers.
+        Crawl only the new reviews of all the beers. The reviews are sorted from the newest to the oldest and the
+        pages of a beer are crawled until a review that is already in the dataset is found. The pages are saved in
+        the folder delta/{date}/beers/{brewery_id}/{beer_id}/ and parsed with Parser.parse_new_reviews.
 
-        !!! Make sure steps 6, 7 and 8 were done with the parser !!!
+        The pages go through the frontier (step NEW_REVIEWS_STEP): a run that was interrupted is finished in the
+        same delta folder by the next call. Once a run is finished, the next call starts a new delta and the pages
+        of the previous run are removed from the frontier (with their dead letters).
+
+        !!! Make sure step 11 was done with the parser !!!
+
+        :param known: RatingIndex (or set) of the (user_id, beer_id) already in the dataset (default: from the file
+                      ratings.txt.gz)
+        :return: Folder of the delta
         """
 
-        df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
+        if known is None:
+            known = RatingIndex()
+            known.load(output_file(self.data_folder + 'parsed/ratings.txt'))
 
-        folder = self.data_folder + 'beers/'
-        # Create folder for all the HTML pages
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        self.frontier.reset(NEW_REVIEWS_STEP)
 
-        step = 25
+        pending = self.frontier.files(NEW_REVIEWS_STEP, 'pending')
+        if len(pending) > 0:
+            # Interrupted run
+            delta = '/'.join(pending[0].split('/')[:2]) + '/'
+        else:
+            self.frontier.clear(NEW_REVIEWS_STEP)
 
-        for i in df.index:
-            row = df.ix[i]
-            brewery_id = row['brewery_id']
-            beer_id = row['beer_id']
+            delta = 'delta/{}/'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
 
-            url = 'https://www.beeradvocate.com/beer/profile/{:d}/{:d}'.format(brewery_id, beer_id)
+            # First page of all the beers
+            df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
 
-            # Create the folder
-            folder = self.data_folder + 'beers/{:d}/{:d}/'.format(brewery_id, beer_id)
-            if not os.path.exists(folder):
-                os.makedirs(folder)
+            tasks = []
+            for i in df.index:
+                row = df.loc[i]
+                brewery_id = row['brewery_id']
+                beer_id = row['beer_id']
 
-            if not os.path.exists(folder + '0.html') or os.stat(folder + '0.html').st_size == 0:
-                count = 0
-                code = 400
+                # The beer is crawled by another worker
+                if not self.in_shard(beer_key(brewery_id, beer_id)):
+                    continue
 
-                try:
-                    while code != 200:
-                        # Get it and write it
-                        r = self.request_and_wait(url)
+                tasks.append(self.new_review_task(delta, brewery_id, beer_id, 0))
 
-                        code = r.status_code
-                        count += 1
+            self.frontier.add(NEW_REVIEWS_STEP, tasks)
 
-                        if r.content == '':
-                            code = 400
+        self.crawl_frontier(NEW_REVIEWS_STEP, lambda file, r: self.save_new_review_page(file, r, known))
 
-                        if count == 5:
-                            raise Exception('Problem downloading file 1.html for '
-                                            'brewery_id {} and beer_id {} ( rm -r {}/{}) '.format(brewery_id, beer_id,
-                                                                                                  brewery_id, beer_id))
+        return delta
 
-                except Exception as e:
-                    print('---------------------------------------------------------------------')
-                    print('')
-                    print(e)
-                    print('---------------------------------------------------------------------')
-                    print('')
+    def new_review_task(self, delta, brewery_id, beer_id, start):
+        """
+        USED BY STEP 9 (INCREMENTAL)
 
-                # Save it
-                with open(folder + '0.html', 'wb') as output:
-                    output.write(r.content)
+        Page of the reviews of a beer sorted from the newest to the oldest
 
-            html_txt = open(folder + '0.html', 'rb').read().decode('utf-8')
+        :param delta: Folder of the delta
+        :param brewery_id: ID of the brewery
+        :param beer_id: ID of the beer
+        :param start: Number of reviews before the page
+        :return: (url, file)
+        """
 
-            # Parse it to get the number of Ratings
-            str_ = '</i> Ratings: (.+?)</b>'
-            grp = re.search(str_, str(html_txt))
+        url = self.base_url + '/beer/profile/{:d}/{:d}/?view=beer&sort=time&start={:d}'.format(brewery_id, beer_id,
+                                                                                                start)
+        file = delta + 'beers/{:d}/{:d}/{:d}.html'.format(brewery_id, beer_id, start)
 
-            try:
-                nbr = round_(int(grp.group(1).replace(',', '')) - 1, step)
-            except Exception as e:
-                print('---------------------------------------------------------------------')
-                print('')
-                print('Cannot read file 1.html for brewery_id {} and beer_id {} '
-                      '( rm -r {}/{}) '.format(brewery_id, beer_id, brewery_id, beer_id))
-                print('---------------------------------------------------------------------')
-                print('')
+        return url, file
 
-                nbr = 0
+    def save_new_review_page(self, file, r, known):
+        """
+        USED BY STEP 9 (INCREMENTAL)
 
-            # Get all the pages with the reviews and ratings
-            for j in range(1, int(nbr / step) + 1):
-                tmp = j * step
+        Save a page with the newest reviews of a beer. The next page is added to the frontier only if all the
+        reviews of this one are new.
 
-                if not os.path.exists(folder + str(tmp) + '.html'):
-                    url_tmp = url + '/?view=beer&sort=&start=' + str(tmp)
+        :param file: File relative to the data folder (delta/{date}/beers/{brewery_id}/{beer_id}/{start}.html)
+        :param r: the request (always a good one, see crawl_frontier)
+        :param known: RatingIndex (or set) of the (user_id, beer_id) already in the dataset
+        """
 
-                    # Download the file
-                    count = 0
-                    code = 400
+        step = 25
 
-                    try:
-                        while code != 200:
-                            # Get it and write it
-                            r = self.request_and_wait(url_tmp)
+        self.save_page(file, r)
 
-                            code = r.status_code
-                            count += 1
+        # The page was streamed to the store
+        html = self.store.get(file) if getattr(r, 'streamed', False) else r.content
 
-                            if r.content == '':
-                                code = 400
+        parts = file.split('/')
+        delta = '/'.join(parts[:2]) + '/'
+        brewery_id, beer_id = int(parts[3]), int(parts[4])
+        start = int(parts[5].split('.')[0])
 
-                            if count == 5:
-                                raise Exception('Problem downloading file {}.html for '
-                                                'brewery_id {} and beer_id {} ( rm -r {}/{}) '.format(str(tmp),
-                                                                                                      brewery_id,
-                                                                                                      beer_id,
-                                                                                                      brewery_id,
-                                                                                                      beer_id))
+        str_ = '<a href="/community/members/([^/"]+)/" class="username">'
+        users = re.findall(str_, html.decode('utf-8'))
 
-                    except Exception as e:
-                        print('---------------------------------------------------------------------')
-                        print('')
-                        print(e)
-                        print('---------------------------------------------------------------------')
-                        print('')
+        new = [user_id for user_id in users if (user_id, beer_id) not in known]
 
-                    with open(folder + str(tmp) + '.html', 'wb') as output:
-                        output.write(r.content)
+        if len(new) == len(users) and len(users) >= step:
+            self.frontier.add(NEW_REVIEWS_STEP, [self.new_review_task(delta, brewery_id, beer_id, start + step)])
 
     ########################################################################################
     ##                                                                                    ##
@@ -450,26 +706,15 @@ class Crawler:
         !!! Make sure steps 10, 11 ,and 12 were done with the parser !!!
         """
 
-        # Load the DF of users
-        df = pd.read_csv(self.data_folder + 'parsed/users.csv')
-
-        # Create folder for all the HTML pages
-        folder = self.data_folder + 'users/'
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        # The users already crawled are not crawled again
+        self.frontier.add(13, self.user_tasks(), self.store)
 
-        for i in df.index:
-            row = df.ix[i]
-
-            # Get the url
-            url = 'https://www.beeradvocate.com/community/members/{}/'.format(row['user_id'])
-
-            # Crawl the user's page
-            r = self.request_and_wait(url)
+        # Crawl the users' pages
+        self.crawl_frontier(13, self.save_page, stop_after=self.user_stop_after)
 
-            # Save it
-            with open(folder + str(row['user_id']) + '.html', 'wb') as output:
-                output.write(r.content)
+        # Help the workers of the other shards to finish
+        if self.work_stealing and self.nbr_shards > 1:
+            self.steal_work(13, self.save_page, stop_after=self.user_stop_after)
 
     ########################################################################################
     ##                                                                                    ##
@@ -486,33 +731,57 @@ class Crawler:
         !!! Make sure steps 14 were done with the parser !!!
         """
 
+        if self.cookies is None:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('NO COOKIES GIVEN TO THE CRAWLER, THE STEP 15 IS SKIPPED')
+            print('---------------------------------------------------------------------')
+            print('')
+            return
+
+        # The cookies are set once on the session of a second fetcher. It has no cache: the pages of the step 13
+        # have the same urls but they were fetched without the cookies.
+        if self.cookie_fetcher is None:
+            self.cookie_fetcher = Fetcher(max_per_host=self.fetcher.max_per_host, cookies=self.cookies,
+                                          metrics=self.metrics)
+
+        # The files exist from step 13, they have to be crawled again with the cookies
+        self.frontier.add(15, self.user_tasks(only_manual_check=True))
+
+        # Crawl the users' pages
+        self.crawl_frontier(15, self.save_page, self.cookie_fetcher, stop_after=self.user_stop_after)
+
+    def user_tasks(self, only_manual_check=False):
+        """
+        USED BY STEPS 13 AND 15
+
+        Pages of all the users of users.csv in the shard of this worker
+
+        :param only_manual_check: Only the users who have put a restriction on their profile (after step 14)
+        :return: List of (url, file, priority, cost)
+        """
+
         # Load the DF of users
         df = pd.read_csv(self.data_folder + 'parsed/users.csv')
 
-        df = df[df['joined'] == 'MANUAL_CHECK']
+        if only_manual_check:
+            df = df[df['joined'] == 'MANUAL_CHECK']
 
-        # cookies !!! You may have to change them according to your browser !!!
-        cookies = dict(xf_session="0ce9764fc5c68bbbf7f258ef233c7a74", OX_plg="pm", OX_sd="1",
-                       __cfduid="decaf5d8d30f4fce5c2afd076a806a7501501757826", _ga="GA1.3.804066691.1501757842",
-                       _gat="1", _gid="GA1.3.1441985684.1501858687")
+        tasks = []
+        for i in df.index:
+            row = df.loc[i]
 
-        # Create folder for all the HTML pages
-        folder = self.data_folder + 'users/'
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+            # The user is crawled by another worker
+            if not self.in_shard(row['user_id']):
+                continue
 
-        for i in df.index:
-            row = df.ix[i]
+            priority = self.priority(13, row) if self.priority is not None else 0
 
             # Get the url
-            url = 'https://www.beeradvocate.com/community/members/{}/'.format(row['user_id'])
+            url = self.base_url + '/community/members/{}/'.format(row['user_id'])
+            tasks.append((url, 'users/{}.html'.format(row['user_id']), priority, 1))
 
-            # Crawl the user's page
-            r = self.request_and_wait(url, cookies)
-
-            # Save it
-            with open(folder + str(row['user_id']) + '.html', 'wb') as output:
-                output.write(r.content)
+        return tasks
 
     ########################################################################################
     ##                                                                                    ##
@@ -520,36 +789,358 @@ class Crawler:
     ##                                                                                    ##
     ########################################################################################
 
-    def request_and_wait(self, url, cookies=None):
+    def in_shard(self, key):
         """
-        Run the function get from the package requests, then wait a certain amount of time.
+        Check if a beer or a user is crawled by this worker
 
-        :param url: url for the requests
-        :param cookies: cookies
-        :return r: the request
+        :param key: Key of the beer (see beer_key) or ID of the user
+        :return: True if the key is in the shard of this worker
         """
 
-        # Get the time we want to wait before running the function again
-        delta = np.abs(np.random.normal(self.delta_t, self.delta_t/2))
+        return self.nbr_shards == 1 or shard_of(key, self.nbr_shards) == self.shard
 
-        start = time.time()
+    def crawl_frontier(self, step, save, fetcher=None, attempts=None, refresh_started_at=None, stop_after=None,
+                       reset=True, stream=None):
+        """
+        Crawl all the pending pages of a step in the frontier
+
+        The pages left in flight by an interrupted crawl and the failed ones are retried. The function save can
+        add new pages to the frontier, they are crawled as well.
+
+        The function save only gets the good pages. The pages that could not be fetched (see RetryPolicy) go in the
+        dead-letter queue of the frontier and are not crawled again until they are replayed (see
+        replay_dead_letters).
+
+        The validators (ETag, Last-Modified and a hash of the content) of each page are saved. During a refresh,
+        they are used to send conditional requests. A page that did not change is not saved again.
+
+        If the crawler streams the pages, the good pages are written in the store as they arrive and the function
+        save gets a request without content (r.streamed is True). During a refresh, the pages are not streamed since
+        a page that did not change must not be written again.
+
+        :param step: Step of the crawl
+        :param save: Function save(file, r) called for each page
+        :param fetcher: Fetcher for the pages (default: self.fetcher)
+        :param attempts: Maximum number of attempts to get a page (default: the one of the retry policy)
+        :param refresh_started_at: Start of the refresh (None if it's not a refresh)
+        :param stop_after: Byte pattern after which the downloads are stopped (see Fetcher.get)
+        :param reset: Retry the pages in flight and the failed ones (not when the frontier is used by another worker)
+        :param stream: Stream the pages to the store (default: self.stream). False to get the pages in memory.
+        """
 
-        # Run the function
-        r = requests.get(url, cookies=cookies)
+        if reset:
+            self.frontier.reset(step)
 
-        elapsed = time.time()-start
+        conditional = refresh_started_at is not None
 
-        # If not enough time has been spend, sleep
-        if elapsed < delta:
-            time.sleep(delta-elapsed)
+        if stream is None:
+            stream = self.stream
 
-        # Return the result
-        return r
+        sink = None
+        if stream and not conditional:
+            def sink(task):
+                return self.store.writer(task[1])
+
+        progress = None
+        if self.progress:
+            progress = Progress(step, self.frontier.count(step), self.frontier.count(step, 'done'),
+                                count=lambda: self.frontier.count(step))
+
+        # Pages left, counted when the metrics are collected (the function save can add pages)
+        self.metrics.gauge('ba_frontier_pending', lambda: self.frontier.count(step, 'pending'))
+
+        while self.frontier.count(step, 'pending') > 0:
+            for (url, file), r in self.fetch_pages(self.frontier.pending(step), fetcher, attempts, conditional,
+                                                   stop_after, sink):
+                if progress is not None:
+                    progress.update(0 if r is None else page_size(r))
+
+                if not is_ok(r):
+                    # Never saved, the page goes in the dead-letter queue
+                    reason = 'exhausted' if self.retry_policy.classify(r) == 'retry' else 'terminal'
+                    status = None if r is None else r.status_code
+                    self.frontier.dead(step, url, status, reason)
+                    self.metrics.inc('ba_dead_letters_total', step=step, reason=reason)
+                    continue
+
+                if r.status_code == 304:
+                    # Not modified
+                    self.frontier.done(step, url, r.status_code, None)
+                    continue
+
+                if getattr(r, 'streamed', False):
+                    hash_ = r.sha1
+                else:
+                    hash_ = hashlib.sha1(r.content).hexdigest()
+
+                validators = self.frontier.get_validators(url) if conditional else None
+                if validators is not None and validators[2] == hash_:
+                    # Same content, nothing to rewrite
+                    self.frontier.done(step, url, r.status_code, page_size(r))
+                    continue
+
+                with self.tracer.span('save', sample=True, file=file):
+                    save(file, r)
+
+                self.frontier.set_validators(url, r.headers.get('ETag'), r.headers.get('Last-Modified'), hash_)
+                if conditional:
+                    self.frontier.add_change(step, file, refresh_started_at)
+
+                self.frontier.done(step, url, r.status_code, page_size(r))
+
+        if progress is not None:
+            progress.finish()
+
+    def steal_work(self, step, save, **kwargs):
+        """
+        Crawl the pending pages of the other shards, such that all the workers stay busy until the end. The pages
+        are claimed atomically in the frontier of the other shard, so its worker never crawls them twice.
+
+        :param step: Step of the crawl (9 or 13)
+        :param save: Function save(file, r) called for each page
+        :param kwargs: Other arguments of crawl_frontier
+        """
+
+        own = self.frontier
+
+        for i in range(1, self.nbr_shards):
+            shard = (self.shard + i) % self.nbr_shards
+
+            filename = frontier_file(self.data_folder, shard, self.nbr_shards)
+            if not os.path.exists(filename):
+                continue
+
+            # The pages found by the save function (e.g. the reviews of a beer) go in the frontier of the shard
+            self.frontier = Frontier(filename)
+            try:
+                if self.frontier.count(step, 'pending') > 0:
+                    print('Stealing work from shard {:d}'.format(shard))
+                    self.crawl_frontier(step, save, reset=False, **kwargs)
+            finally:
+                self.frontier.close()
+                self.frontier = own
+
+    def refresh(self, step):
+        """
+        Refresh the pages of a step (4, 5, 9, 13) that were already crawled, with conditional requests.
+
+        Only the pages that changed are saved again. For the step 9, the new pages with reviews are crawled as well.
+        The parser knows which pages changed through the frontier.
+
+        :param step: Step of the crawl
+        :return: Set of files that changed
+        """
+
+        saves = {4: self.save_page, 5: self.save_page, 9: self.save_beer_page, 13: self.save_page}
+
+        started_at = self.frontier.start_refresh(step)
+
+        stop_after = self.user_stop_after if step == 13 else None
+
+        self.crawl_frontier(step, saves[step], refresh_started_at=started_at, stop_after=stop_after)
 
+        return self.frontier.changed(step)
 
+    def replay_dead_letters(self, step, status=None):
+        """
+        Crawl again the pages of a step (4, 5, 9, 13) in the dead-letter queue, e.g. after an outage of the website.
+        The pages that fail again go back in the queue.
+
+        :param step: Step of the crawl
+        :param status: Only the pages that died with this status code (default: all of them)
+        :return: Number of pages replayed
+        """
+
+        saves = {4: self.save_page, 5: self.save_page, 9: self.save_beer_page, 13: self.save_page}
+
+        nbr = self.frontier.replay(step, status)
+
+        stop_after = self.user_stop_after if step == 13 else None
+
+        self.crawl_frontier(step, saves[step], stop_after=stop_after)
+
+        return nbr
+
+    def conditional_headers(self, url):
+        """
+        Headers for a conditional request, from the validators of the last fetch of the page
+
+        :param url: url of the page
+        :return: Dict of headers (can be empty)
+        """
+
+        headers = {}
+
+        validators = self.frontier.get_validators(url)
+        if validators is not None:
+            etag, last_modified, _ = validators
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        return headers
+
+    def save_page(self, file, r):
+        """
+        Save a page in the page store
+
+        :param file: File relative to the data folder (key in the store)
+        :param r: the request
+        """
+
+        # Already written chunk by chunk
+        if getattr(r, 'streamed', False):
+            return
+
+        self.store.put(file, r.content)
+
+    def fetch_pages(self, tasks, fetcher=None, attempts=None, conditional=False, stop_after=None, sink=None):
+        """
+        Fetch a batch of pages, either one after the other (sequential mode) or with the engine (concurrent mode).
+
+        A task is either a url or a tuple whose first element is the url. The results are yielded as soon as they
+        are finished. In the concurrent mode, they do not come back in the order of the tasks. The bad responses
+        are fetched again following the retry policy, and nothing is sent while the circuit breaker is open. The
+        result of a page that could not be fetched is its last response (None for an exception).
+
+        :param tasks: Iterable of tasks
+        :param fetcher: Fetcher for the pages (default: self.fetcher)
+        :param attempts: Maximum number of attempts to get a page (default: the one of the retry policy)
+        :param conditional: Send conditional requests with the validators of the frontier
+        :param stop_after: Byte pattern after which the downloads are stopped (see Fetcher.get)
+        :param sink: Function sink(task) returning a writer to stream the page of a task (see Fetcher.get)
+        :return: Generator of (task, r)
+        """
+
+        if fetcher is None:
+            fetcher = self.fetcher
+
+        def headers(url):
+            if conditional:
+                return self.conditional_headers(url)
+            return None
+
+        # The fetcher only gets the url, the task is needed to open the writer
+        in_flight = {}
+
+        def record(tasks_):
+            for task_ in tasks_:
+                in_flight[task_url(task_)] = task_
+                yield task_
+
+        def writer(url):
+            if sink is None:
+                return None
+            return lambda: sink(in_flight[url])
+
+        if sink is not None:
+            tasks = record(tasks)
+
+        # Page already fetched (or being fetched) for the same url, without a slot of the rate controller
+        def cached(url):
+            if stop_after is not None or sink is not None:
+                return None
+            return fetcher.cached(url, headers=headers(url))
 
+        if attempts is None:
+            attempts = self.retry_policy.attempts
 
+        if self.engine is None:
+            # Sequential mode: we wait between each request
+            for task in tasks:
+                r = cached(task_url(task))
 
+                count = 0
+                while not is_ok(r):
+                    if count > 0:
+                        self.metrics.inc('ba_retries_total')
+
+                    self.breaker.wait()
+
+                    try:
+                        r = self.request_and_wait(task_url(task), headers(task_url(task)), stop_after,
+                                                  writer(task_url(task)), fetcher)
+                    except requests.RequestException as e:
+                        print('---------------------------------------------------------------------')
+                        print('')
+                        print('ERROR WITH URL {}: {}'.format(task_url(task), e))
+                        print('---------------------------------------------------------------------')
+                        print('')
+                        r = None
+                    except BaseException:
+                        # A failure for the breaker, such that the probe of a half-open circuit always ends
+                        self.breaker.record(True)
+                        raise
 
+                    count += 1
+
+                    verdict = self.retry_policy.classify(r)
+                    self.breaker.record(verdict == 'retry')
+
+                    if verdict != 'retry' or count >= attempts:
+                        break
+
+                    time.sleep(self.retry_policy.delay(count, r))
+
+                in_flight.pop(task_url(task), None)
+                yield task, r
+        else:
+            # Concurrent mode: the engine takes care of the rate
+            def get(url):
+                with self.tracer.span('fetch', sample=True, url=url) as span:
+                    r = fetcher.get(url, headers=headers(url), stop_after=stop_after, sink=writer(url))
+                    span.set(status=r.status_code, bytes=page_size(r))
+                return r
+
+            for task, r in self.engine.fetch(tasks, get, attempts, cached):
+                in_flight.pop(task_url(task), None)
+                yield task, r
+
+    def print_problem(self, url):
+        """
+        Print that a page could not be fetched (it is not saved)
+
+        :param url: url of the page
+        """
 
+        print('---------------------------------------------------------------------')
+        print('')
+        print('Problem downloading {}'.format(url))
+        print('---------------------------------------------------------------------')
+        print('')
 
+    def request_and_wait(self, url, headers=None, stop_after=None, sink=None, fetcher=None):
+        """
+        Wait for the rate controller, then get the page with the fetcher.
+
+        :param url: url for the requests
+        :param headers: headers
+        :param stop_after: Byte pattern after which the download is stopped (see Fetcher.get)
+        :param sink: Function returning a writer to stream the page (see Fetcher.get)
+        :param fetcher: Fetcher for the page (default: self.fetcher)
+        :return r: the request
+        """
+
+        if fetcher is None:
+            fetcher = self.fetcher
+
+        # Wait for the next slot given by the rate controller
+        self.rate.wait()
+
+        start = time.time()
+
+        # Run the function
+        try:
+            with self.tracer.span('fetch', sample=True, url=url) as span:
+                r = fetcher.get(url, headers=headers, stop_after=stop_after, sink=sink)
+                span.set(status=r.status_code, bytes=page_size(r))
+        except requests.RequestException:
+            self.rate.record(error=True)
+            raise
+
+        # Give the result to the rate controller
+        self.rate.record(r.status_code, time.time() - start)
+
+        # Return the result
+        return r
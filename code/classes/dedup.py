@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.helpers import read_columns
+import hashlib
+import sqlite3
+import os
+
+
+class RatingIndex:
+    """
+    Index of the ratings (user_id, beer_id) already written, such that a user has only one rating per beer
+
+    The keys are the 64 first bits of the BLAKE2 hash of 'user_id/beer_id' (the same in all the processes and all the
+    runs, unlike hash()). By default, they are kept in a set in memory (about 70 bytes per rating). With a file, they
+    are kept in a SQLite table on disk with a Bloom filter in memory (bits_per_key bits per rating): most of the keys
+    are new and the filter says it without reading the disk, only the possible duplicates are looked up in the table.
+    The memory is bounded by the size of the filter and the answers stay exact.
+
+    Each key found twice is counted as a duplicate, by source ('pages' for a rating found twice in the pages of the
+    step 11, 'delta' for a rating of the incremental step that is already in ratings.txt.gz).
+    """
+
+    def __init__(self, file=None, expected=10 ** 7, bits_per_key=10, batch_size=10000):
+        """
+        Initialize the class
+
+        :param file: SQLite file of the keys (None to keep them in memory)
+        :param expected: Expected number of ratings, for the size of the Bloom filter (more ratings only make the
+                         filter less useful)
+        :param bits_per_key: Bits of the Bloom filter per rating (10 bits: about 1% of the new keys are looked up)
+        :param batch_size: Number of keys written on disk at once
+        """
+
+        self.file = file
+        self.batch_size = batch_size
+
+        self.added = 0
+        self.duplicates = {}
+
+        if file is None:
+            self.keys = set()
+            return
+
+        folder = os.path.dirname(file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.db = sqlite3.connect(file)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS ratings (key INTEGER PRIMARY KEY)')
+
+        # Keys not yet written on disk
+        self.pending = set()
+
+        # Bloom filter with 7 hashes (optimal for 10 bits per key), filled with the keys of the file
+        self.nbr_bits = max(expected * bits_per_key, 8 * 1024)
+        self.nbr_hashes = max(1, int(round(0.693 * bits_per_key)))
+        self.bits = bytearray(self.nbr_bits // 8 + 1)
+        for key, in self.db.execute('SELECT key FROM ratings'):
+            self.set_bits(self.positions(key))
+
+    def __len__(self):
+        if self.file is None:
+            return len(self.keys)
+        return self.db.execute('SELECT COUNT(*) FROM ratings').fetchone()[0] + len(self.pending)
+
+    def __contains__(self, rating):
+        """
+        Check if a rating is in the index (`(user_id, beer_id) in index`, like a set)
+
+        :param rating: (user_id, beer_id)
+        :return: bool
+        """
+
+        return self.contains(rating_key(*rating))
+
+    def contains(self, key, positions=None):
+        if self.file is None:
+            return key in self.keys
+
+        # Not in the filter: never added
+        if not self.test_bits(self.positions(key) if positions is None else positions):
+            return False
+
+        return key in self.pending or \
+            self.db.execute('SELECT 1 FROM ratings WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, user_id, beer_id, source='pages'):
+        """
+        Add a rating to the index
+
+        :param user_id: ID of the user
+        :param beer_id: ID of the beer
+        :param source: Where a duplicate comes from (key of the counts of duplicates)
+        :return: True if the rating is new, False if it's a duplicate
+        """
+
+        key = rating_key(user_id, beer_id)
+        positions = None if self.file is None else self.positions(key)
+
+        if self.contains(key, positions):
+            self.duplicates[source] = self.duplicates.get(source, 0) + 1
+            return False
+
+        self.added += 1
+        self.insert(key, positions)
+
+        return True
+
+    def update(self, ratings):
+        """
+        Add some ratings without counting the duplicates
+
+        :param ratings: Iterable of (user_id, beer_id)
+        :return: Number of new ratings
+        """
+
+        nbr = 0
+        for user_id, beer_id in ratings:
+            key = rating_key(user_id, beer_id)
+            positions = None if self.file is None else self.positions(key)
+            if not self.contains(key, positions):
+                nbr += 1
+                self.insert(key, positions)
+
+        return nbr
+
+    def insert(self, key, positions=None):
+        if self.file is None:
+            self.keys.add(key)
+        else:
+            self.set_bits(self.positions(key) if positions is None else positions)
+            self.pending.add(key)
+            if len(self.pending) >= self.batch_size:
+                self.commit()
+
+    def load(self, filename):
+        """
+        Add all the ratings of a txt.gz file (e.g. ratings.txt.gz)
+
+        :param filename: name of the file
+        :return: Number of new ratings
+        """
+
+        if not os.path.exists(filename):
+            return 0
+
+        values = read_columns(filename, ['user_id', 'beer_id'])
+        return self.update(zip(values['user_id'], values['beer_id'].tolist()))
+
+    def clear(self):
+        """
+        Remove all the ratings and the counts (e.g. before the step 11 writes ratings.txt.gz again)
+        """
+
+        self.added = 0
+        self.duplicates = {}
+
+        if self.file is None:
+            self.keys = set()
+        else:
+            self.pending = set()
+            self.bits = bytearray(len(self.bits))
+            self.db.execute('DELETE FROM ratings')
+            self.db.commit()
+
+    def commit(self):
+        """
+        Write the new keys on disk
+        """
+
+        if self.file is None or len(self.pending) == 0:
+            return
+
+        self.db.executemany('INSERT OR IGNORE INTO ratings VALUES (?)', ((key,) for key in self.pending))
+        self.db.commit()
+        self.pending = set()
+
+    def close(self):
+        if self.file is not None:
+            self.commit()
+            self.db.close()
+
+    def total_duplicates(self):
+        return sum(self.duplicates.values())
+
+    def set_bits(self, positions):
+        bits = self.bits
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def test_bits(self, positions):
+        bits = self.bits
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def positions(self, key):
+        """
+        Bits of a key in the Bloom filter (double hashing with the two halves of the key)
+
+        :param key: Key of a rating
+        :return: List of positions
+        """
+
+        h1 = key & 0xffffffff
+        h2 = (key >> 32) & 0xffffffff | 1
+        nbr_bits = self.nbr_bits
+        return [(h1 + i * h2) % nbr_bits for i in range(self.nbr_hashes)]
+
+
+def rating_key(user_id, beer_id):
+    """
+    Key of a rating in the RatingIndex
+
+    :param user_id: ID of the user
+    :param beer_id: ID of the beer
+    :return: Signed 64 bits integer
+    """
+
+    digest = hashlib.blake2b('{}/{}'.format(user_id, int(beer_id)).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
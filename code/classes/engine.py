@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from concurrent.futures import ThreadPoolExecutor
+from classes.rate import RateLimiter
+from classes.retry import RetryPolicy, CircuitBreaker, is_ok
+import itertools
+import threading
+import asyncio
+import heapq
+import queue
+import time
+
+
+class FetchEngine:
+    """
+    Asynchronous engine to fetch several pages concurrently
+
+    The requests themselves are blocking (requests package). They are run in a pool of threads driven by an
+    asyncio event loop. The loop lives in a background thread such that the crawl functions can simply iterate
+    over the results as they arrive.
+
+    The bad responses are sent again following the RetryPolicy. A page waiting for its next attempt does not hold a
+    worker: the workers go on with the other pages in the meantime. No request is sent while the CircuitBreaker is
+    open.
+    """
+
+    def __init__(self, concurrency=8, limiter=None, metrics=None, policy=None, breaker=None):
+        """
+        Initialize the class
+
+        :param concurrency: Number of requests in flight at the same time
+        :param limiter: RateLimiter (or RateController) shared by all the workers (default: no cap)
+        :param metrics: Metrics where the requests in flight and the retries are counted
+        :param policy: RetryPolicy (default: 5 attempts with exponential backoff)
+        :param breaker: CircuitBreaker shared by all the workers (default: a breaker with the default settings)
+        """
+
+        self.concurrency = concurrency
+        self.metrics = metrics
+
+        if limiter is None:
+            self.limiter = RateLimiter()
+        else:
+            self.limiter = limiter
+
+        if policy is None:
+            self.policy = RetryPolicy()
+        else:
+            self.policy = policy
+
+        if breaker is None:
+            self.breaker = CircuitBreaker(metrics=metrics)
+        else:
+            self.breaker = breaker
+
+    def fetch(self, tasks, get, attempts=None, cached=None):
+        """
+        Fetch all the tasks and yield the results as soon as they are finished (not in the order of the tasks)
+
+        A task is either a url or a tuple whose first element is the url. The rest of the tuple is given back
+        untouched with the result, e.g. to know where to save the page.
+
+        :param tasks: Iterable of tasks (can be a generator, it is consumed lazily)
+        :param get: Function doing one blocking request, get(url) -> response
+        :param attempts: Maximum number of attempts to get a page (default: the one of the policy)
+        :param cached: Function giving a response without a request, cached(url) -> response or None. The pages
+                       found with it do not take a slot of the rate limiter.
+        :return: Generator of (task, response). The response is None if the last request raised an exception. It
+                 is the last response if all the attempts failed (see RetryPolicy.classify).
+        """
+
+        if attempts is None:
+            attempts = self.policy.attempts
+
+        results = queue.Queue(maxsize=2 * self.concurrency)
+        stop = threading.Event()
+
+        def run():
+            asyncio.run(self._run(tasks, get, attempts, cached, results, stop))
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exception
+                yield item
+        finally:
+            # Make sure the workers stop if the caller does not consume everything
+            stop.set()
+            thread.join()
+
+    async def _run(self, tasks, get, attempts, cached, results, stop):
+        """
+        Run the workers in the event loop
+
+        :param tasks: Iterable of tasks
+        :param get: Function doing one blocking request
+        :param attempts: Number of attempts per task
+        :param cached: Function giving a response without a request (or None)
+        :param results: Queue for the results
+        :param stop: Event set when the consumer is gone
+        """
+
+        loop = asyncio.get_running_loop()
+        iterator = iter(tasks)
+
+        # Tasks waiting for their next attempt: heap of (time, order, task, number of attempts done)
+        delayed = []
+        order = itertools.count()
+        # Tasks being fetched (they can come back in delayed) and end of the iterator
+        state = {'busy': 0, 'exhausted': False}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+            async def attempt(task, count):
+                """
+                Fetch a task once. If it has to be fetched again, it goes in delayed, otherwise its result is given to
+                the consumer.
+                """
+
+                url = task_url(task)
+
+                # It may wait for the same request in flight, hence the thread
+                if count == 0 and cached is not None:
+                    r = await loop.run_in_executor(executor, cached, url)
+                    if is_ok(r):
+                        await loop.run_in_executor(executor, _put, results, stop, (task, r))
+                        return
+
+                # Nothing is sent while the circuit is open
+                wait = self.breaker.wait_time()
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = self.breaker.wait_time()
+
+                await asyncio.sleep(self.limiter.reserve())
+
+                if self.metrics is not None:
+                    if count > 0:
+                        self.metrics.inc('ba_retries_total')
+                    self.metrics.inc('ba_requests_in_flight')
+
+                start = time.monotonic()
+                try:
+                    r = await loop.run_in_executor(executor, get, url)
+                    self.limiter.record(r.status_code, time.monotonic() - start)
+                except Exception as e:
+                    self.limiter.record(error=True)
+                    print('---------------------------------------------------------------------')
+                    print('')
+                    print('ERROR WITH URL {}: {}'.format(url, e))
+                    print('---------------------------------------------------------------------')
+                    print('')
+                    r = None
+                finally:
+                    if self.metrics is not None:
+                        self.metrics.inc('ba_requests_in_flight', -1)
+
+                count += 1
+
+                verdict = self.policy.classify(r)
+                self.breaker.record(verdict == 'retry')
+
+                if verdict == 'retry' and count < attempts:
+                    heapq.heappush(delayed, (time.monotonic() + self.policy.delay(count, r), next(order), task,
+                                             count))
+                    return
+
+                # Blocking put in a thread to slow down the workers if the consumer is too slow
+                await loop.run_in_executor(executor, _put, results, stop, (task, r))
+
+            async def worker():
+                while not stop.is_set():
+                    now = time.monotonic()
+                    if len(delayed) > 0 and delayed[0][0] <= now:
+                        _, _, task, count = heapq.heappop(delayed)
+                    elif not state['exhausted']:
+                        # All the workers share the same iterator. It is safe since next() is never interrupted.
+                        try:
+                            task = next(iterator)
+                        except StopIteration:
+                            state['exhausted'] = True
+                            continue
+                        count = 0
+                    elif len(delayed) > 0 or state['busy'] > 0:
+                        # Wait for the next retry (the tasks being fetched may need one too)
+                        await asyncio.sleep(min(delayed[0][0] - now, 0.05) if len(delayed) > 0 else 0.05)
+                        continue
+                    else:
+                        break
+
+                    state['busy'] += 1
+                    try:
+                        await attempt(task, count)
+                    finally:
+                        state['busy'] -= 1
+
+            try:
+                await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+            except Exception as e:
+                _put(results, stop, _Failure(e))
+
+        _put(results, stop, _DONE)
+
+
+class _Failure:
+    """
+    Exception raised in the event loop, given back to the consumer
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+# Sentinel put in the queue when all the tasks are done
+_DONE = object()
+
+
+def _put(results, stop, item):
+    """
+    Put an item in the queue unless the consumer is gone
+
+    :param results: Queue for the results
+    :param stop: Event set when the consumer is gone
+    :param item: Item to put in the queue
+    """
+
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def task_url(task):
+    """
+    Get the url of a task
+
+    :param task: url or tuple with the url as first element
+    :return: url
+    """
+
+    if isinstance(task, tuple):
+        return task[0]
+    return task
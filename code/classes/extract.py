@@ -0,0 +1,460 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from html import escape
+import re
+
+try:
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+
+class Field:
+    """
+    Declarative spec of a field of a page
+
+    The same field is described for the two backends of the Extractor: an XPath for the DOM backend and a regular
+    expression for the regex backend. The values are strings as they are written in the HTML (the DOM backend escapes
+    &, < and > again), or None if the field is not in the page.
+    """
+
+    def __init__(self, xpath=None, value='text', pattern=None, regex=None, group=1, required=False, flatten=False):
+        """
+        Initialize the class
+
+        :param xpath: XPath of the node (DOM backend), relative to the node of the record for the fields of Records.
+                      The first node found is used.
+        :param value: What is taken from the node: 'text' (text without the tags), 'html' (inner HTML), 'tail' (text
+                      after the node), '@name' (attribute name) or a function node -> string
+        :param pattern: Regular expression applied to the value of the node (DOM backend). The value is its group 1.
+        :param regex: Regular expression of the field (regex backend). For the fields of Records, it is applied to the
+                      group of the record and the value is its group 1.
+        :param group: Group of the regular expression of the field, or of the record for the fields of Records
+        :param required: A record without this field is skipped (DOM backend, the regex of the record does not match
+                         it either)
+        :param flatten: Remove the characters \\r, \\n and \\t from the page (regex backend) or from the value (DOM
+                        backend)
+        """
+
+        self.xpath = xpath
+        self.value = value
+        self.pattern = pattern
+        self.regex = regex
+        self.group = group
+        self.required = required
+        self.flatten = flatten
+
+
+class Records:
+    """
+    Declarative spec of a list of records in a page (e.g. the beers of a brewery or the ratings of a beer)
+
+    Each node matched by the XPath (DOM backend) or each match of the regular expression (regex backend) is a record.
+    Its fields are given by a dict of Field.
+    """
+
+    def __init__(self, xpath, regex, fields, flatten=False):
+        """
+        Initialize the class
+
+        :param xpath: XPath of the node of each record
+        :param regex: Regular expression of a record
+        :param fields: Dict name -> Field
+        :param flatten: Remove the characters \\r, \\n and \\t (see Field)
+        """
+
+        self.xpath = xpath
+        self.regex = regex
+        self.fields = fields
+        self.flatten = flatten
+
+
+def _review_text(node):
+    """
+    Text of a rating (without the tags): from the first <br><br> of the content of the rating to the next <br>, if
+    the number of characters follows
+
+    :param node: div rating_fullview_content_2
+    :return: string or None
+    """
+
+    children = list(node)
+
+    start = None
+    for i in range(1, len(children)):
+        if children[i].tag == 'br' and children[i - 1].tag == 'br' and _flatten(children[i - 1].tail or '') == '':
+            start = i
+            break
+
+    # Without the number of characters, there's no text
+    if start is None or not any(child.tag == 'span' and child.get('class') == 'muted' and
+                                (child.text or '').endswith(' characters') for child in children[start + 1:]):
+        return None
+
+    parts = [children[start].tail or '']
+    for child in children[start + 1:]:
+        if _text_until_br(child, parts):
+            break
+        parts.append(child.tail or '')
+
+    return escape(''.join(parts), quote=False)
+
+
+def _text_until_br(node, parts):
+    """
+    Add the text of a node (without its tail) to parts until the first <br>
+
+    :param node: Node
+    :param parts: List of strings
+    :return: True if a <br> was found
+    """
+
+    if node.tag == 'br':
+        return True
+
+    # Not the comments
+    if isinstance(node.tag, str):
+        parts.append(node.text or '')
+        for child in node:
+            if _text_until_br(child, parts):
+                return True
+            parts.append(child.tail or '')
+
+    return False
+
+
+def _flatten(txt):
+    return txt.replace('\r', '').replace('\n', '').replace('\t', '')
+
+
+########################################################################################
+##                                                                                    ##
+##                           Specs of the pages of BeerAdvocate                       ##
+##                                                                                    ##
+########################################################################################
+
+# Links of a rating (from the div with its content), inside its content or right after it
+_RATING_LINK = ".//a[{0}] | following-sibling::span[1]/a[{0}]"
+
+# The regular expressions are the ones the Parser always used, such that both backends give the same records
+SPECS = {
+    # List of the breweries of a place (step 3)
+    'place_list': {
+        'breweries': Records(
+            "//a[starts-with(@href, '/beer/profile/')][b]",
+            '<a href="/beer/profile/(\d+)/"><b>(.+?)</b>',
+            {'id': Field('.', '@href', pattern='^/beer/profile/(\d+)/$', group=1, required=True),
+             'name': Field('b', 'html', group=2, required=True)})
+    },
+
+    # Page of a brewery (steps 6, 7 and 8)
+    'brewery': {
+        'name': Field('//h1', 'html', regex='<h1>(.+?)</h1>'),
+        'nbr_current': Field("//*[contains(text(), 'Current (')]", pattern='Current \((\d+)\)',
+                             regex='Current \((\d+)\)'),
+        'nbr_archived': Field("//*[contains(text(), 'Arch (')]", pattern='Arch \((\d+)\)', regex='Arch \((\d+)\)'),
+        'beers': Records(
+            "//tr[td[2]/a[starts-with(@href, '/beer/style/')]]",
+            '<a href="/beer/profile/(\d+)/(\d+)/"><b>(.+?)</b></a></td><td valign=top class="hr_bottom_light">'
+            '<a href="/beer/style/(\d+)/">(.+?)</a></td><td align="left" valign="top" class="hr_bottom_light">'
+            '<span style="color: #999999; font-weight: bold;">(.+?)</span></td><td align="left" valign="top" '
+            'class="hr_bottom_light"><b>(.+?)</b></td><td align="left" valign="top" class="hr_bottom_'
+            'light">(.+?)</td>',
+            {'brewery_id': Field('td[1]/a[b]', '@href', pattern='^/beer/profile/(\d+)/\d+/$', group=1, required=True),
+             'beer_id': Field('td[1]/a[b]', '@href', pattern='^/beer/profile/\d+/(\d+)/$', group=2, required=True),
+             'beer_name': Field('td[1]/a/b', 'html', group=3, required=True),
+             'style': Field('td[2]/a', 'html', group=5, required=True),
+             'abv': Field('td[3]/span', 'html', group=6, required=True),
+             'avg': Field('td[4]/b', 'html', group=7, required=True),
+             'nbr_ratings': Field('td[5]', 'html', group=8, required=True)})
+    },
+
+    # Page of a beer (steps 10 and 11)
+    'beer': {
+        'is_beer': Field("//b[. = 'BA SCORE']", regex='BA SCORE', group=0),
+        'nbr_ratings': Field("//dt[. = 'Ratings:']/following-sibling::dd[1]/span[@class = 'ba-ratings']", 'html',
+                             regex='<dt>Ratings:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-ratings">(.+?)</span></dd>'),
+        'nbr_reviews': Field("//dt[. = 'Reviews:']/following-sibling::dd[1]/span[@class = 'ba-reviews']", 'html',
+                             regex='<dt>Reviews:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-reviews">(.+?)</span></dd>'),
+        'avg': Field("//dt[substring(., string-length(.) - 3) = 'Avg:']/following-sibling::dd[1]"
+                     "/span[@class = 'ba-ravg']", 'html',
+                     regex='Avg:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-ravg">(.+?)</span></dd>'),
+        'ba_score': Field("//b[. = 'BA SCORE']/following-sibling::span[contains(@class, 'ba-score')][1]", 'html',
+                          regex='<b>BA SCORE</b>\\n\\t\\t\\t<br>\\n\\t\\t\\t<span class="BAscore_big ba-score">'
+                                '(.+?)</span>'),
+        'bros_score': Field("//b[. = 'THE BROS']/following-sibling::span[contains(@class, 'ba-bro_score')][1]",
+                            'html', regex='<b>THE BROS</b>\\n\\t\\t\\t<br>\\n\\t\\t\\t<span class="BAscore_big '
+                                          'ba-bro_score">(.+?)</span>'),
+        'abv': Field("//b[. = 'Alcohol by volume (ABV):']", 'tail', pattern='^\s*(.+?)\s*$',
+                     regex='<b>Alcohol by volume \(ABV\):</b> (.+?)\\n\\t\\t<br>'),
+        'ratings': Records(
+            "//div[@id = 'rating_fullview_content_2']",
+            'alt="Photo of ([^<]*)"></a></div></div><div id="rating_fullview_content_2">'
+            '<span class="BAscore_norm">([^<]*)</span><span class="rAvg_norm">/5</span>&nbsp;&nbsp;'
+            '(.+?)<br><br>(.+?)<span class="muted"><a href="/community/members/(.+?)/" '
+            'class="username">([^<]*)</a>, <a href="/beer/profile/(\d+)/(\d+)/\?ba=([^#]*)\#review">'
+            '(.+?)</a></span>',
+            {'user_id': Field(_RATING_LINK.format("@class = 'username'"), '@href', pattern='^/community/members/(.+)/$',
+                              group=5, required=True),
+             'user_name': Field(_RATING_LINK.format("@class = 'username'"), 'html', pattern='^([^<]*)$', group=6,
+                                required=True),
+             'rating': Field("span[@class = 'BAscore_norm']", 'html', pattern='^([^<]*)$', group=2, required=True),
+             'date': Field(_RATING_LINK.format("contains(@href, '#review')"), 'html', group=10, required=True),
+             # 'look: 4 | smell: 4 | taste: 4.5 | feel: 4 |  overall: 4'
+             'aspects': Field("span[@class = 'muted'][contains(., 'overall')]", group=3,
+                              regex='<span class="muted">(look: .+? \| smell: .+? \| taste: .+? \| feel: .+? \|  '
+                                    'overall: .+?)</span>'),
+             'text': Field('.', _review_text, group=4,
+                           regex='(.+?)<br>.+?<span class="muted">.+? characters</span><br><br><div>'),
+             'characters': Field("span[@class = 'muted'][contains(., ' characters')]", pattern='^(.+?) characters$',
+                                 group=4, regex='.+?<br>.+?<span class="muted">(.+?) characters</span><br><br><div>')},
+            flatten=True)
+    },
+
+    # Page of a user (steps 14 and 16)
+    'member': {
+        'joined': Field("//dt[. = 'Joined:']/following-sibling::dd[1]", 'html',
+                        regex='<dt>Joined:</dt><dd>(.+?)</dd></dl>', flatten=True),
+        'location': Field("//a[@itemprop = 'address']", 'html', pattern='^([^<]*)$',
+                          regex='target="_blank" rel="nofollow" itemprop="address" class="concealed">([^<]*)</a>'
+                                '</dd></dl>')
+    }
+}
+
+
+class Extractor:
+    """
+    Extraction of the fields of the pages of BeerAdvocate with the declarative specs of SPECS
+
+    The 'dom' backend parses the page once with the HTML parser of lxml and evaluates the XPaths of the fields. It does
+    not depend on the whitespace or on the order of the attributes. The 'regex' backend uses the regular expressions
+    the Parser always used. Both give the same records on the pages of BeerAdvocate (see benchmark_extract.py). The
+    regex backend is the default: the pages are small and building the tree costs more than the regexes.
+    """
+
+    backends = ['dom', 'regex']
+
+    def __init__(self, backend='regex'):
+        """
+        Initialize the class
+
+        :param backend: 'dom' or 'regex'
+        """
+
+        if backend not in self.backends:
+            raise ValueError('Unknown extraction backend {} (one of {})'.format(backend, ', '.join(self.backends)))
+
+        if backend == 'dom' and lxml is None:
+            raise ImportError('The package lxml is needed to use the DOM backend of the extraction')
+
+        self.backend = backend
+
+        # Compiled XPaths and regular expressions
+        self.compiled = {}
+
+        if backend == 'dom':
+            self.html_parser = lxml.etree.HTMLParser()
+
+        # Last page parsed by the DOM backend (the steps 10 and 11 extract two specs from the same page)
+        self.last_html = None
+        self.last_root = None
+
+    def extract(self, page, html_txt, fields=None):
+        """
+        Extract the fields of a page
+
+        :param page: Type of page (key of SPECS: 'place_list', 'brewery', 'beer' or 'member')
+        :param html_txt: HTML of the page
+        :param fields: List of the fields to extract (default: all the fields of the spec)
+        :return: Dict name -> string (or None) for a Field, list of dicts for Records
+        """
+
+        spec = SPECS[page]
+        if fields is None:
+            fields = list(spec)
+
+        if self.backend == 'dom':
+            return self.extract_dom(spec, fields, html_txt)
+        return self.extract_regex(spec, fields, html_txt)
+
+    def xpath(self, path):
+        xpath = self.compiled.get(path)
+        if xpath is None:
+            xpath = self.compiled[path] = lxml.etree.XPath(path)
+        return xpath
+
+    def regex(self, pattern):
+        regex = self.compiled.get(pattern)
+        if regex is None:
+            regex = self.compiled[pattern] = re.compile(pattern)
+        return regex
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                    DOM backend                                     ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def extract_dom(self, spec, fields, html_txt):
+        """
+        Extract the fields of a page with the DOM backend
+
+        :param spec: Dict name -> Field or Records
+        :param fields: List of the fields to extract
+        :param html_txt: HTML of the page
+        :return: Dict (see extract)
+        """
+
+        root = self.parse(html_txt)
+
+        values = {}
+        for name in fields:
+            field = spec[name]
+            if isinstance(field, Records):
+                values[name] = []
+                for node in self.xpath(field.xpath)(root):
+                    record = self.dom_record(field, node)
+                    if record is not None:
+                        values[name].append(record)
+            else:
+                values[name] = self.dom_value(field, root, field.flatten)
+
+        return values
+
+    def parse(self, html_txt):
+        """
+        Parse a page with lxml (the tree of the last page is kept)
+
+        :param html_txt: HTML of the page
+        :return: Root of the tree
+        """
+
+        if html_txt is not self.last_html:
+            try:
+                root = lxml.etree.fromstring(html_txt, self.html_parser)
+            except ValueError:
+                # Unicode string with an encoding declaration
+                root = lxml.etree.fromstring(html_txt.encode('utf-8'), self.html_parser)
+            self.last_html = html_txt
+            self.last_root = root
+
+        return self.last_root
+
+    def dom_record(self, records, node):
+        """
+        Fields of a record
+
+        :param records: Records
+        :param node: Node of the record
+        :return: Dict or None if a required field is missing
+        """
+
+        record = {}
+        for name, field in records.fields.items():
+            value = self.dom_value(field, node, records.flatten)
+            if value is None and field.required:
+                return None
+            record[name] = value
+
+        return record
+
+    def dom_value(self, field, node, flatten):
+        """
+        Value of a field
+
+        :param field: Field
+        :param node: Node where the XPath of the field is evaluated
+        :param flatten: Remove the characters \\r, \\n and \\t
+        :return: string or None
+        """
+
+        nodes = self.xpath(field.xpath)(node)
+        if len(nodes) == 0:
+            return None
+        node = nodes[0]
+
+        if callable(field.value):
+            value = field.value(node)
+        elif field.value == 'text':
+            value = escape(''.join(node.itertext()), quote=False)
+        elif field.value == 'html':
+            value = escape(node.text or '', quote=False) + \
+                    ''.join(lxml.etree.tostring(child, encoding='unicode', method='html') for child in node)
+        elif field.value == 'tail':
+            value = escape(node.tail or '', quote=False)
+        else:
+            value = node.get(field.value[1:])
+            if value is not None:
+                value = escape(value, quote=False)
+
+        if value is None:
+            return None
+
+        if flatten:
+            value = _flatten(value)
+
+        if field.pattern is not None:
+            m = self.regex(field.pattern).search(value)
+            value = None if m is None else m.group(1)
+
+        return value
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                   Regex backend                                    ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def extract_regex(self, spec, fields, html_txt):
+        """
+        Extract the fields of a page with the regex backend
+
+        :param spec: Dict name -> Field or Records
+        :param fields: List of the fields to extract
+        :param html_txt: HTML of the page
+        :return: Dict (see extract)
+        """
+
+        flat = None
+
+        values = {}
+        for name in fields:
+            field = spec[name]
+
+            txt = html_txt
+            if field.flatten:
+                if flat is None:
+                    flat = _flatten(html_txt)
+                txt = flat
+
+            if isinstance(field, Records):
+                values[name] = [self.regex_record(field, m) for m in self.regex(field.regex).finditer(txt)]
+            else:
+                m = self.regex(field.regex).search(txt)
+                values[name] = None if m is None else m.group(field.group)
+
+        return values
+
+    def regex_record(self, records, m):
+        """
+        Fields of a record
+
+        :param records: Records
+        :param m: Match of the regular expression of the record
+        :return: Dict
+        """
+
+        record = {}
+        for name, field in records.fields.items():
+            value = m.group(field.group)
+            if field.regex is not None:
+                m2 = self.regex(field.regex).search(value)
+                value = None if m2 is None else m2.group(1)
+            record[name] = value
+
+        return record
@@ -0,0 +1,265 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from requests.adapters import HTTPAdapter
+import requests
+import hashlib
+import time
+
+
+class Fetcher:
+    """
+    HTTP layer of the crawler
+
+    It holds one pooled session, such that the TCP+TLS connections (and the DNS lookups) are kept alive and
+    reused between the requests instead of being opened again for each page.
+    """
+
+    def __init__(self, pool_size=10, max_per_host=10, connect_timeout=10, read_timeout=60, headers=None,
+                 cookies=None, chunk_size=16384, cache=None, metrics=None, max_drain=262144):
+        """
+        Initialize the class
+
+        :param pool_size: Number of hosts for which a pool of connections is kept
+        :param max_per_host: Maximum number of open connections to the same host
+        :param connect_timeout: Timeout in seconds to open a connection
+        :param read_timeout: Timeout in seconds between two bytes received from the server
+        :param headers: Default headers sent with every request
+        :param cookies: Default cookies sent with every request
+        :param chunk_size: Size in bytes of the chunks of the streamed pages
+        :param cache: ResponseCache for the plain requests (None to not cache anything)
+        :param metrics: Metrics where the requests, their status codes, sizes and times are counted
+        :param max_drain: Maximum number of bytes of the rest of a page read after stop_after, such that the connection
+                          goes back to the pool (a larger rest closes the connection)
+        """
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.chunk_size = chunk_size
+        self.max_per_host = max_per_host
+        self.max_drain = max_drain
+        self.cache = cache
+        self.metrics = metrics
+
+        self.session = requests.Session()
+
+        # Blocking pool: never more than max_per_host connections to the same host
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max_per_host, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if headers is not None:
+            self.session.headers.update(headers)
+
+        if cookies is not None:
+            self.session.cookies.update(cookies)
+
+    def get(self, url, cookies=None, headers=None, stop_after=None, tail=512, sink=None):
+        """
+        Get a page using one of the connections of the pool
+
+        With sink, the page is streamed: if the status code is 200, the chunks are written in the writer given by
+        sink() as they arrive, instead of being kept in memory. The content of the request is then empty and r.size
+        and r.sha1 give the size and the hash of the page (r.streamed is True).
+
+        With stop_after, the page is streamed and only kept until the byte pattern was seen (plus tail bytes after it).
+        The content of the request (or the page written by the sink) is then only the beginning of the page and
+        r.truncated is True. If the rest of the page is small (at most max_drain bytes), it is read anyway, such that
+        the connection stays alive for the next request (a new TCP+TLS connection costs more than a few hundred KB).
+        Otherwise, the connection is closed right away. When the rest was entirely read, it is kept in r.rest (None
+        otherwise, and always None with a sink).
+
+        :param url: url for the request
+        :param cookies: cookies for this request only (added to the default ones)
+        :param headers: headers for this request only (added to the default ones)
+        :param stop_after: Byte pattern after which the download is stopped (None to get the full page)
+        :param tail: Number of bytes read after the pattern
+        :param sink: Function returning a writer (see PageStore.writer) for the page (None to keep it in memory)
+        :return r: the request
+        """
+
+        if stop_after is None and sink is None:
+            if self.cacheable(cookies, headers):
+                # The pages found in the cache are not counted as requests
+                return self.cache.get(url, lambda: self.observe(self.session.get, url, timeout=self.timeout))
+            return self.observe(self.session.get, url, cookies=cookies, headers=headers, timeout=self.timeout)
+
+        start = time.time()
+        try:
+            r = self.session.get(url, cookies=cookies, headers=headers, timeout=self.timeout, stream=True)
+        except Exception:
+            self.record(start)
+            raise
+
+        # Only the good pages go to the sink, the other ones are kept in memory
+        writer = sink() if sink is not None and r.status_code == 200 else None
+
+        content = bytearray()
+        sha1 = hashlib.sha1()
+        size = 0
+        # Only the end of the page is needed to look for the pattern
+        window = b''
+        found = False
+        truncated = False
+        drained = 0
+        rest = None
+        try:
+            chunks = r.iter_content(self.chunk_size)
+            for chunk in chunks:
+                size += len(chunk)
+                if writer is None:
+                    content += chunk
+                else:
+                    writer.write(chunk)
+                    sha1.update(chunk)
+
+                if stop_after is None:
+                    continue
+
+                if not found:
+                    # The pattern can be split between two chunks
+                    window = window[max(len(window) - len(stop_after) + 1, 0):] + chunk
+                    pos = window.find(stop_after)
+                    if pos >= 0:
+                        found = True
+                        # Number of bytes still to read after the pattern
+                        remaining = tail - (len(window) - pos - len(stop_after))
+                else:
+                    remaining -= len(chunk)
+
+                if found and remaining <= 0:
+                    truncated = True
+                    break
+
+            if truncated:
+                drained, rest = self.drain(r, chunks, size)
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            self.record(start)
+            raise
+        finally:
+            r.close()
+
+        if writer is not None:
+            if size == 0:
+                # An empty page is a failed page, it is not written
+                writer.abort()
+                writer = None
+            else:
+                writer.close()
+                r.size = size
+                r.sha1 = sha1.hexdigest()
+
+        r._content = bytes(content)
+        r.streamed = writer is not None
+        r.truncated = truncated
+        r.rest = rest if writer is None else None
+
+        self.record(start, r.status_code, size + drained)
+
+        return r
+
+    def drain(self, r, chunks, size):
+        """
+        Read the rest of a page stopped by stop_after if it is small, such that the connection can be reused
+
+        :param r: the request
+        :param chunks: Iterator over the chunks of the page (the rest of them)
+        :param size: Number of bytes of the page already read
+        :return: Number of bytes read (the connection is only reused if all the chunks were read) and the rest of the
+                 page (None if it was not entirely read)
+        """
+
+        # Content-Length is the size on the wire (maybe compressed), it's enough to skip the large pages
+        length = r.headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) - size > self.max_drain:
+            return 0, None
+
+        drained = 0
+        rest = bytearray()
+        try:
+            for chunk in chunks:
+                drained += len(chunk)
+                if drained > self.max_drain:
+                    return drained, None
+                rest += chunk
+        except requests.RequestException:
+            # The beginning of the page is still good, only the connection is lost
+            return drained, None
+
+        return drained, bytes(rest)
+
+    def observe(self, get, url, **kwargs):
+        """
+        Do a request and count it in the metrics
+
+        :param get: Function doing the request
+        :param url: url for the request
+        :param kwargs: Arguments of the function
+        :return r: the request
+        """
+
+        start = time.time()
+        try:
+            r = get(url, **kwargs)
+        except Exception:
+            self.record(start)
+            raise
+
+        self.record(start, r.status_code, len(r.content))
+
+        return r
+
+    def record(self, start, status_code=None, size=0):
+        """
+        Count a request in the metrics
+
+        :param start: Time when the request was sent
+        :param status_code: Status code (None if the request raised an exception)
+        :param size: Size in bytes of the page
+        """
+
+        if self.metrics is None:
+            return
+
+        self.metrics.inc('ba_requests_total', status='error' if status_code is None else status_code)
+        self.metrics.inc('ba_bytes_total', size)
+        self.metrics.observe('ba_request_seconds', time.time() - start)
+
+    def cacheable(self, cookies=None, headers=None):
+        """
+        Check if a request can go through the cache
+
+        :param cookies: cookies for this request only
+        :param headers: headers for this request only
+        :return: True if there's a cache and the request is a plain one
+        """
+
+        return self.cache is not None and not cookies and not headers
+
+    def cached(self, url, cookies=None, headers=None):
+        """
+        Get a page from the cache (or from the same request in flight) without sending a request. It's used to not
+        take a slot of the rate limiter for a page that is already there.
+
+        :param url: url for the request
+        :param cookies: cookies for this request only
+        :param headers: headers for this request only
+        :return r: the request or None if the page has to be fetched
+        """
+
+        if not self.cacheable(cookies, headers):
+            return None
+
+        return self.cache.lookup(url)
+
+    def close(self):
+        """
+        Close all the connections of the pool
+        """
+
+        self.session.close()
@@ -0,0 +1,516 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import threading
+import sqlite3
+import time
+import os
+
+
+class Frontier:
+    """
+    Persistent crawl frontier stored in SQLite
+
+    Each page to crawl is a row with the step of the crawl, its url and the file where it is saved (relative to the
+    data folder). The state of a page is either 'pending', 'in-flight', 'done', 'failed' or 'dead'. The number of
+    attempts, the HTTP status, the size in bytes and the time of the fetch are also stored. Resuming a crawl is then
+    just a query on this table instead of checking the files one by one.
+
+    The pages that could not be fetched after all the attempts of the RetryPolicy (or with a terminal status such as
+    404) are dead: they are put in the dead-letter queue (table dead_letters) with the reason and are not retried when
+    the crawl is resumed, until they are replayed.
+
+    The pending pages are claimed by priority (given by the user), then by cost (e.g. number of pages of the beer),
+    such that the largest beers are fanned out at the beginning of the crawl instead of at the end. The claims are
+    atomic, such that several processes can share the same frontier (work stealing).
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the class
+
+        :param filename: SQLite file of the frontier
+        """
+
+        folder = os.path.dirname(filename)
+        if folder != '' and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.filename = filename
+        self.lock = threading.Lock()
+
+        # The pages are claimed by the engine thread and marked as done by the crawl thread
+        # Other processes may write in it while stealing work
+        self.db = sqlite3.connect(filename, check_same_thread=False, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+
+        self.db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                        'step INTEGER NOT NULL, '
+                        'url TEXT NOT NULL, '
+                        'file TEXT NOT NULL, '
+                        "state TEXT NOT NULL DEFAULT 'pending', "
+                        'attempts INTEGER NOT NULL DEFAULT 0, '
+                        'status INTEGER, '
+                        'size INTEGER, '
+                        'fetched_at REAL, '
+                        'priority REAL NOT NULL DEFAULT 0, '
+                        'cost REAL NOT NULL DEFAULT 0, '
+                        'PRIMARY KEY (step, url))')
+
+        # Frontiers created before the priorities
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(pages)')]
+        if 'priority' not in columns:
+            self.db.execute('ALTER TABLE pages ADD COLUMN priority REAL NOT NULL DEFAULT 0')
+            self.db.execute('ALTER TABLE pages ADD COLUMN cost REAL NOT NULL DEFAULT 0')
+
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_state ON pages (step, state)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_priority ON pages (step, state, priority DESC, cost DESC)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_file ON pages (file)')
+
+        # Validators of the pages for the conditional requests when the data is refreshed
+        self.db.execute('CREATE TABLE IF NOT EXISTS validators ('
+                        'url TEXT PRIMARY KEY, '
+                        'etag TEXT, '
+                        'last_modified TEXT, '
+                        'hash TEXT)')
+
+        # Refreshes of the steps and pages that changed during them
+        self.db.execute('CREATE TABLE IF NOT EXISTS refreshes (step INTEGER NOT NULL, started_at REAL NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS changes ('
+                        'step INTEGER NOT NULL, '
+                        'file TEXT NOT NULL, '
+                        'started_at REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS changes_step ON changes (step, started_at)')
+
+        # Pages that could not be fetched, until they are replayed
+        self.db.execute('CREATE TABLE IF NOT EXISTS dead_letters ('
+                        'step INTEGER NOT NULL, '
+                        'url TEXT NOT NULL, '
+                        'file TEXT NOT NULL, '
+                        'status INTEGER, '
+                        'reason TEXT, '
+                        'died_at REAL, '
+                        'PRIMARY KEY (step, url))')
+
+        # Result of the probes of the id space of the breweries (step 5)
+        self.db.execute('CREATE TABLE IF NOT EXISTS probes ('
+                        'id INTEGER PRIMARY KEY, '
+                        'result TEXT NOT NULL, '
+                        'status INTEGER, '
+                        'probed_at REAL)')
+        self.db.commit()
+
+    def add(self, step, tasks, store=None):
+        """
+        Add some pages to the frontier. The pages already in the frontier are ignored.
+
+        If store is given, the new pages that are already in the store (crawled before the frontier existed) are
+        directly added as done. This check is only done once per page.
+
+        :param step: Step of the crawl
+        :param tasks: List of (url, file) or (url, file, priority, cost) with the file relative to the data folder
+                      (key in the store)
+        :param store: Page store to check for existing pages
+        :return: Number of new pages
+        """
+
+        nbr = 0
+
+        with self.lock:
+            for task in tasks:
+                url, file = task[:2]
+                priority, cost = task[2:] if len(task) == 4 else (0, 0)
+
+                # The primary key (step, url) ignores the pages already in the frontier
+                res = self.db.execute('INSERT OR IGNORE INTO pages (step, url, file, priority, cost) '
+                                      'VALUES (?, ?, ?, ?, ?)', (step, url, file, priority, cost))
+                if res.rowcount == 0:
+                    continue
+                nbr += 1
+
+                # Only the new pages are looked up in the store
+                size = None if store is None else store.size(file)
+                if size:
+                    self.db.execute("UPDATE pages SET state = 'done', size = ?, fetched_at = ? "
+                                    'WHERE step = ? AND url = ?', (size, store.fetched_at(file), step, url))
+
+            self.db.commit()
+
+        return nbr
+
+    def claim(self, step, batch_size=100):
+        """
+        Claim a batch of pending pages, the highest priorities and costs first. They become in-flight.
+
+        :param step: Step of the crawl
+        :param batch_size: Maximum number of pages
+        :return: List of (url, file)
+        """
+
+        with self.lock:
+            # One statement, such that two processes never claim the same page
+            batch = self.db.execute("UPDATE pages SET state = 'in-flight', attempts = attempts + 1 "
+                                    'WHERE rowid IN (SELECT rowid FROM pages '
+                                    "WHERE step = ? AND state = 'pending' "
+                                    'ORDER BY priority DESC, cost DESC, rowid LIMIT ?) '
+                                    'RETURNING url, file, priority, cost, rowid', (step, batch_size)).fetchall()
+            self.db.commit()
+
+        batch.sort(key=lambda row: (-row[2], -row[3], row[4]))
+
+        return [(url, file) for url, file, _, _, _ in batch]
+
+    def pending(self, step, batch_size=100):
+        """
+        Claim the pending pages batch after batch
+
+        :param step: Step of the crawl
+        :param batch_size: Number of pages claimed at once
+        :return: Generator of (url, file)
+        """
+
+        while True:
+            batch = self.claim(step, batch_size)
+            if len(batch) == 0:
+                return
+
+            for task in batch:
+                yield task
+
+    def done(self, step, url, status, size):
+        """
+        Mark a page as done
+
+        :param step: Step of the crawl
+        :param url: url of the page
+        :param status: HTTP status code
+        :param size: Size of the page in bytes
+        """
+
+        self._finish(step, url, 'done', status, size)
+
+    def failed(self, step, url, status=None, size=None):
+        """
+        Mark a page as failed
+
+        :param step: Step of the crawl
+        :param url: url of the page
+        :param status: HTTP status code (None if the request raised an exception)
+        :param size: Size of the page in bytes
+        """
+
+        self._finish(step, url, 'failed', status, size)
+
+    def dead(self, step, url, status=None, reason=None):
+        """
+        Mark a page as dead and put it in the dead-letter queue
+
+        :param step: Step of the crawl
+        :param url: url of the page
+        :param status: HTTP status code of the last attempt (None if the request raised an exception)
+        :param reason: 'terminal' (the status will not change by asking again) or 'exhausted' (all the attempts
+                       failed)
+        """
+
+        with self.lock:
+            self.db.execute("UPDATE pages SET state = 'dead', status = ?, fetched_at = ? WHERE step = ? AND url = ?",
+                            (status, time.time(), step, url))
+            self.db.execute('INSERT OR REPLACE INTO dead_letters SELECT step, url, file, ?, ?, ? FROM pages '
+                            'WHERE step = ? AND url = ?', (status, reason, time.time(), step, url))
+            self.db.commit()
+
+    def dead_letters(self, step=None):
+        """
+        Pages in the dead-letter queue
+
+        :param step: Only the pages of this step (default: all the steps)
+        :return: List of (step, url, file, status, reason, died_at)
+        """
+
+        with self.lock:
+            if step is None:
+                res = self.db.execute('SELECT * FROM dead_letters ORDER BY step, died_at')
+            else:
+                res = self.db.execute('SELECT * FROM dead_letters WHERE step = ? ORDER BY died_at', (step,))
+            return res.fetchall()
+
+    def replay(self, step, status=None):
+        """
+        Put the dead pages of a step back to pending (e.g. after an outage of the website) and remove them from the
+        dead-letter queue
+
+        :param step: Step of the crawl
+        :param status: Only the pages that died with this status code (default: all of them)
+        :return: Number of pages replayed
+        """
+
+        condition = 'step = ?'
+        params = [step]
+        if status is not None:
+            condition += ' AND status = ?'
+            params.append(status)
+
+        with self.lock:
+            nbr = self.db.execute("UPDATE pages SET state = 'pending' WHERE state = 'dead' AND url IN "
+                                  '(SELECT url FROM dead_letters WHERE {}) AND step = ?'.format(condition),
+                                  params + [step]).rowcount
+            self.db.execute('DELETE FROM dead_letters WHERE {}'.format(condition), params)
+            self.db.commit()
+
+        return nbr
+
+    def _finish(self, step, url, state, status, size):
+        with self.lock:
+            self.db.execute('UPDATE pages SET state = ?, status = ?, size = COALESCE(?, size), fetched_at = ? '
+                            'WHERE step = ? AND url = ?', (state, status, size, time.time(), step, url))
+            self.db.commit()
+
+    def reset(self, step, failed=True):
+        """
+        Put the pages that were in flight (crawl interrupted) back to pending. Same for the failed ones.
+
+        :param step: Step of the crawl
+        :param failed: Also retry the failed pages
+        """
+
+        states = ['in-flight', 'failed'] if failed else ['in-flight']
+
+        with self.lock:
+            self.db.execute("UPDATE pages SET state = 'pending' WHERE step = ? AND state IN ({})".format(
+                ', '.join('?' * len(states))), [step] + states)
+            self.db.commit()
+
+    def clear(self, step):
+        """
+        Remove all the pages of a step and its dead letters (e.g. before a new run of a step crawled again each time)
+
+        :param step: Step of the crawl
+        """
+
+        with self.lock:
+            self.db.execute('DELETE FROM pages WHERE step = ?', (step,))
+            self.db.execute('DELETE FROM dead_letters WHERE step = ?', (step,))
+            self.db.commit()
+
+    def count(self, step, state=None):
+        """
+        Number of pages of a step
+
+        :param step: Step of the crawl
+        :param state: Only count the pages in this state
+        :return: Number of pages
+        """
+
+        with self.lock:
+            if state is None:
+                res = self.db.execute('SELECT COUNT(*) FROM pages WHERE step = ?', (step,))
+            else:
+                res = self.db.execute('SELECT COUNT(*) FROM pages WHERE step = ? AND state = ?', (step, state))
+            return res.fetchone()[0]
+
+    def priority(self, step, url):
+        """
+        Priority and cost of a page
+
+        :param step: Step of the crawl
+        :param url: url of the page
+        :return: (priority, cost), (0, 0) if the page is not in the frontier
+        """
+
+        with self.lock:
+            res = self.db.execute('SELECT priority, cost FROM pages WHERE step = ? AND url = ?', (step, url)).fetchone()
+
+        return (0, 0) if res is None else res
+
+    def fetched_at(self, file):
+        """
+        Time when a file was fetched (the latest one if it was fetched by several steps)
+
+        :param file: File relative to the data folder
+        :return: UNIX timestamp or None if the file is not in the frontier
+        """
+
+        with self.lock:
+            res = self.db.execute("SELECT MAX(fetched_at) FROM pages WHERE file = ? AND state = 'done'", (file,))
+            return res.fetchone()[0]
+
+    def files(self, step, state='done'):
+        """
+        Files of the pages of a step in a state
+
+        :param step: Step of the crawl
+        :param state: State of the pages
+        :return: List of files
+        """
+
+        with self.lock:
+            return [file for file, in self.db.execute('SELECT file FROM pages WHERE step = ? AND state = ?',
+                                                      (step, state))]
+
+    def urls(self, step, state='done'):
+        """
+        urls of the pages of a step in a state
+
+        :param step: Step of the crawl
+        :param state: State of the pages
+        :return: Set of urls
+        """
+
+        with self.lock:
+            return set(url for url, in self.db.execute('SELECT url FROM pages WHERE step = ? AND state = ?',
+                                                       (step, state)))
+
+    def unfinished(self, step):
+        """
+        Pages of a step that are not done (pending, in flight, failed or dead)
+
+        :param step: Step of the crawl
+        :return: List of (url, file)
+        """
+
+        with self.lock:
+            return self.db.execute("SELECT url, file FROM pages WHERE step = ? AND state != 'done'",
+                                   (step,)).fetchall()
+
+    def average_size(self, step):
+        """
+        Average size of the pages of a step that are done
+
+        :param step: Step of the crawl
+        :return: Size in bytes or None if no page is done
+        """
+
+        with self.lock:
+            return self.db.execute("SELECT AVG(size) FROM pages WHERE step = ? AND state = 'done'",
+                                   (step,)).fetchone()[0]
+
+    def get_validators(self, url):
+        """
+        Validators of a page from its last fetch
+
+        :param url: url of the page
+        :return: (etag, last_modified, hash) or None if the page was never fetched
+        """
+
+        with self.lock:
+            return self.db.execute('SELECT etag, last_modified, hash FROM validators WHERE url = ?',
+                                   (url,)).fetchone()
+
+    def set_validators(self, url, etag, last_modified, hash_):
+        """
+        Save the validators of a page
+
+        :param url: url of the page
+        :param etag: ETag header (or None)
+        :param last_modified: Last-Modified header (or None)
+        :param hash_: Hash of the content
+        """
+
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)',
+                            (url, etag, last_modified, hash_))
+            self.db.commit()
+
+    def start_refresh(self, step):
+        """
+        Start a refresh of a step: all the pages that are done become pending again
+
+        :param step: Step of the crawl
+        :return: Time of the start of the refresh
+        """
+
+        started_at = time.time()
+
+        with self.lock:
+            self.db.execute("UPDATE pages SET state = 'pending' WHERE step = ? AND state = 'done'", (step,))
+            self.db.execute('INSERT INTO refreshes VALUES (?, ?)', (step, started_at))
+            self.db.commit()
+
+        return started_at
+
+    def add_change(self, step, file, started_at):
+        """
+        Record that a page changed during a refresh
+
+        :param step: Step of the crawl
+        :param file: File relative to the data folder
+        :param started_at: Time of the start of the refresh
+        """
+
+        with self.lock:
+            self.db.execute('INSERT INTO changes VALUES (?, ?, ?)', (step, file, started_at))
+            self.db.commit()
+
+    def changed(self, step):
+        """
+        Files that changed during the last refresh of a step
+
+        :param step: Step of the crawl
+        :return: Set of files or None if the step was never refreshed
+        """
+
+        with self.lock:
+            started_at = self.db.execute('SELECT MAX(started_at) FROM refreshes WHERE step = ?',
+                                         (step,)).fetchone()[0]
+            if started_at is None:
+                return None
+
+            return set(file for file, in self.db.execute('SELECT file FROM changes WHERE step = ? AND started_at = ?',
+                                                         (step, started_at)))
+
+    def probes(self):
+        """
+        Result of all the ids that were probed
+
+        :return: Dict id -> result ('brewery', 'other', 'not-found' or 'unknown' for the old probes)
+        """
+
+        with self.lock:
+            return dict(self.db.execute('SELECT id, result FROM probes'))
+
+    def set_probe(self, id_, result, status=None):
+        """
+        Save the result of a probe. An id with a result is never probed again.
+
+        :param id_: ID probed
+        :param result: 'brewery', 'other' or 'not-found'
+        :param status: HTTP status code
+        """
+
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)', (id_, result, status, time.time()))
+            self.db.commit()
+
+    def merge(self, filename):
+        """
+        Copy all the rows of another frontier (e.g. the one of a shard) in this one. The rows of the other frontier
+        replace the ones with the same key.
+
+        :param filename: SQLite file of the other frontier
+        """
+
+        with self.lock:
+            self.db.execute('ATTACH DATABASE ? AS other', (filename,))
+            try:
+                tables = set(name for name, in self.db.execute("SELECT name FROM other.sqlite_master "
+                                                               "WHERE type = 'table'"))
+                for table in ['pages', 'validators', 'refreshes', 'changes', 'dead_letters', 'probes']:
+                    # Frontiers created by an older version do not have all the tables
+                    if table not in tables:
+                        continue
+                    self.db.execute('INSERT OR REPLACE INTO {0} SELECT * FROM other.{0}'.format(table))
+                self.db.commit()
+            finally:
+                self.db.execute('DETACH DATABASE other')
+
+    def close(self):
+        """
+        Close the database
+        """
+
+        self.db.close()
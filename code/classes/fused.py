@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.users import UserStats, users_from_file
+import pandas as pd
+import numpy as np
+import json
+import time
+import os
+
+
+class FusedBeerCrawl:
+    """
+    Steps 9, 10 and 11 in one pass
+
+    Each page of a beer is parsed in memory as soon as it is downloaded: the information of the beer (step 10) comes
+    from its first page and the ratings (step 11) are written right away in ratings.txt.gz and reviews.txt.gz. The
+    pages are only kept in the page store if archive is True.
+
+    What was parsed from each page is written in parsed/fused.jsonl. The outputs are flushed at checkpoints (every
+    checkpoint_pages pages or checkpoint_seconds seconds), then the entries of the pages parsed since the last
+    checkpoint are written in the log, such that the log never records a page whose ratings were not flushed. If the
+    crawl is interrupted, running it again appends to the outputs and only parses the pages that are not in this file
+    (the pages done in the frontier and in the store are parsed from the store, the ratings written after the last
+    checkpoint are not written twice thanks to the index). At the end, beers.csv gets the columns of the step 10,
+    with the numbers of ratings and reviews that were parsed (as the step 11 does).
+    """
+
+    def __init__(self, crawler, parser, archive=True, checkpoint_pages=1000, checkpoint_seconds=30):
+        """
+        Initialize the class
+
+        :param crawler: Crawler (frontier, store and fetches of the step 9)
+        :param parser: Parser (parse_beer_information and parse_review_page)
+        :param archive: Keep the pages in the page store
+        :param checkpoint_pages: Number of pages parsed between two checkpoints
+        :param checkpoint_seconds: Maximum time in seconds between two checkpoints
+        """
+
+        self.crawler = crawler
+        self.parser = parser
+        self.archive = archive
+        self.checkpoint_pages = checkpoint_pages
+        self.checkpoint_seconds = checkpoint_seconds
+
+        self.log_file = crawler.data_folder + 'parsed/fused.jsonl'
+
+        self.f_ratings = None
+        self.f_reviews = None
+        self.log = None
+
+        # Entries of the pages parsed since the last checkpoint
+        self.entries = []
+        self.last_checkpoint = time.time()
+
+        # Row of each beer in beers.csv
+        self.beers = {}
+
+    def run(self):
+        """
+        Crawl and parse all the beers
+
+        !!! Make sure steps 6, 7 and 8 were done with the parser !!!
+        """
+
+        df = pd.read_csv(self.crawler.data_folder + 'parsed/beers.csv')
+        df = df.drop_duplicates('beer_id', keep='first')
+        for i in df.index:
+            row = df.loc[i]
+            self.beers[int(row['beer_id'])] = row
+
+        parsed = self.parsed_files()
+
+        # Append to the outputs of an interrupted run, with its ratings in the index and the users of the parser
+        mode = 'ab' if len(parsed) > 0 else 'wb'
+        self.parser.index.clear()
+        self.parser.users = UserStats()
+        if len(parsed) > 0:
+            self.parser.index.load(self.parser.output('ratings.txt'))
+            self.parser.users = users_from_file(self.parser.output('ratings.txt'), self.parser.processes)
+        self.f_ratings = self.parser.open_output('ratings.txt', mode)
+        self.f_reviews = self.parser.open_output('reviews.txt', mode)
+        self.log = open(self.log_file, 'a')
+
+        try:
+            store = self.crawler.store if self.archive else None
+            self.crawler.frontier.add(9, self.crawler.beer_tasks(), store)
+
+            # Pages crawled before (with the step 9 or by an interrupted run) that were not parsed. The first pages
+            # before the other ones.
+            for file in sorted(self.crawler.frontier.files(9, 'done'), key=lambda f: not f.endswith('/0.html')):
+                if file not in parsed and self.crawler.store.size(file):
+                    self.parse(file, self.crawler.store.get(file).decode('utf-8'), None)
+
+            self.crawler.crawl_frontier(9, self.save, stream=False)
+        finally:
+            try:
+                self.checkpoint()
+            finally:
+                self.f_ratings.close()
+                self.f_reviews.close()
+                self.log.close()
+                self.parser.index.commit()
+
+        self.update_beers(df)
+
+        # Users of the ratings (instead of the step 12)
+        self.parser.save_users([self.parser.output('ratings.txt')])
+
+        # The ratings are appended to the txt.gz files during the crawl, the columnar files are written at the end
+        if self.parser.columnar is not None:
+            self.parser.convert_columnar()
+
+    def parsed_files(self):
+        """
+        Pages already parsed by a previous run. The information of the beers parsed is added to their rows.
+
+        :return: Set of files
+        """
+
+        parsed = set()
+        if os.path.exists(self.log_file):
+            with open(self.log_file) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    parsed.add(entry['file'])
+                    if 'info' in entry:
+                        self.add_information(entry['beer_id'], entry['info'])
+
+        return parsed
+
+    def add_information(self, beer_id, info):
+        """
+        Add the information of the first page to the row of a beer (the ratings are written with the ABV)
+
+        :param beer_id: ID of the beer
+        :param info: Dict from Parser.parse_beer_information
+        """
+
+        row = self.beers.get(beer_id)
+        if row is None:
+            return
+
+        row = row.copy()
+        for key, value in info.items():
+            row[key] = np.nan if value is None else value
+        self.beers[beer_id] = row
+
+    def save(self, file, r):
+        """
+        Parse a page as soon as it was downloaded (function save of crawl_frontier)
+
+        :param file: File relative to the data folder
+        :param r: the request (always a good one, see Crawler.crawl_frontier)
+        """
+
+        if self.archive:
+            self.crawler.store.put(file, r.content)
+
+        self.parse(file, r.content.decode('utf-8'), time.time())
+
+    def parse(self, file, html_txt, fetched_at):
+        """
+        Parse a page of a beer and write its ratings
+
+        :param file: File relative to the data folder
+        :param html_txt: HTML of the page
+        :param fetched_at: Time when the page was fetched (None to get it from the frontier or the store)
+        """
+
+        brewery_id, beer_id = file.split('/')[1:3]
+        beer_id = int(beer_id)
+
+        entry = {'file': file, 'beer_id': beer_id, 'ratings': 0, 'reviews': 0}
+
+        if file.endswith('/0.html'):
+            info = self.parser.parse_beer_information(html_txt)
+            self.parser.metrics.inc('ba_pages_parsed_total', step=10)
+            entry['info'] = dict((key, None if pd.isnull(value) else value) for key, value in info.items())
+            self.add_information(beer_id, entry['info'])
+
+            # The pages with the reviews
+            url = self.crawler.base_url + '/beer/profile/{}/{}'.format(brewery_id, beer_id)
+            tasks = self.crawler.review_pages(url, file, html_txt)
+            self.crawler.frontier.add(9, tasks, self.crawler.store if self.archive else None)
+
+        row = self.beers.get(beer_id)
+        if row is not None:
+            for rating in self.parser.parse_review_page(file, html_txt, fetched_at):
+                # Only one rating per user and per beer (also with the ratings of an interrupted run)
+                if not self.parser.index.add(rating['user_id'], beer_id):
+                    self.parser.metrics.inc('ba_duplicates_total', step=11, source='pages')
+                    continue
+
+                entry['ratings'] += 1
+                self.parser.users.add(rating['user_name'], rating['user_id'], rating['review'], rating['date'])
+                if self.parser.write_records(self.f_ratings, self.f_reviews, row, rating):
+                    entry['reviews'] += 1
+
+        self.entries.append(entry)
+        if len(self.entries) >= self.checkpoint_pages or time.time() - self.last_checkpoint >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Flush the outputs, then record the pages parsed since the last checkpoint in the log (the outputs end with
+        complete blocks, which can be read even if the process is killed afterwards)
+        """
+
+        self.f_ratings.flush()
+        self.f_reviews.flush()
+
+        for entry in self.entries:
+            self.log.write(json.dumps(entry) + '\n')
+        self.log.flush()
+
+        self.entries = []
+        self.last_checkpoint = time.time()
+
+    def update_beers(self, df):
+        """
+        Add the information of the beers and the numbers of ratings and reviews parsed to beers.csv
+
+        :param df: DataFrame of beers.csv
+        """
+
+        info = {}
+        counts = {}
+        with open(self.log_file) as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'info' in entry:
+                    info[entry['beer_id']] = entry['info']
+                nbr_rat, nbr_rev = counts.get(entry['beer_id'], (0, 0))
+                counts[entry['beer_id']] = (nbr_rat + entry['ratings'], nbr_rev + entry['reviews'])
+
+        columns = ['nbr_ratings', 'nbr_reviews', 'avg', 'ba_score', 'bros_score', 'abv']
+        values = dict((column, []) for column in columns)
+
+        missing = 0
+        for beer_id in df['beer_id']:
+            if beer_id not in info:
+                # The first page could not be downloaded
+                missing += 1
+                for column in columns:
+                    values[column].append(np.nan)
+                continue
+
+            for column in columns:
+                value = info[beer_id][column]
+                values[column].append(np.nan if value is None else value)
+
+            # Like the step 11, the numbers of ratings and reviews are the ones that were parsed
+            if info[beer_id]['nbr_ratings'] > -1:
+                values['nbr_ratings'][-1], values['nbr_reviews'][-1] = counts[beer_id]
+
+        for column in columns:
+            df[column] = values[column]
+
+        # Remove the bad lines (not the pages of a beer)
+        df = df[df['nbr_ratings'] != -1]
+        df.index = range(len(df))
+
+        df.to_csv(self.crawler.data_folder + 'parsed/beers.csv', index=False)
+
+        if missing > 0:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('{:d} BEERS WITHOUT THEIR FIRST PAGE'.format(missing))
+            print('---------------------------------------------------------------------')
+            print('')
@@ -5,8 +5,28 @@
 #
 # Distributed under terms of the MIT license.
 
+from classes.blocks import open_blocks
+import multiprocessing
+import pandas as pd
 import numpy as np
-import gzip
+import collections
+import re
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columns of the files of ratings and reviews with their types (review is only in the ratings). The dates are the UNIX
+# times of the text files.
+RATING_COLUMNS = [('beer_name', 'str'), ('beer_id', 'int'), ('brewery_name', 'str'), ('brewery_id', 'int'),
+                  ('style', 'str'), ('abv', 'float'), ('date', 'date'), ('user_name', 'str'), ('user_id', 'str'),
+                  ('appearance', 'float'), ('aroma', 'float'), ('palate', 'float'), ('taste', 'float'),
+                  ('overall', 'float'), ('rating', 'float'), ('text', 'str'), ('review', 'bool')]
+
+# Size of the decompressed chunks of the txt.gz files
+CHUNK_SIZE = 32 * 1024 * 1024
 
 
 def round_(x, base=50):
@@ -25,24 +45,247 @@ def parse(filename):
 
     Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
 
+    The file is decompressed and decoded by chunks of CHUNK_SIZE bytes, and closed at the end (or when the generator
+    is closed). To load some columns of the whole file, read_columns is much faster.
+
     :param filename: name of the file
     :return: Generator to go through the file
     """
-    file = gzip.open(filename, 'rb')
-    entry = {}
-    # Go through all the lines
-    for line in file:
-        # Transform the string-bytes into a string
-        line = line.decode("utf-8").strip()
-
-        # We check for a colon in each line
-        colon_pos = line.find(":")
-        if colon_pos == -1:
-            # if no, we yield the entry
+    with open_blocks(filename) as file:
+        for entry in parse_chunks(read_chunks(file)):
             yield entry
-            entry = {}
+
+
+def parse_chunks(chunks):
+    """
+    Parse some chunks of a txt.gz file (see read_chunks) and return a generator for the entries
+
+    :param chunks: Iterable of bytes
+    :return: Generator of dicts
+    """
+    entry = {}
+    for chunk in chunks:
+        # Transform the string-bytes into a string and split the lines
+        lines = chunk.decode("utf-8").split('\n')
+        if chunk.endswith(b'\n'):
+            lines.pop()
+
+        # Go through all the lines
+        for line in lines:
+            line = line.strip()
+
+            # We check for a colon in each line
+            colon_pos = line.find(":")
+            if colon_pos == -1:
+                # if no, we yield the entry
+                yield entry
+                entry = {}
+                continue
+            # otherwise, we add the key-value pair to the entry
+            key = line[:colon_pos]
+            value = line[colon_pos + 2:]
+            entry[key] = value
+
+
+def read_chunks(file, size=CHUNK_SIZE):
+    """
+    Read a decompressed txt.gz file by chunks that end at the end of an entry (empty line)
+
+    :param file: File opened in binary mode (see open_blocks)
+    :param size: Number of bytes read at once
+    :return: Generator of bytes
+    """
+    rest = b''
+    while True:
+        data = file.read(size)
+        if len(data) == 0:
+            break
+
+        data = rest + data
+        end = data.rfind(b'\n\n')
+        if end == -1:
+            rest = data
             continue
-        # otherwise, we add the key-value pair to the entry
-        key = line[:colon_pos]
-        value = line[colon_pos + 2:]
-        entry[key] = value
+
+        yield data[:end + 2]
+        rest = data[end + 2:]
+
+    if len(rest) > 0:
+        yield rest
+
+
+def read_columns(filename, columns=None, processes=1, chunk_size=CHUNK_SIZE):
+    """
+    Load some columns of a txt.gz file in typed NumPy arrays (types of RATING_COLUMNS, str for the other keys)
+
+    The file is decompressed by chunks. In each chunk, the values of a column are found at once with a regular
+    expression (the key at the beginning of a line), instead of going through the lines in Python. A chunk where the
+    keys are not once in each entry (e.g. a text with a line break that looks like a key) is parsed line by line, with
+    the same values as parse. With several processes, the chunks are decompressed one after the other in this process
+    and the processes find and convert the values.
+
+    :param filename: name of the file
+    :param columns: List of the keys to load (default: the keys of the first entry)
+    :param processes: Number of processes converting the chunks (None for the number of CPUs)
+    :param chunk_size: Number of decompressed bytes of a chunk
+    :return: Dict key -> NumPy array (object arrays for the strings, datetime64[s] for the dates)
+    """
+    if columns is None:
+        # Keys of the first entry (a small chunk at the beginning of the file)
+        with open_blocks(filename) as file:
+            first = next(read_chunks(file, 64 * 1024), None)
+        if first is not None:
+            columns = list(next(parse_chunks([first]), {}).keys())
+        else:
+            columns = [name for name, type_ in RATING_COLUMNS]
+
+    parts = list(map_chunks(filename, chunk_columns, (columns,), processes, chunk_size))
+
+    if len(parts) == 0:
+        parts.append(chunk_columns(b'', columns))
+
+    return dict((column, np.concatenate([part[column] for part in parts])) for column in columns)
+
+
+def map_chunks(filename, function, args=(), processes=1, chunk_size=CHUNK_SIZE):
+    """
+    Apply a function to the chunks of a txt.gz file (see read_chunks), in the order of the file
+
+    With several processes, the chunks are decompressed one after the other in this process and the function runs in
+    the processes (it must be defined at the top of a module), with at most two chunks per process waiting in memory.
+
+    :param filename: name of the file
+    :param function: Function of a chunk (bytes) and of the args
+    :param args: Other arguments of the function
+    :param processes: Number of processes (None for the number of CPUs)
+    :param chunk_size: Number of decompressed bytes of a chunk
+    :return: Generator of the results of the function
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    with open_blocks(filename) as file:
+        chunks = read_chunks(file, chunk_size)
+
+        if processes == 1:
+            for chunk in chunks:
+                yield function(chunk, *args)
+            return
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(function, (chunk,) + tuple(args)))
+                if len(pending) >= 2 * processes:
+                    yield pending.popleft().get()
+            while len(pending) > 0:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def chunk_columns(chunk, columns):
+    """
+    Typed values of some columns of a chunk of a txt.gz file (see read_columns)
+
+    :param chunk: bytes ending at the end of an entry
+    :param columns: List of the keys
+    :return: Dict key -> NumPy array
+    """
+    text = '\n' + chunk.decode('utf-8')
+
+    # Number of entries (each one ends with an empty line)
+    nbr = text.count('\n\n')
+
+    values = {}
+    for column in columns:
+        values[column] = re.findall('\n' + re.escape(column) + ': ([^\n]*)', text)
+        if len(values[column]) != nbr:
+            break
+    else:
+        types = dict(RATING_COLUMNS)
+        return dict((column, typed_values(values[column], types.get(column, 'str'), True)) for column in columns)
+
+    # Not the same number of values in each column, line by line
+    values = dict((column, []) for column in columns)
+    for entry in parse_chunks([chunk]):
+        for column in columns:
+            values[column].append(entry[column])
+
+    types = dict(RATING_COLUMNS)
+    return dict((column, typed_values(values[column], types.get(column, 'str'), False)) for column in columns)
+
+
+def typed_values(values, type_, strip):
+    """
+    Convert the values of a column of a txt.gz file
+
+    :param values: List of str
+    :param type_: 'str', 'int', 'float', 'date' or 'bool'
+    :param strip: Remove the whitespaces at the end of the strings (as parse does with the lines)
+    :return: NumPy array ('nan' gives NaN for the floats and None for the strings)
+    """
+    if type_ == 'int':
+        return np.array(values, dtype=np.int64)
+    elif type_ == 'float':
+        return np.array(values, dtype=np.float64)
+    elif type_ == 'date':
+        return np.array(values, dtype=np.int64).astype('datetime64[s]')
+    elif type_ == 'bool':
+        return np.array([value == 'True' for value in values], dtype=bool)
+
+    if strip:
+        values = [value.rstrip() for value in values]
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = [None if value == 'nan' else value for value in values]
+    return array
+
+
+def known_ratings(filename):
+    """
+    Get the keys (user_id, beer_id) of all the ratings of a txt.gz file
+
+    :param filename: name of the file
+    :return: Set of (user_id, beer_id) with user_id as str and beer_id as int
+    """
+
+    values = read_columns(filename, ['user_id', 'beer_id'])
+
+    return set(zip(values['user_id'], values['beer_id'].tolist()))
+
+
+def read_ratings(filename, columns=None, processes=1):
+    """
+    Read a file of ratings or reviews in a DataFrame with the types of RATING_COLUMNS
+
+    The Parquet and Arrow files (see classes/columnar.py) only read the columns asked. The txt.gz files are
+    decompressed entirely (slower) and loaded with read_columns ('nan' gives NaN or None).
+
+    :param filename: .parquet, .arrow or .txt.gz file
+    :param columns: List of the columns to read (default: all)
+    :param processes: Number of processes converting the chunks of a txt.gz file (see read_columns)
+    :return: DataFrame
+    """
+
+    if filename.endswith('.parquet') or filename.endswith('.arrow'):
+        if pyarrow is None:
+            raise ImportError('The package pyarrow is needed to read the file {}'.format(filename))
+
+        if filename.endswith('.parquet'):
+            df = pyarrow.parquet.read_table(filename, columns=columns).to_pandas()
+            # Parquet has no timestamps in seconds, the dates come back in milliseconds
+            if 'date' in df.columns:
+                df['date'] = df['date'].astype('datetime64[s]')
+            return df
+
+        # The Arrow files are not compressed: with the memory map, only the columns asked are read from the disk
+        with pyarrow.memory_map(filename) as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select(columns)
+            return table.to_pandas()
+
+    return pd.DataFrame(read_columns(filename, columns, processes), columns=columns)
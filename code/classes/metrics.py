@@ -0,0 +1,406 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import resource
+import json
+import time
+import os
+
+
+class Metrics:
+    """
+    Live metrics of the crawl and parse steps
+
+    Counters, gauges and histograms with labels, shared by the fetcher, the engine, the crawler and the parser. They
+    are exported in the text format of Prometheus (see MetricsServer) and in a JSON snapshot with the rates since the
+    previous snapshot.
+    """
+
+    # Name -> (type, help) of the metrics
+    descriptions = {'ba_requests_total': ('counter', 'HTTP requests sent, by status code (error for an exception)'),
+                    'ba_bytes_total': ('counter', 'Bytes of the pages downloaded'),
+                    'ba_request_seconds': ('histogram', 'Time to get a page'),
+                    'ba_retries_total': ('counter', 'Requests sent again after a bad response'),
+                    'ba_dead_letters_total': ('counter', 'Pages put in the dead-letter queue, by step and reason'),
+                    'ba_circuit_open': ('gauge', '1 while the circuit breaker pauses the crawl'),
+                    'ba_circuit_trips_total': ('counter', 'Openings of the circuit breaker'),
+                    'ba_requests_in_flight': ('gauge', 'Requests in flight in the engine'),
+                    'ba_frontier_pending': ('gauge', 'Pages left in the frontier for the step being crawled'),
+                    'ba_pages_parsed_total': ('counter', 'Pages parsed, by step'),
+                    'ba_records_written_total': ('counter', 'Records written in the parsed files, by file'),
+                    'ba_duplicates_total': ('counter', 'Ratings found twice and not written, by step and source'),
+                    'ba_step': ('gauge', 'Step of the pipeline being run'),
+                    'ba_step_seconds': ('gauge', 'Time in seconds of the last run of each step'),
+                    'ba_rate': ('gauge', 'Requests per second allowed by the rate controller'),
+                    'ba_resident_memory_bytes': ('gauge', 'Resident memory of the process')}
+
+    # Upper bounds in seconds of the buckets of the histograms
+    buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+    def __init__(self):
+        """
+        Initialize the class
+        """
+
+        self.lock = threading.Lock()
+        self.start = time.time()
+
+        # (name, labels) -> value, labels is a sorted tuple of (key, value)
+        self.values = {}
+        # (name, labels) -> [counts of the buckets, sum, count]
+        self.histograms = {}
+        # name -> function giving the value of the gauge when the metrics are collected
+        self.functions = {'ba_resident_memory_bytes': resident_memory}
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increment a counter (or a gauge)
+
+        :param name: Name of the metric
+        :param value: Increment
+        :param labels: Labels of the metric
+        """
+
+        key = metric_key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set the value of a gauge
+
+        :param name: Name of the metric
+        :param value: Value
+        :param labels: Labels of the metric
+        """
+
+        with self.lock:
+            self.values[metric_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add a value to a histogram
+
+        :param name: Name of the metric
+        :param value: Value (e.g. the time of a request)
+        :param labels: Labels of the metric
+        """
+
+        key = metric_key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    def gauge(self, name, function):
+        """
+        Gauge whose value is given by a function when the metrics are collected
+
+        :param name: Name of the metric
+        :param function: Function without argument giving the value
+        """
+
+        with self.lock:
+            self.functions[name] = function
+
+    def total(self, name):
+        """
+        Sum of a metric over all its labels
+
+        :param name: Name of the metric
+        :return: Sum of the values
+        """
+
+        with self.lock:
+            return sum(value for (name_, _), value in self.values.items() if name_ == name)
+
+    def quantile(self, name, q):
+        """
+        Estimate a quantile of a histogram (all labels together) with the bounds of the buckets
+
+        :param name: Name of the histogram
+        :param q: Quantile between 0 and 1
+        :return: Upper bound of the bucket of the quantile (None if the histogram is empty)
+        """
+
+        with self.lock:
+            counts = [0] * len(self.buckets)
+            for (name_, _), hist in self.histograms.items():
+                if name_ == name:
+                    counts = [c + h for c, h in zip(counts, hist[0])]
+
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        cumulated = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulated += count
+            if cumulated >= q * total:
+                return bound
+
+    def collect(self):
+        """
+        All the metrics in the text format of Prometheus
+
+        :return: str
+        """
+
+        with self.lock:
+            values = dict(self.values)
+            histograms = dict((key, [list(hist[0]), hist[1], hist[2]]) for key, hist in self.histograms.items())
+            functions = dict(self.functions)
+
+        for name, function in functions.items():
+            try:
+                values[(name, ())] = function()
+            except Exception:
+                # The metric is not available (e.g. the frontier was closed)
+                pass
+
+        names = sorted(set(name for name, _ in values) | set(name for name, _ in histograms))
+
+        lines = []
+        for name in names:
+            type_, help_ = self.descriptions.get(name, ('untyped', name))
+            lines.append('# HELP {} {}'.format(name, help_))
+            lines.append('# TYPE {} {}'.format(name, type_))
+
+            for (name_, labels), value in sorted(values.items()):
+                if name_ == name:
+                    lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+
+            for (name_, labels), (counts, sum_, count) in sorted(histograms.items()):
+                if name_ != name:
+                    continue
+                cumulated = 0
+                for bound, nbr in zip(self.buckets, counts):
+                    cumulated += nbr
+                    le = '+Inf' if bound == float('inf') else format_value(bound)
+                    lines.append('{}_bucket{} {:d}'.format(name, format_labels(labels + (('le', le),)), cumulated))
+                lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(sum_)))
+                lines.append('{}_count{} {:d}'.format(name, format_labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        Snapshot of the metrics
+
+        :return: Dict with the time, the totals of the counters, the values by labels and the quantiles of the
+                 latency
+        """
+
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+
+        metrics = {}
+        for (name, labels), value in values.items():
+            label = ','.join('{}={}'.format(k, v) for k, v in labels) or 'all'
+            metrics.setdefault(name, {})[label] = value
+
+        for name, function in functions.items():
+            try:
+                metrics[name] = {'all': function()}
+            except Exception:
+                pass
+
+        return {'time': time.time(),
+                'uptime': time.time() - self.start,
+                'metrics': metrics,
+                'totals': dict((name, sum(by_label.values())) for name, by_label in metrics.items()),
+                'latency': {'p50': self.quantile('ba_request_seconds', 0.5),
+                            'p90': self.quantile('ba_request_seconds', 0.9),
+                            'p99': self.quantile('ba_request_seconds', 0.99)}}
+
+
+class MetricsServer:
+    """
+    Export the metrics on a local HTTP endpoint (/metrics, text format of Prometheus) and in a JSON file written
+    every interval seconds, with the rates (requests/s, bytes/s, pages parsed/s and records written/s) since the
+    previous snapshot
+    """
+
+    # Counters whose rate is given in the snapshot
+    rates = {'requests_per_s': 'ba_requests_total',
+             'bytes_per_s': 'ba_bytes_total',
+             'pages_parsed_per_s': 'ba_pages_parsed_total',
+             'records_per_s': 'ba_records_written_total'}
+
+    def __init__(self, metrics, port=None, snapshot_file=None, interval=10.0):
+        """
+        Initialize the class
+
+        :param metrics: Metrics to export
+        :param port: Port of the endpoint (default: None, no endpoint; 0 to let the OS choose one)
+        :param snapshot_file: JSON file with the last snapshot (None for no file)
+        :param interval: Time in seconds between two snapshots
+        """
+
+        self.metrics = metrics
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+
+        self.stopped = threading.Event()
+        self.previous = None
+        self.threads = []
+
+        self.server = None
+        self.url = None
+        if port is not None:
+            class Handler(BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+
+                    body = metrics.collect().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    # Keep the output of the crawl clean
+                    pass
+
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            self.server.daemon_threads = True
+            self.url = 'http://127.0.0.1:{:d}/metrics'.format(self.server.server_address[1])
+
+    def start(self):
+        """
+        Start the endpoint and the snapshots in background threads
+        """
+
+        if self.server is not None:
+            self.threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        if self.snapshot_file is not None:
+            self.threads.append(threading.Thread(target=self.write_snapshots, daemon=True))
+
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the endpoint and write a last snapshot
+        """
+
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+
+        if self.snapshot_file is not None:
+            self.write_snapshot()
+
+    def snapshot(self):
+        """
+        Snapshot of the metrics with the rates since the previous one
+
+        :return: Dict
+        """
+
+        snap = self.metrics.snapshot()
+
+        previous = self.previous
+        if previous is None:
+            previous = {'time': self.metrics.start, 'totals': {}}
+
+        elapsed = max(snap['time'] - previous['time'], 1e-6)
+        snap['rates'] = {}
+        for key, name in self.rates.items():
+            delta = snap['totals'].get(name, 0) - previous['totals'].get(name, 0)
+            snap['rates'][key] = delta / elapsed
+
+        self.previous = snap
+
+        return snap
+
+    def write_snapshot(self):
+        """
+        Write a snapshot in the JSON file (replaced atomically)
+        """
+
+        tmp = self.snapshot_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.replace(tmp, self.snapshot_file)
+
+    def write_snapshots(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write_snapshot()
+            except IOError as e:
+                print('---------------------------------------------------------------------')
+                print('')
+                print('ERROR WITH THE METRICS SNAPSHOT: {}'.format(e))
+                print('---------------------------------------------------------------------')
+                print('')
+
+
+def metric_key(name, labels):
+    """
+    Key of a metric in the dicts of Metrics
+
+    :param name: Name of the metric
+    :param labels: Dict of the labels
+    :return: (name, sorted tuple of (key, value as str))
+    """
+
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def resident_memory():
+    """
+    Resident memory of the process
+
+    :return: Size in bytes (the peak on the systems without /proc)
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, ValueError):
+        # In kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_labels(labels):
+    """
+    Labels in the text format of Prometheus
+
+    :param labels: Tuple of (key, value)
+    :return: str
+    """
+
+    if len(labels) == 0:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
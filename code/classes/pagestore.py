@@ -0,0 +1,501 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import threading
+import sqlite3
+import time
+import zlib
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def open_store(data_folder):
+    """
+    Open the page store of a data folder. If the folder contains a packed store (folder store), it is used.
+    Otherwise, the pages are the HTML files in the data folder.
+
+    :param data_folder: Folder with the data
+    :return: FilePageStore or PackedPageStore
+    """
+
+    if os.path.exists(data_folder + 'store/index.sqlite'):
+        return PackedPageStore(data_folder + 'store/')
+    else:
+        return FilePageStore(data_folder)
+
+
+class FilePageStore:
+    """
+    One HTML file per page in the data folder (e.g. beers/{brewery_id}/{beer_id}/{start}.html)
+
+    The key of a page is its path relative to the data folder.
+    """
+
+    def __init__(self, data_folder):
+        """
+        Initialize the class
+
+        :param data_folder: Folder with the data
+        """
+
+        self.data_folder = data_folder
+
+    def put(self, key, content, fetched_at=None):
+        """
+        Save a page
+
+        :param key: Key of the page
+        :param content: Content of the page (bytes)
+        :param fetched_at: Time of the fetch (not used, it's the time of modification of the file)
+        """
+
+        folder = os.path.dirname(self.data_folder + key)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        with open(self.data_folder + key, 'wb') as output:
+            output.write(content)
+
+    def writer(self, key, fetched_at=None):
+        """
+        Save a page chunk by chunk. The page is written in a temporary file that replaces the page when the writer
+        is closed, such that an interrupted download never leaves a truncated page.
+
+        :param key: Key of the page
+        :param fetched_at: Time of the fetch (not used, it's the time of modification of the file)
+        :return: Writer with the methods write(chunk), close() and abort()
+        """
+
+        folder = os.path.dirname(self.data_folder + key)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        return _FileWriter(self.data_folder + key)
+
+    def get(self, key):
+        """
+        Get a page
+
+        :param key: Key of the page
+        :return: Content of the page (bytes)
+        """
+
+        with open(self.data_folder + key, 'rb') as input_:
+            return input_.read()
+
+    def size(self, key):
+        """
+        Size of a page
+
+        :param key: Key of the page
+        :return: Size in bytes or None if the page does not exist
+        """
+
+        try:
+            return os.stat(self.data_folder + key).st_size
+        except OSError:
+            return None
+
+    def list(self, prefix):
+        """
+        List the names directly under a prefix (like os.listdir)
+
+        :param prefix: Prefix ending with a '/' (e.g. 'places/')
+        :return: List of names
+        """
+
+        # The temporary files of the writers are not pages
+        return [name for name in os.listdir(self.data_folder + prefix) if not name.endswith('.part')]
+
+    def fetched_at(self, key):
+        """
+        Time of the fetch of a page
+
+        :param key: Key of the page
+        :return: UNIX timestamp
+        """
+
+        return os.path.getmtime(self.data_folder + key)
+
+    def close(self):
+        pass
+
+
+class PackedPageStore:
+    """
+    Append-only packed store
+
+    The pages are compressed one by one (zstd with a dictionary trained on BeerAdvocate pages if the package
+    zstandard is installed, zlib otherwise) and appended to large segment files. An index in SQLite gives the segment,
+    the offset and the length of each page. A page written twice is appended again and the index points to the new
+    version.
+
+    Each store that writes (each process, e.g. the shards of shard_crawl.py) appends to its own segments. The numbers
+    of the segments are given by the table segments of the index, such that two writers never append to the same file
+    and the offsets in the index are always the ones of their writer. The segments are only created at the first
+    write, the processes that only read (e.g. the parser) do not create any.
+    """
+
+    def __init__(self, folder, segment_size=2 ** 30, codec=None, level=3):
+        """
+        Initialize the class
+
+        :param folder: Folder of the store
+        :param segment_size: Size in bytes after which a new segment is started
+        :param codec: 'zstd' or 'zlib' (default: zstd if available). Only used when the store is created.
+        :param level: Compression level
+        """
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.folder = folder
+        self.segment_size = segment_size
+        self.level = level
+        self.lock = threading.Lock()
+
+        # Other processes may write in the index at the same time
+        self.db = sqlite3.connect(folder + 'index.sqlite', check_same_thread=False, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                        'key TEXT PRIMARY KEY, '
+                        'segment INTEGER NOT NULL, '
+                        'offset INTEGER NOT NULL, '
+                        'length INTEGER NOT NULL, '
+                        'size INTEGER NOT NULL, '
+                        'fetched_at REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+
+        # Segments given to the writers (the ones of the stores created before this table are added once)
+        tables = [name for name, in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if 'segments' not in tables:
+            self.db.execute('CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, opened_at REAL)')
+            self.db.execute('INSERT OR IGNORE INTO segments SELECT DISTINCT segment, NULL FROM pages')
+        self.db.commit()
+
+        # The codec is chosen once for all when the store is created
+        res = self.db.execute("SELECT value FROM meta WHERE name = 'codec'").fetchone()
+        if res is None:
+            if codec is None:
+                codec = 'zstd' if zstandard is not None else 'zlib'
+            self.db.execute("INSERT INTO meta VALUES ('codec', ?)", (codec,))
+            self.db.commit()
+        else:
+            codec = res[0]
+
+        if codec == 'zstd' and zstandard is None:
+            raise ImportError('The package zstandard is needed to read this store')
+
+        self.codec = codec
+
+        self.dictionary = None
+        if os.path.exists(folder + 'dictionary.zstd'):
+            with open(folder + 'dictionary.zstd', 'rb') as input_:
+                self.dictionary = zstandard.ZstdCompressionDict(input_.read())
+        self._init_codec()
+
+        # Segment of this store where the new pages are appended (opened at the first write)
+        self.segment = None
+        self.output = None
+
+        # Open segments for reading (one per thread since they are shared with seek)
+        self.local = threading.local()
+
+    def _init_codec(self):
+        if self.codec == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self.decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionary)
+
+    def train_dictionary(self, samples, dict_size=112640):
+        """
+        Train the zstd dictionary on some pages. It has to be done before the first page is written.
+
+        :param samples: List of pages (bytes)
+        :param dict_size: Size of the dictionary in bytes
+        """
+
+        if self.codec != 'zstd':
+            return
+
+        self.dictionary = zstandard.train_dictionary(dict_size, samples)
+
+        with open(self.folder + 'dictionary.zstd', 'wb') as output:
+            output.write(self.dictionary.as_bytes())
+
+        self._init_codec()
+
+    def segment_file(self, segment):
+        return self.folder + 'segment_{:05d}.pack'.format(segment)
+
+    def _new_segment(self):
+        """
+        Start a new segment that only this store writes
+
+        :return: Number of the segment
+        """
+
+        # One statement, such that two processes never get the same segment
+        segment = self.db.execute('INSERT INTO segments VALUES '
+                                  '((SELECT COALESCE(MAX(segment), -1) + 1 FROM segments), ?) RETURNING segment',
+                                  (time.time(),)).fetchone()[0]
+        self.db.commit()
+
+        if self.output is not None:
+            self.output.close()
+
+        self.segment = segment
+        self.output = open(self.segment_file(segment), 'ab')
+
+        return segment
+
+    def compress(self, content):
+        if self.codec == 'zstd':
+            return self.compressor.compress(content)
+        else:
+            return zlib.compress(content, self.level)
+
+    def compressobj(self):
+        # One compressor per writer since the writers can be used by several threads at the same time
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary).compressobj()
+        else:
+            return zlib.compressobj(self.level)
+
+    def decompress(self, data):
+        if self.codec == 'zstd':
+            # The pages saved by a writer do not have their size in the header of the frame
+            return self.decompressor.decompressobj().decompress(data)
+        else:
+            return zlib.decompress(data)
+
+    def put(self, key, content, fetched_at=None, commit=True):
+        """
+        Save a page
+
+        :param key: Key of the page
+        :param content: Content of the page (bytes)
+        :param fetched_at: Time of the fetch (default: now)
+        :param commit: Commit the index now (for bulk writes, set it to False and call commit() from time to time)
+        """
+
+        self._append(key, self.compress(content), len(content), fetched_at, commit)
+
+    def put_record(self, key, data, size, fetched_at, commit=True):
+        """
+        Save a page already compressed by a store with the same codec and dictionary (see get_record)
+
+        :param key: Key of the page
+        :param data: Compressed page
+        :param size: Size of the page before compression
+        :param fetched_at: Time of the fetch
+        :param commit: Commit the index now
+        """
+
+        self._append(key, data, size, fetched_at, commit)
+
+    def writer(self, key, fetched_at=None):
+        """
+        Save a page chunk by chunk. The chunks are compressed as they arrive and the page is appended to the segment
+        when the writer is closed. Only the compressed page is kept in memory.
+
+        :param key: Key of the page
+        :param fetched_at: Time of the fetch (default: when the writer is closed)
+        :return: Writer with the methods write(chunk), close() and abort()
+        """
+
+        return _PackedWriter(self, key, fetched_at)
+
+    def _append(self, key, data, size, fetched_at=None, commit=True):
+        """
+        Append a compressed page to the segment and index it
+
+        :param key: Key of the page
+        :param data: Compressed page
+        :param size: Size of the page before compression
+        :param fetched_at: Time of the fetch (default: now)
+        :param commit: Commit the index now
+        """
+
+        if fetched_at is None:
+            fetched_at = time.time()
+
+        with self.lock:
+            if self.output is None or (self.output.tell() + len(data) > self.segment_size and self.output.tell() > 0):
+                self._new_segment()
+
+            offset = self.output.tell()
+            self.output.write(data)
+            # The data is on disk before the index points to it
+            self.output.flush()
+
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, self.segment, offset, len(data), size, fetched_at))
+            if commit:
+                self.db.commit()
+
+    def commit(self):
+        """
+        Commit the index
+        """
+
+        with self.lock:
+            if self.output is not None:
+                self.output.flush()
+            self.db.commit()
+
+    def get(self, key):
+        """
+        Get a page
+
+        :param key: Key of the page
+        :return: Content of the page (bytes)
+        """
+
+        return self.decompress(self.get_record(key)[0])
+
+    def get_record(self, key):
+        """
+        Get a page without decompressing it (e.g. to copy it in another store, see put_record)
+
+        :param key: Key of the page
+        :return: (compressed page, size of the page, time of the fetch)
+        """
+
+        with self.lock:
+            res = self.db.execute('SELECT segment, offset, length, size, fetched_at FROM pages WHERE key = ?',
+                                  (key,)).fetchone()
+
+        if res is None:
+            raise FileNotFoundError(key)
+
+        segment, offset, length, size, fetched_at = res
+
+        files = getattr(self.local, 'files', None)
+        if files is None:
+            files = self.local.files = {}
+        if segment not in files:
+            files[segment] = open(self.segment_file(segment), 'rb')
+
+        file = files[segment]
+        file.seek(offset)
+        return file.read(length), size, fetched_at
+
+    def size(self, key):
+        """
+        Size of a page
+
+        :param key: Key of the page
+        :return: Size in bytes (uncompressed) or None if the page does not exist
+        """
+
+        with self.lock:
+            res = self.db.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+
+        return None if res is None else res[0]
+
+    def list(self, prefix):
+        """
+        List the names directly under a prefix (like os.listdir)
+
+        :param prefix: Prefix ending with a '/' (e.g. 'places/')
+        :return: List of names (sorted, such that the steps that go through them always give the same order)
+        """
+
+        with self.lock:
+            keys = self.db.execute('SELECT key FROM pages WHERE key > ? AND key < ?', (prefix, prefix + '\uffff'))
+            names = set(key[len(prefix):].split('/')[0] for key, in keys)
+
+        return sorted(names)
+
+    def fetched_at(self, key):
+        """
+        Time of the fetch of a page
+
+        :param key: Key of the page
+        :return: UNIX timestamp
+        """
+
+        with self.lock:
+            res = self.db.execute('SELECT fetched_at FROM pages WHERE key = ?', (key,)).fetchone()
+
+        if res is None:
+            raise FileNotFoundError(key)
+
+        return res[0]
+
+    def keys(self):
+        """
+        All the keys, in the order of the segments (for sequential reads)
+
+        :return: List of keys
+        """
+
+        with self.lock:
+            return [key for key, in self.db.execute('SELECT key FROM pages ORDER BY segment, offset')]
+
+    def close(self):
+        """
+        Close the files and the index
+        """
+
+        self.commit()
+        if self.output is not None:
+            self.output.close()
+        for file in getattr(self.local, 'files', {}).values():
+            file.close()
+        self.db.close()
+
+
+class _FileWriter:
+    """
+    Writer of a page of a FilePageStore
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.output = open(filename + '.part', 'wb')
+
+    def write(self, chunk):
+        self.output.write(chunk)
+
+    def close(self):
+        self.output.close()
+        os.replace(self.filename + '.part', self.filename)
+
+    def abort(self):
+        self.output.close()
+        os.remove(self.filename + '.part')
+
+
+class _PackedWriter:
+    """
+    Writer of a page of a PackedPageStore
+    """
+
+    def __init__(self, store, key, fetched_at=None):
+        self.store = store
+        self.key = key
+        self.fetched_at = fetched_at
+        self.compressor = store.compressobj()
+        self.chunks = []
+        self.size = 0
+
+    def write(self, chunk):
+        self.chunks.append(self.compressor.compress(chunk))
+        self.size += len(chunk)
+
+    def close(self):
+        self.chunks.append(self.compressor.flush())
+        self.store._append(self.key, b''.join(self.chunks), self.size, self.fetched_at)
+
+    def abort(self):
+        self.chunks = []
@@ -5,12 +5,21 @@
 #
 # Distributed under terms of the MIT license.
 
-from classes.helpers import parse
+from classes.pagestore import open_store
+from classes.extract import Extractor
+from classes.frontier import Frontier
+from classes.dedup import RatingIndex
+from classes.columnar import ColumnarWriter, convert
+from classes.blocks import BlockWriter, extensions, output_file
+from classes.users import UserStats, users_from_file
+from classes.metrics import Metrics
+from classes.tracing import Tracer
+import multiprocessing
 import pandas as pd
 import numpy as np
 import datetime
+import json
 import time
-import gzip
 import re
 import os
 
@@ -20,11 +29,22 @@ class Parser:
     Parser for BeerAdvocate website
     """
 
-    def __init__(self, data_folder=None):
+    def __init__(self, data_folder=None, metrics=None, tracer=None, processes=1, backend='regex', index=None,
+                 columnar=None, codec='gzip', level=None):
         """
         Initialize the class
         
         :param data_folder: Folder to save the data
+        :param metrics: Metrics where the pages parsed and the records written are counted
+        :param tracer: Tracer for the spans of the parse steps (default: no tracing)
+        :param processes: Number of processes parsing the beers in the step 11 (None for the number of CPUs)
+        :param backend: Backend of the extraction of the fields, 'regex' or 'dom' (needs lxml, see Extractor)
+        :param index: RatingIndex of the ratings written by the step 11 (default: in memory)
+        :param columnar: Also write the ratings and the reviews in typed columnar files, 'parquet' or 'arrow' (needs
+                         pyarrow, see ColumnarWriter). None to only write the txt.gz files.
+        :param codec: Compression of the files of ratings and reviews, 'gzip' (ratings.txt.gz), 'zstd' (.zst, needs
+                      zstandard), 'lz4' (.lz4, needs lz4) or 'none' (ratings.txt), see BlockWriter
+        :param level: Level of compression (default: the one of the codec in BlockWriter)
         """
 
         if data_folder is None:
@@ -32,6 +52,51 @@ class Parser:
         else:
             self.data_folder = data_folder
 
+        # Where the crawler saved the pages
+        self.store = open_store(self.data_folder)
+
+        if metrics is None:
+            self.metrics = Metrics()
+        else:
+            self.metrics = metrics
+
+        if tracer is None:
+            self.tracer = Tracer()
+        else:
+            self.tracer = tracer
+
+        if processes is None:
+            self.processes = multiprocessing.cpu_count()
+        else:
+            self.processes = processes
+
+        self.extractor = Extractor(backend)
+
+        if columnar is not None and columnar not in ColumnarWriter.formats:
+            raise ValueError('Unknown columnar format {} (one of {})'.format(columnar,
+                                                                          ', '.join(ColumnarWriter.formats)))
+        self.columnar = columnar
+
+        if codec not in extensions:
+            raise ValueError('Unknown codec {} (one of {})'.format(codec, ', '.join(sorted(extensions))))
+        self.codec = codec
+        self.level = level
+
+        # Only one rating per user and per beer
+        if index is None:
+            self.index = RatingIndex()
+        else:
+            self.index = index
+
+        # Users of the ratings written by the step 11 (users.csv)
+        self.users = UserStats()
+
+        # Frontier of the crawler, used to know when the pages were fetched
+        if os.path.exists(self.data_folder + 'misc/frontier.sqlite'):
+            self.frontier = Frontier(self.data_folder + 'misc/frontier.sqlite')
+        else:
+            self.frontier = None
+
         self.special_places = ['Canada', 'United States', 'United Kingdom']
 
         self.country_to_change = {'Korea (North)': 'North Korea',
@@ -89,9 +154,9 @@ class Parser:
         if not os.path.exists(folder):
             os.makedirs(folder)
 
-        folder = self.data_folder + 'places/'
+        folder = 'places/'
 
-        list_ = os.listdir(folder)
+        list_ = self.store.list(folder)
 
         json_brewery = {'name': [], 'id': [], 'location': []}
 
@@ -100,7 +165,7 @@ class Parser:
             # Check if the country is in the list of special countries
             if country not in self.special_places:
                 # Get all the files
-                files = os.listdir(folder + country)
+                files = self.store.list(folder + country + '/')
 
                 place = country
                 # Change name of the country to a more convenient one
@@ -110,36 +175,34 @@ class Parser:
                 # Go through all the files
                 for file_ in files:
                     # Open them ...
-                    html = open(folder + country + '/' + file_, 'rb').read().decode('utf8')
+                    html = self.store.get(folder + country + '/' + file_).decode('utf8')
+                    self.metrics.inc('ba_pages_parsed_total', step=3)
 
                     # ... and parse them
-                    str_ = '<a href="/beer/profile/(\d+)/"><b>(.+?)</b>'
-
-                    grp = re.finditer(str_, str(html))
+                    breweries = self.extractor.extract('place_list', html)['breweries']
 
                     # Put info in JSON
-                    for g in grp:
-                        json_brewery['id'].append(int(g.group(1)))
-                        json_brewery['name'].append(g.group(2))
+                    for brewery in breweries:
+                        json_brewery['id'].append(int(brewery['id']))
+                        json_brewery['name'].append(brewery['name'])
                         json_brewery['location'].append(place)
 
             else:
                 # Get the list of regions
-                list_2 = os.listdir(folder + country)
+                list_2 = self.store.list(folder + country + '/')
                 # Go through all regions
                 for region in list_2:
                     # Get all the files
-                    files = os.listdir(folder + country + '/' + region)
+                    files = self.store.list(folder + country + '/' + region + '/')
 
                     # Go through all the files
                     for file_ in files:
                         # Open them ...
-                        html = open(folder + country + '/' + region + '/' + file_, 'rb').read().decode('utf8')
+                        html = self.store.get(folder + country + '/' + region + '/' + file_).decode('utf8')
+                        self.metrics.inc('ba_pages_parsed_total', step=3)
 
                         # ... and parse them
-                        str_ = '<a href="/beer/profile/(\d+)/"><b>(.+?)</b>'
-
-                        grp = re.finditer(str_, str(html))
+                        breweries = self.extractor.extract('place_list', html)['breweries']
 
                         if country == 'United States':
                             place = country + ', ' + region
@@ -151,9 +214,9 @@ class Parser:
                             place = region
 
                         # Put info in JSON
-                        for g in grp:
-                            json_brewery['id'].append(int(g.group(1)))
-                            json_brewery['name'].append(g.group(2))
+                        for brewery in breweries:
+                            json_brewery['id'].append(int(brewery['id']))
+                            json_brewery['name'].append(brewery['name'])
                             json_brewery['location'].append(place)
 
         # Transform into pandas DF
@@ -179,27 +242,26 @@ class Parser:
 
         df = pd.read_csv(self.data_folder + 'parsed/breweries.csv')
 
-        folder = self.data_folder + 'breweries/'
+        folder = 'breweries/'
 
         # Files inside the folder breweries
-        list_ = os.listdir(folder)
+        list_ = self.store.list(folder)
 
         # Files already treated
-        files = [str(df.ix[i]['id']) + '.html' for i in df.index]
+        files = [str(df.loc[i]['id']) + '.html' for i in df.index]
 
         # Missing files
         missing = list(set(list_) - set(files))
 
-        json_missing = {'name': [], 'id': [], 'place': []}
+        json_missing = {'name': [], 'id': [], 'location': []}
         for file_ in missing:
-            html = open(folder + file_, 'rb').read().decode('utf8')
+            html = self.store.get(folder + file_).decode('utf8')
+            self.metrics.inc('ba_pages_parsed_total', step=6)
 
             # Find the name of the brewery
-            str_ = '<h1>(.+?)</h1>'
-
-            grp = re.search(str_, str(html))
-            name = grp.group(1)
+            name = self.extractor.extract('brewery', html, ['name'])['name']
 
+            # The location is still found with the regexes (the address is not structured)
             try:
                 # Find the country
                 str_ = '<br><a href="/place/directory/(\d+)/(.+?)/">(.+?)</a>\s*<br><br>'
@@ -255,7 +317,7 @@ class Parser:
         df_missing = pd.DataFrame(json_missing)
 
         # Append to the original one
-        df = df.append(df_missing, ignore_index=True)
+        df = pd.concat([df, df_missing], ignore_index=True)
 
         # Save it
         df.to_csv(self.data_folder + 'parsed/breweries.csv', index=False)
@@ -275,28 +337,24 @@ class Parser:
         # Load the DF
         df = pd.read_csv(self.data_folder + 'parsed/breweries.csv')
 
-        folder = self.data_folder + 'breweries/'
+        folder = 'breweries/'
 
         nbr_beers = []
         # Go through all the breweries
         for i in df.index:
-            id_ = df.ix[i]['id']
-            html = open(folder + str(id_) + '.html', 'rb').read().decode('utf8')
-
-            # Get current number of beers
-            str1 = 'Current \((\d+)\)'
-            grp = re.search(str1, str(html))
-            nbr1 = int(grp.group(1))
+            id_ = df.loc[i]['id']
+            html = self.store.get(folder + str(id_) + '.html').decode('utf8')
+            self.metrics.inc('ba_pages_parsed_total', step=7)
 
-            # Get archived
-            str2 = 'Arch \((\d+)\)'
-            grp = re.search(str2, str(html))
-            nbr2 = int(grp.group(1))
+            # Get current and archived number of beers
+            values = self.extractor.extract('brewery', html, ['nbr_current', 'nbr_archived'])
+            nbr1 = int(values['nbr_current'])
+            nbr2 = int(values['nbr_archived'])
 
             nbr_beers.append(nbr1 + nbr2)
 
         # Add to the DF
-        df.loc[:, 'nbr_beers'] = nbr_beers
+        df['nbr_beers'] = nbr_beers
 
         # Save it again
         df.to_csv(self.data_folder + 'parsed/breweries.csv', index=False)
@@ -319,35 +377,27 @@ class Parser:
         # Only get the breweries with at least 1 beer
         df = df[df['nbr_beers'] > 0]
 
-        folder = self.data_folder + 'breweries/'
+        folder = 'breweries/'
 
         # Prepare the json for the DF
         json_beers = {'beer_name': [], 'brewery_name': [], 'beer_id': [], 'brewery_id': [], 'style': []}
 
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
             file_ = folder + str(row['id']) + '.html'
             # Open the HTML
-            html = open(file_, 'rb').read().decode('utf8')
-
-            # Get the brewery name
-            str_ = '<h1>(.+?)</h1>'
-            grp = re.search(str_, str(html))
-            brewery = grp.group(1)
-
-            # Get all the other info
-            str_ = '<a href="/beer/profile/(\d+)/(\d+)/"><b>(.+?)</b></a></td><td valign=top class="hr_bottom_light">' \
-                   '<a href="/beer/style/(\d+)/">(.+?)</a></td><td align="left" valign="top" class="hr_bottom_light">' \
-                   '<span style="color: #999999; font-weight: bold;">(.+?)</span></td><td align="left" valign="top" ' \
-                   'class="hr_bottom_light"><b>(.+?)</b></td><td align="left" valign="top" class="hr_bottom_' \
-                   'light">(.+?)</td>'
-            grp = re.finditer(str_, str(html))
-            for g in grp:
-                json_beers['beer_name'].append(g.group(3))
-                json_beers['brewery_name'].append(brewery)
-                json_beers['beer_id'].append(g.group(2))
-                json_beers['brewery_id'].append(g.group(1))
-                json_beers['style'].append(g.group(5))
+            html = self.store.get(file_).decode('utf8')
+            self.metrics.inc('ba_pages_parsed_total', step=8)
+
+            # Get the brewery name and all the other info
+            values = self.extractor.extract('brewery', html, ['name', 'beers'])
+
+            for beer in values['beers']:
+                json_beers['beer_name'].append(beer['beer_name'])
+                json_beers['brewery_name'].append(values['name'])
+                json_beers['beer_id'].append(beer['beer_id'])
+                json_beers['brewery_id'].append(beer['brewery_id'])
+                json_beers['style'].append(beer['style'])
 
         # Transform JSON in pandas DF
         df_beers = pd.DataFrame(json_beers)
@@ -361,18 +411,25 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_beer_files_for_information(self):
+    def parse_beer_files_for_information(self, only_changed=False):
         """
         STEP 10
 
         Parse the beer files to get some information on the beers
 
         !!! Make sure step 9 was done with the crawler !!!
+
+        :param only_changed: Only parse the pages that changed during the last refresh of the step 9. The information
+                             of the other beers is kept from the CSV file.
         """
 
         # Load the DF
         df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
 
+        changed = None
+        if only_changed and 'nbr_ratings' in df.columns:
+            changed = self.changed_files(9)
+
         nbr_ratings = []
         nbr_reviews = []
         ba_score = []
@@ -381,103 +438,113 @@ class Parser:
         abv = []
 
         for i in df.index:
-            row = df.ix[i]
-
-            file = self.data_folder + 'beers/{}/{}/0.html'.format(row['brewery_id'], row['beer_id'])
-
-            # Open the file
-            html_txt = open(file, 'rb').read().decode('utf-8')
-
-            if 'BA SCORE' in html_txt:
-
-                # Find number of ratings
-                str_ = '<dt>Ratings:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-ratings">(.+?)</span></dd>'
-
-                grp = re.search(str_, html_txt)
+            row = df.loc[i]
 
-                nbr_rat = int(grp.group(1).replace(',', ''))
+            file = 'beers/{}/{}/0.html'.format(row['brewery_id'], row['beer_id'])
 
-                nbr_ratings.append(nbr_rat)
+            # Keep the information if the page did not change
+            if changed is not None and file not in changed and not pd.isnull(row['nbr_ratings']):
+                nbr_ratings.append(row['nbr_ratings'])
+                nbr_reviews.append(row['nbr_reviews'])
+                avg.append(row['avg'])
+                ba_score.append(row['ba_score'])
+                bros_score.append(row['bros_score'])
+                abv.append(row['abv'])
+                continue
 
-                # Find number of reviews
-                str_ = '<dt>Reviews:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-reviews">(.+?)</span></dd>'
+            # Open the file
+            with self.tracer.span('read', sample=True, file=file):
+                html_txt = self.store.get(file).decode('utf-8')
+            self.metrics.inc('ba_pages_parsed_total', step=10)
 
-                grp = re.search(str_, html_txt)
+            info = self.parse_beer_information(html_txt)
 
-                nbr_rev = int(grp.group(1).replace(',', ''))
+            nbr_ratings.append(info['nbr_ratings'])
+            nbr_reviews.append(info['nbr_reviews'])
+            avg.append(info['avg'])
+            ba_score.append(info['ba_score'])
+            bros_score.append(info['bros_score'])
+            abv.append(info['abv'])
 
-                nbr_reviews.append(nbr_rev)
+        # Add the new columns
+        df['nbr_ratings'] = nbr_ratings
+        df['nbr_reviews'] = nbr_reviews
+        df['avg'] = avg
+        df['ba_score'] = ba_score
+        df['bros_score'] = bros_score
+        df['abv'] = abv
 
-                # Find the average
-                str_ = 'Avg:</dt>\\n\\t\\t\\t\\t\\t<dd><span class="ba-ravg">(.+?)</span></dd>'
+        # Remove the bad lines
+        df = df[df['nbr_ratings'] > -1]
+        df.index = range(len(df))
 
-                grp = re.search(str_, html_txt)
+        # Save it again
+        df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
 
-                avg_val = float(grp.group(1))
+    def parse_beer_information(self, html_txt):
+        """
+        USED BY STEP 10
 
-                if nbr_rat == 0:
-                    avg_val = np.nan
+        Parse the first page of a beer to get some information on the beer
 
-                avg.append(avg_val)
+        :param html_txt: HTML of the first page of the beer
+        :return: Dict with the nbr_ratings, nbr_reviews, avg, ba_score, bros_score and abv (nbr_ratings is -1 if it's
+                 not the page of a beer)
+        """
 
-                # Find the BA Score
-                str_ = '<b>BA SCORE</b>\\n\\t\\t\\t<br>\\n\\t\\t\\t<span class="BAscore_big ba-score">(.+?)</span>'
+        values = self.extractor.extract('beer', html_txt, ['is_beer', 'nbr_ratings', 'nbr_reviews', 'avg', 'ba_score',
+                                                           'bros_score', 'abv'])
 
-                grp = re.search(str_, html_txt)
+        if values['is_beer'] is not None:
+            info = {}
 
-                try:
-                    ba = float(grp.group(1))
-                except ValueError:
-                    ba = np.nan
+            # Number of ratings
+            nbr_rat = int(values['nbr_ratings'].replace(',', ''))
 
-                ba_score.append(ba)
+            info['nbr_ratings'] = nbr_rat
 
-                # Find the Bros score
-                str_ = '<b>THE BROS</b>\\n\\t\\t\\t<br>\\n\\t\\t\\t<span class="BAscore_big ba-bro_score">(.+?)</span>'
+            # Number of reviews
+            nbr_rev = int(values['nbr_reviews'].replace(',', ''))
 
-                grp = re.search(str_, html_txt)
+            info['nbr_reviews'] = nbr_rev
 
-                try:
-                    bros = float(grp.group(1))
-                except ValueError:
-                    bros = np.nan
+            # The average
+            avg_val = float(values['avg'])
 
-                bros_score.append(bros)
+            if nbr_rat == 0:
+                avg_val = np.nan
 
-                # Find the ABV
-                str_ = '<b>Alcohol by volume \(ABV\):</b> (.+?)\\n\\t\\t<br>'
+            info['avg'] = avg_val
 
-                grp = re.search(str_, html_txt)
+            # The BA Score
+            try:
+                ba = float(values['ba_score'])
+            except ValueError:
+                ba = np.nan
 
-                try:
-                    abv_val = float(grp.group(1).replace('%', ''))
-                except ValueError:
-                    abv_val = np.nan
+            info['ba_score'] = ba
 
-                abv.append(abv_val)
-            else:
+            # The Bros score
+            try:
+                bros = float(values['bros_score'])
+            except ValueError:
+                bros = np.nan
 
-                nbr_ratings.append(-1)
-                nbr_reviews.append(-1)
-                avg.append(np.nan)
-                ba_score.append(np.nan)
-                bros_score.append(np.nan)
-                abv.append(np.nan)
+            info['bros_score'] = bros
 
-        # Add the new columns
-        df.loc[:, 'nbr_ratings'] = nbr_ratings
-        df.loc[:, 'nbr_reviews'] = nbr_reviews
-        df.loc[:, 'avg'] = avg
-        df.loc[:, 'ba_score'] = ba_score
-        df.loc[:, 'bros_score'] = bros_score
-        df.loc[:, 'abv'] = abv
+            # The ABV
+            try:
+                abv_val = float(values['abv'].replace('%', ''))
+            except ValueError:
+                abv_val = np.nan
 
-        # Remove the bad lines
-        df = df[df['nbr_ratings'] > -1]
-        df.index = range(len(df))
+            info['abv'] = abv_val
+        else:
+            # Not a page of a beer (the bad lines are removed from beers.csv)
+            info = {'nbr_ratings': -1, 'nbr_reviews': -1, 'avg': np.nan, 'ba_score': np.nan, 'bros_score': np.nan,
+                    'abv': np.nan}
 
-        # Save it again
-        df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
+        return info
 
     ########################################################################################
     ##                                                                                    ##
@@ -485,7 +552,7 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_beer_files_for_reviews(self):
+    def parse_beer_files_for_reviews(self, processes=None, chunk_size=8):
         """
         STEP 11
 
@@ -500,224 +567,472 @@ class Parser:
         To follow the rules of BeerAdvocate, we create two files. One with all the ratings and one only with the
         reviews. A rating is considered as a review if the text has at least 150 characters.
 
+        With several processes, the beers are parsed by a pool of processes and their records come back in the order
+        of beers.csv, such that the files are the same as with one process. The numbers of ratings and reviews of
+        beers.csv are corrected at the end.
+
+        A user has only one rating per beer: the ratings found twice (e.g. when a rating is added while the pages of
+        the beer are crawled) are removed with the index of the parser and counted in the metric
+        ba_duplicates_total. The processes only parse, the duplicates are removed in the main process.
+
+        The files are compressed by blocks on several threads with the codec of the parser (see BlockWriter).
+
+        The users of the ratings written are counted at the same time (see UserStats) and users.csv is written at the
+        end, such that the step 12 has nothing to do.
+
+        With the option columnar of the parser, the same records are also written with their types in
+        ratings.parquet and reviews.parquet (or .arrow), see ColumnarWriter.
+
+        :param processes: Number of processes parsing the beers (default: the one of the parser)
+        :param chunk_size: Number of beers sent at once to a process
         """
 
+        if processes is None:
+            processes = self.processes
+
         # Open the DF
         df = pd.read_csv(self.data_folder + '/parsed/beers.csv')
 
         # Drop duplicates. No idea why they're here.
         df = df.drop_duplicates('beer_id', keep='first')
 
-        # Open the GZIP file
-        f_ratings = gzip.open(self.data_folder + 'parsed/ratings.txt.gz', 'wb')
-        f_reviews = gzip.open(self.data_folder + 'parsed/reviews.txt.gz', 'wb')
+        # Open the output files (compressed by blocks on several threads)
+        f_ratings = self.open_output('ratings.txt')
+        f_reviews = self.open_output('reviews.txt')
 
-        # Go through all the beers
-        for i in df.index:
-            row = df.ix[i]
+        columnar_ratings = None
+        columnar_reviews = None
+        if self.columnar is not None:
+            columnar_ratings = ColumnarWriter(self.data_folder + 'parsed/ratings.' + self.columnar, True)
+            columnar_reviews = ColumnarWriter(self.data_folder + 'parsed/reviews.' + self.columnar, False)
+
+        # The file is written again from scratch
+        self.index.clear()
+        self.users = UserStats()
+
+        # Fields of the beers used in the records (lighter than the rows to send to the processes)
+        columns = ['beer_name', 'beer_id', 'brewery_name', 'brewery_id', 'style', 'abv', 'nbr_ratings']
+        beers = df[columns].to_dict('records')
+
+        pool = None
+        if processes == 1:
+            results = (self.parse_beer_reviews(beer) for beer in beers)
+        else:
+            pool = multiprocessing.Pool(processes, _init_worker,
+                                        (self.data_folder, self.extractor.backend, self.columnar))
+            # imap gives the results in the order of the beers
+            results = pool.imap(_parse_beer_reviews, beers, chunk_size)
+
+        count_rat = []
+        count_rev = []
+        try:
+            for beer, (records, nbr_pages) in zip(beers, results):
+                ratings = []
+                reviews = []
+                for user_id, user_name, date, body, review, values in records:
+                    # Only one rating per user and per beer
+                    if not self.index.add(user_id, beer['beer_id']):
+                        continue
+
+                    self.users.add(user_name, user_id, review, date)
+
+                    # The same body in both files
+                    if review:
+                        ratings.append(body + b'review: True\n\n')
+                        reviews.append(body + b'\n')
+                    else:
+                        ratings.append(body + b'review: False\n\n')
+
+                    if columnar_ratings is not None:
+                        columnar_ratings.write(beer, values)
+                        if review:
+                            columnar_reviews.write(beer, values)
+
+                nbr_rat = len(ratings)
+                nbr_rev = len(reviews)
+                if len(records) > nbr_rat:
+                    self.metrics.inc('ba_duplicates_total', len(records) - nbr_rat, step=11, source='pages')
+
+                ratings = b''.join(ratings)
+                reviews = b''.join(reviews)
+
+                with self.tracer.span('write', sample=True, bytes=len(ratings) + len(reviews)):
+                    f_ratings.write(ratings)
+                    f_reviews.write(reviews)
+
+                if pool is not None:
+                    # Counted by the processes in the sequential mode
+                    self.metrics.inc('ba_pages_parsed_total', nbr_pages, step=11)
+                self.metrics.inc('ba_records_written_total', nbr_rat, file=os.path.basename(f_ratings.name))
+                self.metrics.inc('ba_records_written_total', nbr_rev, file=os.path.basename(f_reviews.name))
+
+                count_rat.append(nbr_rat)
+                count_rev.append(nbr_rev)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        f_ratings.close()
+        f_reviews.close()
+        self.index.commit()
+
+        if columnar_ratings is not None:
+            columnar_ratings.close()
+            columnar_reviews.close()
+
+        # If there's a problem in the HTML files, we replace the counts with the numbers we have now
+        for column, counts in [('nbr_ratings', count_rat), ('nbr_reviews', count_rev)]:
+            counts = pd.Series(counts, index=df.index)
+            wrong = df[column] != counts
+            df.loc[wrong, column] = counts[wrong]
+
+        # Save the CSV again
+        df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
+
+        # Users of the ratings (instead of the step 12)
+        self.save_users([self.output('ratings.txt')])
+
+    def parse_beer_reviews(self, beer):
+        """
+        USED BY STEP 11
+
+        Parse all the pages of a beer
+
+        :param beer: Dict (or row) with the beer_name, beer_id, brewery_name, brewery_id, style, abv and nbr_ratings
+                     of the beer
+        :return: (list of (user_id, user_name, date, body of the record (see format_body), True if it's a review,
+                 dict of the rating or None without the option columnar), number of pages). The same user can have
+                 several records, the duplicates are removed by the caller.
+        """
+
+        records = []
+        nbr_pages = 0
+
+        # Check that this beer has at least 1 rating
+        if beer['nbr_ratings'] > 0:
+
+            folder = 'beers/{}/{}/'.format(beer['brewery_id'], beer['beer_id'])
+
+            list_ = self.store.list(folder)
+            list_.sort()
+
+            for file in list_:
+
+                with self.tracer.span('page', sample=True, beer_id=int(beer['beer_id']), file=file):
+                    nbr_pages += 1
+
+                    for rating in self.parse_review_page(folder + file):
 
-            nbr_rat = row['nbr_ratings']
-            nbr_rev = row['nbr_reviews']
-            count_rat = 0
-            count_rev = 0
+                        # Body of the records of the files ratings.txt.gz and reviews.txt.gz
+                        records.append((rating['user_id'], rating['user_name'], rating['date'],
+                                        self.format_body(beer, rating), rating['review'],
+                                        rating if self.columnar is not None else None))
 
-            # Check that this beer has at least 1 rating
-            if row['nbr_ratings'] > 0:
+        return records, nbr_pages
+
+    def parse_review_page(self, file, html_txt=None, fetched_at=None):
+        """
+        USED BY STEP 11
+
+        Parse a page of a beer and get all its ratings
+
+        :param file: File of the page relative to the data folder (key in the store)
+        :param html_txt: HTML of the page (read from the store if None)
+        :param fetched_at: Time when the page was fetched, for the relative dates (default: from the frontier or the
+                           store)
+        :return: Generator of dicts with the user_name, user_id, appearance, aroma, palate, taste, overall, rating,
+                 text, date and review (bool) of each rating
+        """
+
+        if html_txt is None:
+            # Open the file
+            with self.tracer.span('read', file=file) as span:
+                html_txt = self.store.get(file).decode('utf-8')
+                span.set(bytes=len(html_txt))
+
+        self.metrics.inc('ba_pages_parsed_total', step=11)
+
+        # The spans are closed before each yield, such that they do not include the work of the caller
+        with self.tracer.span('extract', page='beer', backend=self.extractor.backend) as span:
+            records = self.extractor.extract('beer', html_txt, ['ratings'])['ratings']
+            span.set(matches=len(records))
+
+        for record in records:
+            # Get username and userid
+            user_name = record['user_name']
+            user_id = record['user_id']
+
+            # Some user have been deleted and leave a weird trace
+            if user_name == '':
+                continue
+
+            # Get the "final" rating
+            rating = float(record['rating'])
+
+            # Check for the ratings of the aspects
+            grp2 = None
+            if record['aspects'] is not None:
+                grp2 = re.search('look: (.+?) \| smell: (.+?) \| taste: (.+?) \| feel: (.+?) \|  overall: (.+)',
+                                 record['aspects'])
+
+            if grp2 is not None:
+                # Get the ratings for the different aspects
+                appearance = float(grp2.group(1))
+                aroma = float(grp2.group(2))
+                taste = float(grp2.group(3))
+                palate = float(grp2.group(4))
+                overall = float(grp2.group(5))
+            else:
+                # Otherwise, they're all nan
+                appearance = np.nan
+                aroma = np.nan
+                taste = np.nan
+                palate = np.nan
+                overall = np.nan
+
+            # Get the date
+            with self.tracer.span('date'):
+                str_date = record['date']
+                try:
+                    year = int(str_date.split(",")[1])
+                    month = time.strptime(str_date[0:3], '%b').tm_mon
+                    day = int(str_date.split(",")[0][4:])
+
+                except IndexError:
+                    # Date written in a different way (ex: Tuesday at XX pm)
+
+                    # Get the day of the week
+                    weekday = str_date.split(' at ')[0]
+
+                    # Get the time when the file was fetched
+                    last_modified = self.fetched_at(file) if fetched_at is None else fetched_at
+
+                    # Get the day of the week when the file was last modified
+                    dt = datetime.datetime.fromtimestamp(last_modified)
+
+                    if weekday == 'Yesterday':
+                        delta = 1
+                    elif weekday == 'Today' or 'hours ago' in weekday or 'minutes ago' in weekday or \
+                                    weekday == 'A moment ago' or 'minute ago' in weekday or \
+                                    'hour ago' in weekday:
+                        delta = 0
+                    else:
+                        # Transform it to number
+                        day_nbr = self.day_to_nbr[weekday]
+
+                        this_day_nbr = dt.weekday()
+
+                        # Compute difference (modulo 7 days)
+                        if day_nbr > this_day_nbr:
+                            delta = this_day_nbr + 7 - day_nbr
+                        else:
+                            delta = this_day_nbr - day_nbr
+
+                    # Get the day when it was posted
+                    day_posted = dt - datetime.timedelta(days=delta)
+                    year = day_posted.year
+                    month = day_posted.month
+                    day = day_posted.day
+
+                date = int(datetime.datetime(year, month, day, 12, 0).timestamp())
+
+            # Check if there's some text
+            if record['text'] is not None and record['characters'] is not None and record['characters'] != '0':
+                # Get the text
+                text = record['text']
+
+                nbr_char = int(record['characters'].replace(',', ''))
+
+                # Clean the text
+                text = re.sub('<[^>]+>', '', text)
+            else:
+                nbr_char = np.nan
+                text = np.nan
+
+            # Check if it's a review
+            is_review = False
+            if nbr_char >= 150:
+                is_review = True
+
+            yield {'user_name': user_name, 'user_id': user_id, 'appearance': appearance, 'aroma': aroma,
+                   'palate': palate, 'taste': taste, 'overall': overall, 'rating': rating, 'text': text,
+                   'date': date, 'review': is_review}
+
+    def write_records(self, f_ratings, f_reviews, row, rating):
+        """
+        USED BY STEP 11
+
+        Write a rating in the file of the ratings and, if it's a review, in the file of the reviews (the body of the
+        record is formatted once for both files)
+
+        :param f_ratings: File of the ratings (e.g. ratings.txt.gz, see open_output)
+        :param f_reviews: File of the reviews
+        :param row: Row of the beer in beers.csv
+        :param rating: Dict of the rating (see parse_review_page)
+        :return: True if it's a review
+        """
 
-                folder = self.data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+        body = self.format_body(row, rating)
 
-                list_ = os.listdir(folder)
-                list_.sort()
+        f_ratings.write(body + 'review: {}\n\n'.format(rating['review']).encode('utf-8'))
+        self.metrics.inc('ba_records_written_total', file=os.path.basename(f_ratings.name))
 
-                list_users = []
+        if rating['review']:
+            f_reviews.write(body + b'\n')
+            self.metrics.inc('ba_records_written_total', file=os.path.basename(f_reviews.name))
+
+        return rating['review']
+
+    def format_body(self, row, rating):
+        """
+        USED BY STEP 11
+
+        Lines of a record that are the same in ratings.txt.gz and reviews.txt.gz (all but the field review and the
+        empty line at the end)
+
+        :param row: Row of the beer in beers.csv
+        :param rating: Dict of the rating (see parse_review_page)
+        :return: bytes
+        """
+
+        lines = ['beer_name: {}'.format(row['beer_name']),
+                 'beer_id: {:d}'.format(row['beer_id']),
+                 'brewery_name: {}'.format(row['brewery_name']),
+                 'brewery_id: {:d}'.format(row['brewery_id']),
+                 'style: {}'.format(row['style']),
+                 'abv: {}'.format(row['abv']),
+                 'date: {:d}'.format(rating['date']),
+                 'user_name: {}'.format(rating['user_name']),
+                 'user_id: {}'.format(rating['user_id']),
+                 'appearance: {}'.format(rating['appearance']),
+                 'aroma: {}'.format(rating['aroma']),
+                 'palate: {}'.format(rating['palate']),
+                 'taste: {}'.format(rating['taste']),
+                 'overall: {}'.format(rating['overall']),
+                 'rating: {:.2f}'.format(rating['rating']),
+                 'text: {}'.format(rating['text'])]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def open_output(self, name, mode='wb'):
+        """
+        Open a file of the folder parsed with the codec of the parser. A new file replaces the files with the same
+        name and another codec (e.g. ratings.txt.gz when ratings.txt.zst is written).
+
+        :param name: Name without the extension of the codec (e.g. ratings.txt)
+        :param mode: 'wb' or 'ab' (to continue an interrupted run)
+        :return: BlockWriter
+        """
+
+        prefix = self.data_folder + 'parsed/' + name
+
+        if mode == 'wb':
+            for codec, extension in extensions.items():
+                if codec != self.codec and os.path.exists(prefix + extension):
+                    os.remove(prefix + extension)
+
+        return BlockWriter(prefix + extensions[self.codec], self.codec, self.level, mode=mode)
+
+    def output(self, name):
+        """
+        File of the folder parsed with any codec
+
+        :param name: Name without the extension of the codec (e.g. ratings.txt)
+        :return: Name of the file relative to the current folder
+        """
+
+        return output_file(self.data_folder + 'parsed/' + name)
+
+    def convert_columnar(self, names=('ratings', 'reviews'), format_=None):
+        """
+        Write some txt.gz files of the folder parsed again in typed columnar files (e.g. ratings.txt.gz in
+        ratings.parquet), for the files of the fused mode, of the incremental step or of an older crawl
+
+        :param names: Names of the files without the extension
+        :param format_: 'parquet' or 'arrow' (default: the option columnar of the parser, or parquet)
+        :return: Dict name -> number of records
+        """
+
+        if format_ is None:
+            format_ = self.columnar or 'parquet'
+
+        counts = {}
+        for name in names:
+            with self.tracer.span('convert', file=name + '.' + format_):
+                counts[name] = convert(self.output(name + '.txt'), self.data_folder + 'parsed/' + name + '.' + format_)
+
+        return counts
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                       Parse the new reviews of the beers                           ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def parse_new_reviews(self, delta=None, known=None):
+        """
+        STEP 11 (INCREMENTAL)
+
+        Parse the pages crawled by Crawler.crawl_new_reviews and save the ratings that are not already in the
+        dataset in the files ratings_new.txt.gz and reviews_new.txt.gz (same format as ratings.txt.gz and
+        reviews.txt.gz).
+
+        :param delta: Folder of the delta (default: the last one)
+        :param known: RatingIndex (or set) of the (user_id, beer_id) already in the dataset (default: the index of the
+                      parser, filled with the file ratings.txt.gz)
+        :return: Number of new ratings
+        """
+
+        if delta is None:
+            delta = 'delta/' + max(self.store.list('delta/')) + '/'
+
+        if known is None:
+            known = self.index
+            known.clear()
+            known.load(self.output('ratings.txt'))
+        elif not isinstance(known, RatingIndex):
+            ratings = known
+            known = RatingIndex()
+            known.update(ratings)
+
+        # Open the DF
+        df = pd.read_csv(self.data_folder + '/parsed/beers.csv')
+        df = df.drop_duplicates('beer_id', keep='first')
+        df.index = df['beer_id']
+
+        # Open the GZIP file
+        f_ratings = self.open_output('ratings_new.txt')
+        f_reviews = self.open_output('reviews_new.txt')
+
+        count = 0
+
+        for brewery_id in self.store.list(delta + 'beers/'):
+            for beer_id in self.store.list(delta + 'beers/{}/'.format(brewery_id)):
+                row = df.loc[int(beer_id)]
+
+                folder = delta + 'beers/{}/{}/'.format(brewery_id, beer_id)
+
+                list_ = self.store.list(folder)
+                list_.sort(key=lambda x: int(x.replace('.html', '')))
 
                 for file in list_:
+                    for rating in self.parse_review_page(folder + file):
+
+                        # Only the new ratings, once per user
+                        if not known.add(rating['user_id'], beer_id, source='delta'):
+                            self.metrics.inc('ba_duplicates_total', step=11, source='delta')
+                            continue
 
-                    # Open the file
-                    html_txt = open(folder + file, 'rb').read().decode('utf-8')
-
-                    # Remove the \n, \r and \t characters
-                    html_txt = html_txt.replace('\r', '').replace('\n', '').replace('\t', '')
-
-                    # Find the ratings without the aspects
-                    str_ = 'alt="Photo of ([^<]*)"></a></div></div><div id="rating_fullview_content_2">' \
-                           '<span class="BAscore_norm">([^<]*)</span><span class="rAvg_norm">/5</span>&nbsp;&nbsp;' \
-                           '(.+?)<br><br>(.+?)<span class="muted"><a href="/community/members/(.+?)/" ' \
-                           'class="username">([^<]*)</a>, <a href="/beer/profile/(\d+)/(\d+)/\?ba=([^#]*)\#review">' \
-                           '(.+?)</a></span>'
-
-                    grp = re.finditer(str_, html_txt)
-
-                    for g in grp:
-                        # Get username and userid
-                        user_name = g.group(6)
-                        user_id = g.group(5)
-
-                        # Some user have been deleted and leave a weird trace
-                        if user_name != '':
-
-                            if user_name in list_users:
-                                add_rev = False
-                            else:
-                                list_users.append(user_name)
-                                add_rev = True
-
-                            # Get the "final" rating
-                            rating = float(g.group(2))
-
-                            # Check for the ratings of the aspects
-                            if 'overall' in g.group(3):
-                                str_2 = '<span class="muted">look: (.+?) \| smell: (.+?) \| taste: (.+?) \| feel: ' \
-                                        '(.+?) \|  overall: (.+?)</span>'
-                                grp2 = re.search(str_2, g.group(3))
-
-                                # Get the ratings for the different aspects
-                                appearance = float(grp2.group(1))
-                                aroma = float(grp2.group(2))
-                                taste = float(grp2.group(3))
-                                palate = float(grp2.group(4))
-                                overall = float(grp2.group(5))
-                            else:
-                                # Otherwise, they're all nan
-                                appearance = np.nan
-                                aroma = np.nan
-                                taste = np.nan
-                                palate = np.nan
-                                overall = np.nan
-
-                            # Get the date
-                            str_date = g.group(10)
-                            try:
-                                year = int(str_date.split(",")[1])
-                                month = time.strptime(str_date[0:3], '%b').tm_mon
-                                day = int(str_date.split(",")[0][4:])
-
-                            except IndexError:
-                                # Date written in a different way (ex: Tuesday at XX pm)
-
-                                # Get the day of the week
-                                weekday = str_date.split(' at ')[0]
-
-                                # Get last time when the file was modified
-                                last_modified = os.path.getmtime(folder + file)
-
-                                # Get the day of the week when the file was last modified
-                                dt = datetime.datetime.fromtimestamp(last_modified)
-
-                                if weekday == 'Yesterday':
-                                    delta = 1
-                                elif weekday == 'Today' or 'hours ago' in weekday or 'minutes ago' in weekday or \
-                                                weekday == 'A moment ago' or 'minute ago' in weekday or \
-                                                'hour ago' in weekday:
-                                    delta = 0
-                                else:
-                                    # Transform it to number
-                                    day_nbr = self.day_to_nbr[weekday]
-
-                                    this_day_nbr = dt.weekday()
-
-                                    # Compute difference (modulo 7 days)
-                                    if day_nbr > this_day_nbr:
-                                        delta = this_day_nbr + 7 - day_nbr
-                                    else:
-                                        delta = this_day_nbr - day_nbr
-
-                                # Get the day when it was posted
-                                day_posted = dt - datetime.timedelta(days=delta)
-                                year = day_posted.year
-                                month = day_posted.month
-                                day = day_posted.day
-
-                            date = int(datetime.datetime(year, month, day, 12, 0).timestamp())
-
-                            # Check if there's some text
-                            if 'characters' in g.group(4) and '>0 characters' not in g.group(4):
-                                str_2 = '(.+?)<br>(.+?)<span class="muted">(.+?) characters</span><br><br><div>'
-                                grp2 = re.search(str_2, g.group(4))
-
-                                try:
-                                    # Get the text
-                                    text = grp2.group(1)
-
-                                    nbr_char = int(grp2.group(3).replace(',', ''))
-
-                                    # Clean the text
-                                    text = re.sub('<[^>]+>', '', text)
-
-                                except AttributeError:
-                                    nbr_char = np.nan
-                                    text = np.nan
-
-                            else:
-                                nbr_char = np.nan
-                                text = np.nan
-
-                            # Check if it's a review
-                            is_review = False
-                            if nbr_char >= 150:
-                                is_review = True
-
-                            if add_rev:
-                                # Write in the file ratings.txt.gz
-                                f_ratings.write('beer_name: {}\n'.format(row['beer_name']).encode('utf-8'))
-                                f_ratings.write('beer_id: {:d}\n'.format(row['beer_id']).encode('utf-8'))
-                                f_ratings.write('brewery_name: {}\n'.format(row['brewery_name']).encode('utf-8'))
-                                f_ratings.write('brewery_id: {:d}\n'.format(row['brewery_id']).encode('utf-8'))
-                                f_ratings.write('style: {}\n'.format(row['style']).encode('utf-8'))
-                                f_ratings.write('abv: {}\n'.format(row['abv']).encode('utf-8'))
-                                f_ratings.write('date: {:d}\n'.format(date).encode('utf-8'))
-                                f_ratings.write('user_name: {}\n'.format(user_name).encode('utf-8'))
-                                f_ratings.write('user_id: {}\n'.format(user_id).encode('utf-8'))
-                                f_ratings.write('appearance: {}\n'.format(appearance).encode('utf-8'))
-                                f_ratings.write('aroma: {}\n'.format(aroma).encode('utf-8'))
-                                f_ratings.write('palate: {}\n'.format(palate).encode('utf-8'))
-                                f_ratings.write('taste: {}\n'.format(taste).encode('utf-8'))
-                                f_ratings.write('overall: {}\n'.format(overall).encode('utf-8'))
-                                f_ratings.write('rating: {:.2f}\n'.format(rating).encode('utf-8'))
-                                f_ratings.write('text: {}\n'.format(text).encode('utf-8'))
-                                f_ratings.write('review: {}\n'.format(is_review).encode('utf-8'))
-
-                                f_ratings.write('\n'.encode('utf-8'))
-
-                                count_rat += 1
-
-                                if is_review:
-                                    # Write in the file reviews.txt.gz
-                                    f_reviews.write('beer_name: {}\n'.format(row['beer_name']).encode('utf-8'))
-                                    f_reviews.write('beer_id: {:d}\n'.format(row['beer_id']).encode('utf-8'))
-                                    f_reviews.write('brewery_name: {}\n'.format(row['brewery_name']).encode('utf-8'))
-                                    f_reviews.write('brewery_id: {:d}\n'.format(row['brewery_id']).encode('utf-8'))
-                                    f_reviews.write('style: {}\n'.format(row['style']).encode('utf-8'))
-                                    f_reviews.write('abv: {}\n'.format(row['abv']).encode('utf-8'))
-                                    f_reviews.write('date: {:d}\n'.format(date).encode('utf-8'))
-                                    f_reviews.write('user_name: {}\n'.format(user_name).encode('utf-8'))
-                                    f_reviews.write('user_id: {}\n'.format(user_id).encode('utf-8'))
-                                    f_reviews.write('appearance: {}\n'.format(appearance).encode('utf-8'))
-                                    f_reviews.write('aroma: {}\n'.format(aroma).encode('utf-8'))
-                                    f_reviews.write('palate: {}\n'.format(palate).encode('utf-8'))
-                                    f_reviews.write('taste: {}\n'.format(taste).encode('utf-8'))
-                                    f_reviews.write('overall: {}\n'.format(overall).encode('utf-8'))
-                                    f_reviews.write('rating: {:.2f}\n'.format(rating).encode('utf-8'))
-                                    f_reviews.write('text: {}\n'.format(text).encode('utf-8'))
-                                    f_reviews.write('\n'.encode('utf-8'))
-
-                                    count_rev += 1
-
-            if count_rat != nbr_rat:
-                # If there's a problem in the HTML file, we replace the count of ratings
-                # with the number we have now.
-                df = df.set_value(i, 'nbr_ratings', count_rat)
-
-            if count_rev != nbr_rev:
-                # If there's a problem in the HTML file, we replace the count of ratings
-                # with the number we have now.
-                df = df.set_value(i, 'nbr_reviews', count_rev)
+                        self.write_records(f_ratings, f_reviews, row, rating)
+                        count += 1
 
         f_ratings.close()
         f_reviews.close()
 
-        # Save the CSV again
-        df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
+        if self.columnar is not None:
+            self.convert_columnar(['ratings_new', 'reviews_new'])
+
+        return count
 
     ########################################################################################
     ##                                                                                    ##
@@ -725,48 +1040,75 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def get_users_from_ratings(self):
+    def get_users_from_ratings(self, force=False, processes=None):
         """
         STEP 12
 
-        Go through the file ratings.txt.gz and get all the users who have rated the beers
+        Get all the users who have rated the beers, with their numbers of ratings and reviews and the dates of their
+        first and last ratings
+
+        The users come from the file of the ratings and from the file of the new ratings of the incremental step (if
+        it exists). The step 11 (and the fused mode) already writes users.csv with the ratings and records the files
+        it was counted from (size and modification time, in misc/users_inputs.json): if the files of the ratings are
+        still the same, there is nothing to do. Otherwise (e.g. with the ratings of an older crawl or after
+        parse_new_reviews), the files of the ratings are read by chunks, the users of each chunk are counted (by
+        several processes) and the counts are merged.
+
+        :param force: Count the users from the files of the ratings even if they did not change
+        :param processes: Number of processes counting the chunks (default: the one of the parser)
         """
 
-        # Load the file ratings.txt.gz in the data/parsed folder
-        iterator = parse(self.data_folder + 'parsed/ratings.txt.gz')
+        if processes is None:
+            processes = self.processes
 
-        users = {}
+        inputs = [self.output('ratings.txt')]
+        if os.path.exists(self.output('ratings_new.txt')):
+            inputs.append(self.output('ratings_new.txt'))
 
-        # Go through the elements in the iterator
-        for item in iterator:
+        if not force and os.path.exists(self.data_folder + 'parsed/users.csv') and \
+                self.users_inputs() == files_state(inputs):
+            return
 
-            # Get the user name
-            user_name = item['user_name']
+        self.users = UserStats()
+        for filename in inputs:
+            with self.tracer.span('users', file=os.path.basename(filename)):
+                self.users.merge(users_from_file(filename, processes))
 
-            # Check if it's in the JSON for the users
-            if user_name not in users.keys():
-                users[user_name] = {'user_id': item['user_id'], 'nbr_ratings': 1, 'nbr_reviews': 0}
-            else:
-                # And update the number of ratings
-                users[user_name]['nbr_ratings'] += 1
+        # Save the CSV
+        self.save_users(inputs)
 
-            # Add the review
-            if item['review'] == 'True':
-                users[user_name]['nbr_reviews'] += 1
+    def save_users(self, inputs):
+        """
+        USED BY STEPS 11 AND 12
 
-        # Prepare the JSON DataFrame
-        json_df = {'user_name': [], 'nbr_ratings': [], 'nbr_reviews': [], 'user_id': []}
-        for key in users.keys():
-            json_df['user_name'].append(key)
-            json_df['nbr_ratings'].append(users[key]['nbr_ratings'])
-            json_df['nbr_reviews'].append(users[key]['nbr_reviews'])
-            json_df['user_id'].append(users[key]['user_id'])
+        Write users.csv with the users of the parser and record the files of ratings they were counted from
 
-        # Transform it into a DF
-        df = pd.DataFrame(json_df)
+        :param inputs: List of files of ratings
+        """
 
-        # Save the CSV
-        df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
+        self.users.save(self.data_folder + 'parsed/users.csv')
+
+        if not os.path.exists(self.data_folder + 'misc'):
+            os.makedirs(self.data_folder + 'misc')
+
+        with open(self.data_folder + 'misc/users_inputs.json', 'w') as f:
+            json.dump(files_state(inputs), f)
+
+    def users_inputs(self):
+        """
+        USED BY STEP 12
+
+        Files of ratings users.csv was counted from (see save_users)
+
+        :return: Dict name -> [size, modification time] or None if they were not recorded
+        """
+
+        filename = self.data_folder + 'misc/users_inputs.json'
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename) as f:
+            return json.load(f)
 
     ########################################################################################
     ##                                                                                    ##
@@ -774,30 +1116,45 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_all_users(self):
+    def parse_all_users(self, only_changed=False):
         """
         STEP 14
 
         Parse all the users to get some information
 
         !!! Make sure step 13 was done with the crawler !!!
+
+        :param only_changed: Only parse the pages that changed during the last refresh of the step 13. The information
+                             of the other users is kept from the CSV file.
         """
 
         # Load the DF of users
         df = pd.read_csv(self.data_folder + 'parsed/users.csv')
 
+        changed = None
+        if only_changed and 'joined' in df.columns:
+            changed = self.changed_files(13)
+
         location = []
         joined = []
 
-        folder = self.data_folder + 'users/'
+        folder = 'users/'
 
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
 
             file = str(row['user_id']) + '.html'
 
+            # Keep the information if the page did not change
+            if changed is not None and folder + file not in changed:
+                location.append(row['location'])
+                joined.append(row['joined'])
+                continue
+
             # Open the file
-            html_txt = open(folder + file, 'rb').read().decode('utf-8')
+            with self.tracer.span('read', sample=True, file=file):
+                html_txt = self.store.get(folder + file).decode('utf-8')
+            self.metrics.inc('ba_pages_parsed_total', step=14)
 
             if "This user's profile is not available." in html_txt:
                 location.append(np.nan)
@@ -814,8 +1171,8 @@ class Parser:
                 location.append(loc)
                 joined.append(join_date)
 
-        df.loc[:, 'joined'] = joined
-        df.loc[:, 'location'] = location
+        df['joined'] = joined
+        df['location'] = location
 
         # Save the CSV again
         df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
@@ -841,10 +1198,10 @@ class Parser:
         location = []
         joined = []
 
-        folder = self.data_folder + 'users/'
+        folder = 'users/'
 
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
 
             if row['location'] != 'MANUAL_CHECK':
                 location.append(row['location'])
@@ -853,7 +1210,8 @@ class Parser:
                 file = str(row['user_id']) + '.html'
 
                 # Open the file
-                html_txt = open(folder + file, 'rb').read().decode('utf-8')
+                html_txt = self.store.get(folder + file).decode('utf-8')
+                self.metrics.inc('ba_pages_parsed_total', step=16)
 
                 # Check if file is still not good
                 if 'This member limits who may view their full profile.' in html_txt \
@@ -867,8 +1225,8 @@ class Parser:
                     location.append(loc)
                     joined.append(join_date)
 
-        df.loc[:, 'joined'] = joined
-        df.loc[:, 'location'] = location
+        df['joined'] = joined
+        df['location'] = location
 
         # Save the CSV again
         df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
@@ -891,12 +1249,11 @@ class Parser:
         :return: location and joining date
         """
 
-        # Get the joining date
-        str_ = '<dt>Joined:</dt><dd>(.+?)</dd></dl>'
+        values = self.extractor.extract('member', html_txt)
 
-        grp = re.search(str_, html_txt.replace('\n', '').replace('\t', ''))
+        # Get the joining date
         try:
-            str_date = grp.group(1).replace(',', '')
+            str_date = values['joined'].replace(',', '')
 
             # Transform into epoch
             month = time.strptime(str_date.split(' ')[0], '%b').tm_mon
@@ -904,14 +1261,14 @@ class Parser:
             year = int(str_date.split(' ')[2])
 
         except ValueError:
-            # Get last time when the file was modified
-            last_modified = os.path.getmtime(folder + file)
+            # Get the time when the file was fetched
+            last_modified = self.fetched_at(folder + file)
 
             # Get the day of the week when the file was last modified
             dt = datetime.datetime.fromtimestamp(last_modified)
 
             # Get the weekday in the profile of the user
-            weekday = grp.group(1)
+            weekday = values['joined']
             if weekday == 'Yesterday':
                 delta = 1
             elif weekday == 'Today':
@@ -938,13 +1295,9 @@ class Parser:
         join_date = date
 
         # Get the location
-        str_ = 'target="_blank" rel="nofollow" itemprop="address" class="concealed">([^<]*)</a></dd></dl>'
-
-        grp = re.search(str_, html_txt)
-
-        try:
-            place = grp.group(1)
+        place = values['location']
 
+        if place is not None:
             place = place.replace('&amp;', '&')
 
             if place == 'District of Columbia':
@@ -966,7 +1319,86 @@ class Parser:
                 place = np.nan
 
             loc = place
-        except AttributeError:
+        else:
             loc = np.nan
 
         return loc, join_date
+
+    def changed_files(self, step):
+        """
+        USED BY STEP 10 AND 14
+
+        Get the pages that changed during the last refresh of a step of the crawler
+
+        :param step: Step of the crawler
+        :return: Set of files or None if the step was never refreshed (all the pages have to be parsed)
+        """
+
+        if self.frontier is None:
+            return None
+
+        return self.frontier.changed(step)
+
+    def fetched_at(self, file):
+        """
+        USED BY STEP 11, 14 AND 16
+
+        Get the time when a page was fetched. It comes from the frontier of the crawler. For the pages crawled
+        without the frontier, it's the time given by the page store.
+
+        :param file: File relative to the data folder (key in the store)
+        :return: UNIX timestamp
+        """
+
+        fetched_at = None
+        if self.frontier is not None:
+            fetched_at = self.frontier.fetched_at(file)
+
+        if fetched_at is None:
+            fetched_at = self.store.fetched_at(file)
+
+        return fetched_at
+
+
+# Parser of a process of the pool of the step 11
+_worker = None
+
+
+def _init_worker(data_folder, backend, columnar):
+    """
+    Open the page store and the frontier in a process of the pool of the step 11
+
+    :param data_folder: Folder with the data
+    :param backend: Backend of the extraction
+    :param columnar: Columnar format of the parser (the processes send the dicts of the ratings)
+    """
+
+    global _worker
+    _worker = Parser(data_folder, backend=backend, columnar=columnar)
+
+
+def _parse_beer_reviews(beer):
+    """
+    Parse all the pages of a beer in a process of the pool of the step 11 (see Parser.parse_beer_reviews)
+
+    :param beer: Dict with the fields of the beer
+    :return: Result of Parser.parse_beer_reviews
+    """
+
+    return _worker.parse_beer_reviews(beer)
+
+
+def files_state(files):
+    """
+    Size and modification time of some files, to know if they changed
+
+    :param files: List of files
+    :return: Dict name -> [size, modification time in ns]
+    """
+
+    state = {}
+    for file in files:
+        stat = os.stat(file)
+        state[os.path.basename(file)] = [stat.st_size, stat.st_mtime_ns]
+
+    return state
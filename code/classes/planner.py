@@ -0,0 +1,261 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.prober import BreweryProber
+import datetime
+import time
+import sys
+
+
+class CrawlPlanner:
+    """
+    Planner of the crawl steps
+
+    For each crawl step, it lists the pages that still have to be crawled (from the CSV files and the frontier) and
+    estimates the number of requests, the number of bytes and the time with the rate and the concurrency of the
+    crawler. The pages with the reviews of the step 9 are known from the number of ratings of each beer (ceil(n/25)
+    pages per beer), once step 10 was done.
+    """
+
+    # Size in bytes of a page when there's no page of the step in the frontier yet
+    default_sizes = {4: 100000, 5: 100000, 9: 120000, 13: 40000, 15: 40000}
+
+    # Bytes downloaded for a probe of the step 5 (the download stops after the Type line)
+    probe_size = 16384
+
+    def __init__(self, crawler, latency=0.5):
+        """
+        Initialize the class
+
+        :param crawler: Crawler with the configuration of the crawl (rate, concurrency, frontier, shard)
+        :param latency: Average time in seconds of a request
+        """
+
+        self.crawler = crawler
+        self.latency = latency
+
+    def tasks(self, step):
+        """
+        All the pages of a step (even the ones already crawled)
+
+        :param step: Step of the crawl (4, 5, 9, 13 or 15)
+        :return: List of (url, file) or (url, file, priority, cost)
+        """
+
+        if step == 4:
+            return self.crawler.brewery_tasks()
+        elif step == 5:
+            prober = BreweryProber(self.crawler)
+            return [(prober.url(id_), None) for id_ in prober.missing_ids()]
+        elif step == 9:
+            return self.crawler.beer_tasks(with_reviews=True)
+        elif step == 13:
+            return self.crawler.user_tasks()
+        elif step == 15:
+            return self.crawler.user_tasks(only_manual_check=True)
+        else:
+            raise ValueError('Step {} is not a crawl step with a frontier'.format(step))
+
+    def pending(self, step, tasks=None):
+        """
+        Pages of a step that still have to be crawled. For the step 5, these are the ids to probe (file None) and the
+        pages of the breweries found by the probes that are not done.
+
+        :param step: Step of the crawl (4, 5, 9, 13 or 15)
+        :param tasks: All the pages of the step (default: self.tasks(step))
+        :return: List of (url, file)
+        """
+
+        if tasks is None:
+            tasks = self.tasks(step)
+
+        done = self.crawler.frontier.urls(step, 'done')
+        in_frontier = self.crawler.frontier.unfinished(step)
+
+        tasks = [task[:2] for task in tasks if task[0] not in done]
+
+        # Pages added by the crawl itself (e.g. the breweries found by the probes)
+        known = set(url for url, _ in tasks)
+        tasks += [(url, file) for url, file in in_frontier if url not in known]
+
+        return tasks
+
+    def page_size(self, step):
+        """
+        Average size of the pages of a step, from the pages already crawled
+
+        :param step: Step of the crawl
+        :return: Size in bytes
+        """
+
+        res = self.crawler.frontier.average_size(step)
+
+        return self.default_sizes.get(step, 50000) if res is None else res
+
+    def throughput(self):
+        """
+        Number of requests per second of the crawler: the concurrency over the latency, capped by the rate
+
+        :return: Requests per second
+        """
+
+        concurrency = 1 if self.crawler.engine is None else self.crawler.engine.concurrency
+
+        throughput = concurrency / self.latency
+
+        # The rate controller goes up to its maximal rate
+        rate = getattr(self.crawler.rate, 'max_rate', self.crawler.rate.rate)
+        if rate is not None:
+            throughput = min(throughput, rate)
+
+        return throughput
+
+    def estimate(self, step):
+        """
+        Estimate the work left for a step
+
+        :param step: Step of the crawl (4, 5, 9, 13 or 15)
+        :return: Dict with the number of pages of the step, the number of requests left, the bytes and the time in
+                 seconds
+        """
+
+        all_tasks = self.tasks(step)
+        tasks = self.pending(step, all_tasks)
+
+        if step == 5:
+            # The probes only download the beginning of the page
+            probes = sum(1 for _, file in tasks if file is None)
+            nbr_bytes = probes * self.probe_size + (len(tasks) - probes) * self.page_size(step)
+        else:
+            nbr_bytes = len(tasks) * self.page_size(step)
+
+        return {'step': step,
+                'pages': len(all_tasks),
+                'requests': len(tasks),
+                'bytes': nbr_bytes,
+                'seconds': len(tasks) / self.throughput()}
+
+    def print_plan(self, steps=(4, 5, 9, 13, 15)):
+        """
+        Print the estimates of some steps
+
+        :param steps: Steps of the crawl
+        :return: List of the estimates
+        """
+
+        estimates = []
+        for step in steps:
+            try:
+                est = self.estimate(step)
+            except (IOError, KeyError) as e:
+                # The CSV files of the previous steps are not there yet
+                print('Step {:2d}: cannot be planned yet ({})'.format(step, e))
+                continue
+
+            print('Step {:2d}: {:d} requests left ({:d} pages), {:.1f} MB, {}'.format(
+                step, est['requests'], est['pages'], est['bytes'] / 1e6,
+                datetime.timedelta(seconds=int(est['seconds']))))
+            estimates.append(est)
+
+        print('At {:.1f} requests/s'.format(self.throughput()))
+
+        return estimates
+
+    def dry_run(self, step, output=sys.stdout):
+        """
+        Print the urls that would be requested by a step, without sending any request
+
+        :param step: Step of the crawl (4, 5, 9, 13 or 15)
+        :param output: File where the urls are written
+        :return: Number of urls
+        """
+
+        tasks = self.pending(step)
+
+        for url, _ in tasks:
+            output.write(url + '\n')
+
+        return len(tasks)
+
+
+class Progress:
+    """
+    Progress line of a crawl step, with the rate and the estimated time to finish it
+    """
+
+    def __init__(self, step, total, done=0, interval=1.0, output=sys.stdout, count=None):
+        """
+        Initialize the class
+
+        :param step: Step of the crawl
+        :param total: Number of pages of the step
+        :param done: Number of pages already done
+        :param interval: Minimal time in seconds between two updates of the line
+        :param output: File where the line is written
+        :param count: Function giving the number of pages of the step, called before each update of the line (for
+                      the steps whose pages are added during the crawl)
+        """
+
+        self.step = step
+        self.count = count
+        self.total = total
+        self.done = done
+        self.interval = interval
+        self.output = output
+
+        self.start = time.time()
+        self.last_print = 0.0
+        self.pages = 0
+        self.bytes = 0
+
+    def update(self, nbr_bytes=0):
+        """
+        One more page
+
+        :param nbr_bytes: Size of the page
+        """
+
+        self.pages += 1
+        self.done += 1
+        self.bytes += nbr_bytes or 0
+
+        if time.time() - self.last_print >= self.interval:
+            self.print()
+
+    def line(self):
+        """
+        Progress line
+
+        :return: str
+        """
+
+        elapsed = max(time.time() - self.start, 1e-6)
+        rate = self.pages / elapsed
+
+        left = max(self.total - self.done, 0)
+        eta = datetime.timedelta(seconds=int(left / rate)) if rate > 0 else '?'
+
+        return 'Step {:d}: {:d}/{:d} pages ({:.1%}), {:.1f} pages/s, {:.2f} MB/s, ETA {}'.format(
+            self.step, self.done, self.total, self.done / self.total if self.total > 0 else 1.0, rate,
+            self.bytes / elapsed / 1e6, eta)
+
+    def print(self):
+        if self.count is not None:
+            self.total = self.count()
+
+        self.last_print = time.time()
+        self.output.write('\r' + self.line())
+        self.output.flush()
+
+    def finish(self):
+        """
+        Print the last line
+        """
+
+        self.print()
+        self.output.write('\n')
+        self.output.flush()
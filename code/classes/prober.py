@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import pandas as pd
+import re
+
+
+class BreweryProber:
+    """
+    Prober of the id space of the breweries (STEP 5)
+
+    The ids between 1 and the largest id of breweries.csv that are not in this file are closed breweries or other
+    types of places (bars, stores, ...). Each missing id is probed once: only the beginning of the page is downloaded,
+    until the Type line. The result of each probe is saved in the frontier such that an id is never probed again
+    (except when the Type line could not be read). The ids in the dense ranges (many breweries around them) are probed
+    first. The pages of breweries that the probe downloaded entirely are saved and not fetched again.
+    """
+
+    # Pattern after which the download of a probe is stopped
+    marker = b'<b>Type:</b>'
+
+    def __init__(self, crawler, block_size=1000):
+        """
+        Initialize the class
+
+        :param crawler: Crawler used to fetch the pages (concurrency, rate, frontier and store)
+        :param block_size: Size of the ranges of ids used to compute the density
+        """
+
+        self.crawler = crawler
+        self.block_size = block_size
+
+    def url(self, id_):
+        """
+        url of a brewery
+
+        :param id_: ID of the brewery
+        :return: url
+        """
+
+        return self.crawler.base_url + '/beer/profile/{:d}/?view=beers&show=all'.format(id_)
+
+    def missing_ids(self):
+        """
+        The ids that still have to be probed, ordered by density of their range
+
+        :return: List of ids
+        """
+
+        df = pd.read_csv(self.crawler.data_folder + 'parsed/breweries.csv')
+
+        got = set(df['id'])
+        last = max(got)
+
+        # The ids without the Type line in a previous version are probed again
+        probes = dict((id_, result) for id_, result in self.crawler.frontier.probes().items() if result != 'unknown')
+
+        # Pages already saved by a previous crawl of the step 5
+        for id_ in range(1, last + 1):
+            if id_ not in got and id_ not in probes and \
+                    self.crawler.store.size('breweries/{}.html'.format(id_)):
+                self.crawler.frontier.set_probe(id_, 'brewery')
+                probes[id_] = 'brewery'
+
+        # Number of breweries in each range of ids
+        breweries = got | set(id_ for id_, result in probes.items() if result == 'brewery')
+        density = {}
+        for id_ in breweries:
+            block = id_ // self.block_size
+            density[block] = density.get(block, 0) + 1
+
+        missing = [id_ for id_ in range(1, last + 1) if id_ not in got and id_ not in probes]
+
+        # Densest ranges first, ascending ids in each range
+        missing.sort(key=lambda id_: (-density.get(id_ // self.block_size, 0), id_))
+
+        return missing
+
+    def classify(self, r):
+        """
+        Classify the beginning of a page
+
+        :param r: the request
+        :return: 'brewery', 'other', 'not-found' or None if the probe has to be done again
+        """
+
+        if r is None:
+            return None
+
+        if r.status_code == 404:
+            return 'not-found'
+
+        if r.status_code != 200:
+            # Errors of the server and rate limiting
+            return None
+
+        # The page can be cut in the middle of a character (see Fetcher.get)
+        str_ = '<b>Type:</b> (.+?)\n\t\t<br>'
+        grp = re.search(str_, r.content.decode('utf-8', errors='replace'))
+        if grp is None:
+            # Page cut before the end of the Type line or changed layout: probed again at the next run
+            return None
+
+        if 'Brewery' in grp.group(1).split(', '):
+            return 'brewery'
+        else:
+            return 'other'
+
+    def probe(self, limit=None):
+        """
+        Probe the missing ids. The breweries found are added to the frontier of the step 5 to be crawled.
+
+        :param limit: Maximum number of ids to probe (the densest ranges first)
+        :return: Dict with the number of ids per result
+        """
+
+        missing = self.missing_ids()
+        if limit is not None:
+            missing = missing[:limit]
+
+        tasks = [(self.url(id_), id_) for id_ in missing]
+
+        counts = {}
+        for (url, id_), r in self.crawler.fetch_pages(tasks, stop_after=self.marker):
+            result = self.classify(r)
+            if result is None:
+                if r is not None and r.status_code == 200:
+                    print('---------------------------------------------------------------------')
+                    print('')
+                    print('ERROR WITH BREWERY_ID {}'.format(id_))
+                    print('---------------------------------------------------------------------')
+                    print('')
+                continue
+
+            if result == 'brewery' and (not r.truncated or r.rest is not None):
+                # The page was entirely downloaded (see Fetcher.drain), it is added as done below
+                self.crawler.store.put('breweries/{}.html'.format(id_), r.content + (r.rest or b''))
+
+            self.crawler.frontier.set_probe(id_, result, r.status_code)
+            counts[result] = counts.get(result, 0) + 1
+
+        # The full pages of the breweries (the ones already in the store are done)
+        tasks = []
+        for id_, result in self.crawler.frontier.probes().items():
+            if result == 'brewery':
+                tasks.append((self.url(id_), 'breweries/{}.html'.format(id_)))
+        self.crawler.frontier.add(5, tasks, self.crawler.store)
+
+        return counts
@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from collections import deque
+import threading
+import datetime
+import time
+
+
+class RateLimiter:
+    """
+    Fixed cap on the number of requests per second, shared by all the workers
+    """
+
+    def __init__(self, max_rate=None):
+        """
+        Initialize the class
+
+        :param max_rate: Maximum number of requests per second (None for no cap)
+        """
+
+        self.rate = max_rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Reserve the next free slot
+
+        :return: Time in seconds to wait before using the slot
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            if self.rate:
+                self.next_slot = slot + 1.0 / self.rate
+
+        return slot - now
+
+    def wait(self):
+        """
+        Reserve the next free slot and sleep until it
+        """
+
+        time.sleep(self.reserve())
+
+    def record(self, status_code=None, latency=None, error=False):
+        """
+        Give the result of a request to the limiter. Nothing to do for a fixed rate.
+
+        :param status_code: HTTP status code of the response
+        :param latency: Time in seconds taken by the request
+        :param error: True if the request failed (timeout, connection error, ...)
+        """
+
+        pass
+
+
+class RateController(RateLimiter):
+    """
+    Adaptive rate (AIMD: Additive Increase, Multiplicative Decrease)
+
+    While the server answers quickly with good status codes, the rate increases by `increase` requests per second
+    every second. The rate is multiplied by `decrease` on a 429, when more than `error_threshold` of the recent
+    responses are 5xx status codes or failed requests (timeouts, connection errors, ...), or when the 95th percentile
+    of the latency rises above `latency_factor` times its usual value. The usual value is a moving average (EWMA) of
+    the 95th percentile, such that it follows slow changes of the server, and a 95th percentile below `latency_floor`
+    never backs off. The rate always stays between `min_rate` and `max_rate`.
+    """
+
+    def __init__(self, initial_rate=1.0, max_rate=10.0, min_rate=0.1, increase=0.1, decrease=0.5,
+                 latency_window=50, latency_factor=2.0, latency_floor=0.5, baseline_alpha=0.02, error_threshold=0.2,
+                 verbose=True):
+        """
+        Initialize the class
+
+        :param initial_rate: Number of requests per second at the beginning
+        :param max_rate: Ceiling for the number of requests per second
+        :param min_rate: Floor for the number of requests per second
+        :param increase: Increase of the rate (requests per second) per second of healthy responses
+        :param decrease: Factor applied to the rate when backing off
+        :param latency_window: Number of responses used to compute the 95th percentile and the proportion of errors
+        :param latency_factor: Back off when the 95th percentile is above this factor times its usual value
+        :param latency_floor: 95th percentile in seconds below which the latency never backs off
+        :param baseline_alpha: Weight of each new 95th percentile in its usual value (EWMA)
+        :param error_threshold: Back off when more than this proportion of the recent responses are errors
+        :param verbose: Print each backoff event
+        """
+
+        RateLimiter.__init__(self, min(initial_rate, max_rate))
+
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.baseline_alpha = baseline_alpha
+        self.error_threshold = error_threshold
+        self.verbose = verbose
+
+        self.latencies = deque(maxlen=latency_window)
+        self.baseline_p95 = None
+
+        # True for each recent response that was an error
+        self.outcomes = deque(maxlen=latency_window)
+
+        # No second backoff before the requests sent at the old rate are back
+        self.cooldown_until = 0.0
+
+        # List of all the backoff events (date, reason, old rate, new rate)
+        self.events = []
+
+    def record(self, status_code=None, latency=None, error=False):
+        """
+        Give the result of a request to the controller and adapt the rate
+
+        :param status_code: HTTP status code of the response
+        :param latency: Time in seconds taken by the request
+        :param error: True if the request failed (timeout, connection error, ...)
+        """
+
+        with self.lock:
+            if status_code == 429:
+                # The server asks explicitly to slow down
+                self.backoff('status 429')
+                return
+
+            if error or (status_code is not None and status_code >= 500):
+                self.outcomes.append(True)
+
+                # A few isolated errors do not back off, many of them in the recent responses do
+                nbr_errors = sum(self.outcomes)
+                if nbr_errors > self.error_threshold * self.outcomes.maxlen:
+                    reason = 'error' if error else 'status {:d}'.format(status_code)
+                    self.backoff('{} ({:d} errors in {:d} responses)'.format(reason, nbr_errors,
+                                                                             len(self.outcomes)))
+                return
+
+            self.outcomes.append(False)
+
+            if latency is not None:
+                self.latencies.append(latency)
+
+                if len(self.latencies) == self.latencies.maxlen:
+                    p95 = self.p95()
+
+                    if self.baseline_p95 is None:
+                        self.baseline_p95 = p95
+
+                    slow = p95 > self.latency_floor and p95 > self.latency_factor * self.baseline_p95
+                    if slow:
+                        self.backoff('p95 latency {:.3f}s, usual {:.3f}s'.format(p95, self.baseline_p95))
+
+                    # The usual value also follows a lasting rise of the latency (the server is just slower)
+                    self.baseline_p95 += self.baseline_alpha * (p95 - self.baseline_p95)
+
+                    if slow:
+                        return
+
+            # Additive increase: one request per second of requests gives `increase`
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def backoff(self, reason):
+        """
+        Multiplicative decrease of the rate
+
+        :param reason: Reason of the backoff
+        """
+
+        now = time.monotonic()
+        if now < self.cooldown_until:
+            return
+
+        old = self.rate
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+
+        self.cooldown_until = now + 1.0 / self.rate
+        self.latencies.clear()
+        self.outcomes.clear()
+
+        self.events.append((datetime.datetime.now(), reason, old, self.rate))
+
+        if self.verbose:
+            print('Backoff ({}): {:.2f} -> {:.2f} requests/s'.format(reason, old, self.rate))
+
+    def p95(self):
+        """
+        Compute the 95th percentile of the latency over the window
+
+        :return: 95th percentile in seconds
+        """
+
+        sorted_ = sorted(self.latencies)
+        return sorted_[int(0.95 * (len(sorted_) - 1))]
+
+    def __str__(self):
+        return 'Rate: {:.2f} requests/s ({:d} backoffs)'.format(self.rate, len(self.events))
@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from email.utils import parsedate_to_datetime
+from collections import deque
+import threading
+import datetime
+import random
+import time
+
+
+class RetryPolicy:
+    """
+    When and after how long a request is sent again
+
+    A response is either good ('ok'), worth another attempt ('retry': exception, rate limiting, error of the server,
+    empty page) or terminal ('terminal': e.g. 404, the page will not come back by asking again). The waiting time
+    before the attempt n+1 is drawn uniformly between 0 and min(cap, base * 2^(n-1)) (exponential backoff with full
+    jitter, such that the workers do not all come back at the same time). A Retry-After header is respected.
+    """
+
+    # Rate limiting and errors of the server (or of a proxy in front of it)
+    retryable = (408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524)
+
+    def __init__(self, attempts=5, base=0.5, cap=60.0, seed=None):
+        """
+        Initialize the class
+
+        :param attempts: Maximum number of attempts per page
+        :param base: Waiting time in seconds before the second attempt (upper bound, it doubles after each attempt)
+        :param cap: Maximum waiting time in seconds between two attempts
+        :param seed: Seed of the jitter
+        """
+
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+        self.random = random.Random(seed)
+
+    def classify(self, r):
+        """
+        Classify the result of a request
+
+        :param r: the request (None if it raised an exception)
+        :return: 'ok', 'retry' or 'terminal'
+        """
+
+        if is_ok(r):
+            return 'ok'
+
+        if r is None or r.status_code == 200 or r.status_code in self.retryable:
+            return 'retry'
+
+        return 'terminal'
+
+    def delay(self, attempt, r=None):
+        """
+        Waiting time before the next attempt
+
+        :param attempt: Number of attempts already done
+        :param r: the request of the last attempt
+        :return: Time in seconds
+        """
+
+        delay = self.random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+        after = retry_after(r)
+        if after is not None:
+            delay = max(delay, min(after, self.cap))
+
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Pause the whole crawl when the error rate spikes
+
+    The results of the last `window` requests are kept. When at least `min_requests` of them are there and the
+    proportion of failures (see RetryPolicy: exceptions, 429, 5xx) reaches `threshold`, the circuit opens: no request
+    is sent during `pause` seconds. Then one request is sent to probe the server (half-open). If it works, the circuit
+    closes again. Otherwise, it opens for twice the pause (at most `max_pause`).
+    """
+
+    def __init__(self, window=50, threshold=0.5, min_requests=20, pause=30.0, max_pause=600.0, verbose=True,
+                 metrics=None):
+        """
+        Initialize the class
+
+        :param window: Number of requests over which the error rate is computed
+        :param threshold: Proportion of failures opening the circuit
+        :param min_requests: Minimum number of requests in the window before the circuit can open
+        :param pause: Time in seconds without any request when the circuit opens
+        :param max_pause: Maximum pause after several failed probes
+        :param verbose: Print each opening of the circuit
+        :param metrics: Metrics where the openings are counted
+        """
+
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.pause = pause
+        self.max_pause = max_pause
+        self.verbose = verbose
+        self.metrics = metrics
+
+        self.lock = threading.Lock()
+        self.results = deque(maxlen=window)
+
+        self.state = 'closed'
+        self.open_until = 0.0
+        self.current_pause = pause
+        # A request is probing the server (half-open)
+        self.probing = False
+
+        # List of all the openings (date, error rate, pause)
+        self.events = []
+
+    def wait_time(self):
+        """
+        Time to wait before sending a request. When it is 0, the request can be sent (after the rate controller).
+
+        :return: Time in seconds
+        """
+
+        with self.lock:
+            if self.state == 'open':
+                now = time.monotonic()
+                if now < self.open_until:
+                    return self.open_until - now
+                self.state = 'half-open'
+                self.probing = False
+
+            if self.state == 'half-open':
+                if self.probing:
+                    # Wait for the result of the probe
+                    return 0.1
+                self.probing = True
+
+            return 0.0
+
+    def wait(self):
+        """
+        Sleep until a request can be sent
+        """
+
+        while True:
+            wait = self.wait_time()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def record(self, failure):
+        """
+        Give the result of a request to the breaker
+
+        :param failure: True if the request failed (worth a retry for the RetryPolicy)
+        """
+
+        with self.lock:
+            if self.state == 'open':
+                # Requests sent before the opening
+                return
+
+            if self.state == 'half-open':
+                if failure:
+                    self.trip(min(2 * self.current_pause, self.max_pause), None)
+                else:
+                    self.state = 'closed'
+                    self.current_pause = self.pause
+                    self.results.clear()
+                    self.set_metric(0)
+                return
+
+            self.results.append(failure)
+
+            if len(self.results) >= self.min_requests:
+                rate = sum(self.results) / len(self.results)
+                if rate >= self.threshold:
+                    self.trip(self.pause, rate)
+
+    def trip(self, pause, rate):
+        """
+        Open the circuit. The lock must be held.
+
+        :param pause: Time in seconds without any request
+        :param rate: Error rate that opened the circuit (None after a failed probe)
+        """
+
+        self.state = 'open'
+        self.open_until = time.monotonic() + pause
+        self.current_pause = pause
+        self.results.clear()
+
+        self.events.append((datetime.datetime.now(), rate, pause))
+        self.set_metric(1)
+        if self.metrics is not None:
+            self.metrics.inc('ba_circuit_trips_total')
+
+        if self.verbose:
+            if rate is None:
+                reason = 'the probe failed'
+            else:
+                reason = '{:.0f}% of the last requests failed'.format(100 * rate)
+            print('---------------------------------------------------------------------')
+            print('')
+            print('CIRCUIT OPEN ({}): NO REQUEST DURING {:.0f}s'.format(reason, pause))
+            print('---------------------------------------------------------------------')
+            print('')
+
+    def set_metric(self, value):
+        if self.metrics is not None:
+            self.metrics.set('ba_circuit_open', value)
+
+
+def is_ok(r):
+    """
+    Check if a request was successful
+
+    :param r: the request (None if it raised an exception)
+    :return: True if the status code is 200 and there's some content, or if the page did not change (304)
+    """
+
+    return r is not None and ((r.status_code == 200 and page_size(r) > 0) or r.status_code == 304)
+
+
+def page_size(r):
+    """
+    Size of the page of a request, also when it was streamed to the page store (see Fetcher.get)
+
+    :param r: the request
+    :return: Size in bytes
+    """
+
+    if getattr(r, 'streamed', False):
+        return r.size
+    return len(r.content)
+
+
+def retry_after(r):
+    """
+    Waiting time asked by the server with the header Retry-After (in seconds or as a date)
+
+    :param r: the request (or None)
+    :return: Time in seconds or None if there's no header
+    """
+
+    if r is None:
+        return None
+
+    value = r.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max((date - datetime.datetime.now(date.tzinfo)).total_seconds(), 0.0)
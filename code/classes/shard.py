@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.frontier import Frontier
+import pandas as pd
+import zlib
+
+
+def shard_of(key, nbr_shards):
+    """
+    Deterministic shard of a key. It does not depend on the process nor on the host (unlike hash()).
+
+    :param key: Key of the work (e.g. '{brewery_id}/{beer_id}' or user_id)
+    :param nbr_shards: Number of shards
+    :return: Shard between 0 and nbr_shards-1
+    """
+
+    return zlib.crc32(str(key).encode('utf-8')) % nbr_shards
+
+
+def beer_key(brewery_id, beer_id):
+    """
+    Key used to shard the beers
+
+    :param brewery_id: ID of the brewery
+    :param beer_id: ID of the beer
+    :return: Key
+    """
+
+    return '{}/{}'.format(brewery_id, beer_id)
+
+
+def frontier_file(data_folder, shard=0, nbr_shards=1):
+    """
+    File of the frontier of a shard. Each shard has its own SQLite file such that several hosts can write in the
+    same data folder without locking each other.
+
+    :param data_folder: Folder with the data
+    :param shard: Shard of the worker
+    :param nbr_shards: Number of shards
+    :return: Path of the SQLite file
+    """
+
+    if nbr_shards == 1:
+        return data_folder + 'misc/frontier.sqlite'
+    else:
+        return data_folder + 'misc/frontier_{:d}_of_{:d}.sqlite'.format(shard, nbr_shards)
+
+
+def merge_frontiers(data_folder, nbr_shards):
+    """
+    Merge the frontiers of all the shards in the main frontier (misc/frontier.sqlite)
+
+    :param data_folder: Folder with the data
+    :param nbr_shards: Number of shards
+    :return: The main frontier
+    """
+
+    frontier = Frontier(frontier_file(data_folder))
+
+    for shard in range(nbr_shards):
+        frontier.merge(frontier_file(data_folder, shard, nbr_shards))
+
+    return frontier
+
+
+def verify_coverage(data_folder, step, nbr_shards):
+    """
+    Merge the frontiers of the shards and check that every beer (step 9) or user (step 13) was crawled
+
+    :param data_folder: Folder with the data
+    :param step: Step of the crawl (9 or 13)
+    :param nbr_shards: Number of shards
+    :return: Dict with the number of expected items, the number of missing ones per shard and the number of pages
+             that are not done
+    """
+
+    frontier = merge_frontiers(data_folder, nbr_shards)
+
+    if step == 9:
+        df = pd.read_csv(data_folder + 'parsed/beers.csv')
+        expected = [(beer_key(b, beer), 'beers/{}/{}/0.html'.format(b, beer))
+                    for b, beer in zip(df['brewery_id'], df['beer_id'])]
+    elif step == 13:
+        df = pd.read_csv(data_folder + 'parsed/users.csv')
+        expected = [(user_id, 'users/{}.html'.format(user_id)) for user_id in df['user_id']]
+    else:
+        raise ValueError('Only the steps 9 and 13 are sharded')
+
+    done = set(frontier.files(step, 'done'))
+
+    missing = [0] * nbr_shards
+    for key, file in expected:
+        if file not in done:
+            missing[shard_of(key, nbr_shards)] += 1
+
+    not_done = frontier.count(step) - frontier.count(step, 'done')
+
+    frontier.close()
+
+    return {'expected': len(expected), 'missing': missing, 'not_done': not_done}
@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import random
+import time
+import zlib
+
+
+class StubServer:
+    """
+    Local HTTP server used to benchmark the crawler without hitting the real website
+
+    Without a site, every url is a page of page_size bytes. With a SyntheticSite, the pages of the site are served. The
+    server can also answer with errors (500) at random and throttle the clients (429) above a rate. The connections are
+    kept alive (HTTP/1.1) as on the real website, and counted.
+    """
+
+    def __init__(self, latency=0.05, page_size=20000, port=0, site=None, error_rate=0.0, max_rate=None, seed=0):
+        """
+        Initialize the class
+
+        :param latency: Time in seconds the server waits before answering
+        :param page_size: Size in bytes of the pages (without a site)
+        :param port: Port of the server (0 to let the OS choose one)
+        :param site: SyntheticSite served by the server (None for the pages of page_size bytes)
+        :param error_rate: Proportion of the requests answered with an error 500
+        :param max_rate: Maximum number of requests per second before answering with 429 (None for no throttling)
+        :param seed: Seed of the random errors
+        """
+
+        self.latency = latency
+        self.page_size = page_size
+        self.site = site
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.nbr_requests = 0
+        self.nbr_connections = 0
+        self.nbr_errors = 0
+        self.nbr_throttled = 0
+        # Conditional requests (If-None-Match) and their answers 304
+        self.nbr_conditional = 0
+        self.nbr_not_modified = 0
+
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        # Times of the requests in the last second
+        self.recent = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            # Keep-alive: every answer has a Content-Length (or no body)
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with stub.lock:
+                    stub.nbr_connections += 1
+
+            def handle(self):
+                try:
+                    BaseHTTPRequestHandler.handle(self)
+                except (ConnectionResetError, BrokenPipeError):
+                    # The client closed the connection (e.g. a download stopped after a pattern)
+                    pass
+
+            def do_GET(self):
+                status = stub.admit()
+
+                time.sleep(stub.latency)
+
+                if status != 200:
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header('Retry-After', '1')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if stub.site is None:
+                    body = b'<html>' + b'x' * max(stub.page_size - 13, 0) + b'</html>'
+                    etag = '"{:d}"'.format(len(body))
+                else:
+                    status, body = stub.site.render(self.path, self.headers.get('Cookie', ''))
+                    etag = '"{:08x}"'.format(zlib.crc32(body))
+
+                # Conditional request
+                if self.headers.get('If-None-Match') is not None:
+                    with stub.lock:
+                        stub.nbr_conditional += 1
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    with stub.lock:
+                        stub.nbr_not_modified += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # Keep the output of the benchmarks clean
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{:d}'.format(self.server.server_address[1])
+        self.thread = None
+
+    def admit(self):
+        """
+        Count a request and decide if it is throttled or if it fails
+
+        :return: Status code (200, 429 or 500)
+        """
+
+        with self.lock:
+            self.nbr_requests += 1
+
+            now = time.time()
+            if self.max_rate is not None:
+                self.recent = [t for t in self.recent if now - t < 1.0]
+                if len(self.recent) >= self.max_rate:
+                    self.nbr_throttled += 1
+                    return 429
+                self.recent.append(now)
+
+            if self.random.random() < self.error_rate:
+                self.nbr_errors += 1
+                return 500
+
+        return 200
+
+    def start(self):
+        """
+        Start the server in a background thread
+        """
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the server
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,469 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from urllib.parse import urlparse, parse_qs
+import datetime
+import random
+import time
+import re
+
+
+class SyntheticSite:
+    """
+    Synthetic BeerAdvocate website
+
+    All the places, breweries, beers, ratings and users are generated once (with a seed) and the pages are rendered
+    with the markup expected by the regexes of the Crawler and of the Parser. It is served by the StubServer, such
+    that the whole pipeline (run_ba.py) can be run without hitting the real website.
+    """
+
+    # Places with regions (code of the country and regions)
+    special_places = [('United States', 'US', [('California', 'CA'), ('Oregon', 'OR'), ('New York', 'NY'),
+                                               ('District of Columbia', 'DC')]),
+                      ('Canada', 'CA', [('Ontario', 'ON'), ('Quebec', 'QC')]),
+                      ('United Kingdom', 'UK', [('England', 'EN'), ('Scotland', 'SC')])]
+
+    countries = [('Belgium', 'BE'), ('Germany', 'DE'), ('Japan', 'JP'), ('Fiji', 'FJ'), ('Brazil', 'BR'),
+                 ('France', 'FR'), ('Mexico', 'MX'), ('Norway', 'NO'), ('Viet Nam', 'VN'), ('Denmark', 'DK')]
+
+    styles = ['American IPA', 'Belgian Saison', 'Russian Imperial Stout', 'German Pilsner', 'Berliner Weisse',
+              'English Bitter', 'Belgian Tripel', 'American Pale Ale (APA)', 'Czech Pilsener', 'Gose']
+
+    words = ['hoppy', 'malty', 'crisp', 'bitter', 'sweet', 'citrus', 'pine', 'caramel', 'roasted', 'smooth', 'dry',
+             'body', 'head', 'lacing', 'finish', 'aroma', 'pour', 'glass', 'amber', 'golden', 'dark', 'light', 'nice',
+             'great', 'beer', 'with', 'a', 'the', 'and', 'of', 'some', 'notes', 'hints', 'very', 'good', 'bad']
+
+    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+    def __init__(self, nbr_countries=4, nbr_breweries=60, nbr_closed=5, nbr_other=5, nbr_missing=5, max_beers=8,
+                 nbr_users=300, max_ratings=120, review_rate=0.3, page_size=0, seed=0):
+        """
+        Initialize the class
+
+        :param nbr_countries: Number of countries without regions (the United States, Canada and the United Kingdom
+                              are always there)
+        :param nbr_breweries: Number of open breweries (listed in the places)
+        :param nbr_closed: Number of closed breweries (only found by probing the ids)
+        :param nbr_other: Number of places that are not breweries (bars, stores) in the id space of the breweries
+        :param nbr_missing: Number of ids of the breweries without a page (404)
+        :param max_beers: Maximum number of beers per brewery
+        :param nbr_users: Number of users
+        :param max_ratings: Maximum number of ratings per beer (most beers have a few ratings)
+        :param review_rate: Proportion of the ratings with a review (text of 150 characters or more)
+        :param page_size: Minimum size in bytes of the pages (they are padded)
+        :param seed: Seed of the generator
+        """
+
+        self.page_size = page_size
+
+        rng = random.Random(seed)
+
+        # Places: (country, code of the country, region, code of the region)
+        self.places = [(country, code, None, None) for country, code in self.countries[:nbr_countries]]
+        for country, code, regions in self.special_places:
+            for region, code_region in regions:
+                self.places.append((country, code, region, code_region))
+
+        # Users
+        self.users = []
+        for i in range(nbr_users):
+            status = rng.choices(['normal', 'restricted', 'unavailable'], [0.93, 0.05, 0.02])[0]
+            self.users.append({'user_name': 'user{:d}'.format(i),
+                               'user_id': 'user{:d}.{:d}'.format(i, 1000 + i),
+                               'joined': self.random_date(rng, 2001, 2016),
+                               'location': rng.choice([None] + [region for _, _, region, _ in self.places if region]
+                                                      + [country for country, _ in self.countries]),
+                               'status': status})
+
+        # Id space of the breweries. The last id is always an open brewery.
+        kinds = ['open'] * (nbr_breweries - 1) + ['closed'] * nbr_closed + ['other'] * nbr_other + \
+                ['missing'] * nbr_missing
+        rng.shuffle(kinds)
+        kinds.append('open')
+
+        self.breweries = {}
+        self.beers = {}
+        beer_id = 1
+        for id_, kind in enumerate(kinds, 1):
+            if kind == 'missing':
+                continue
+
+            brewery = {'id': id_, 'kind': kind, 'name': 'Brewery {:d} Co.'.format(id_),
+                       'place': rng.choice(self.places), 'beers': []}
+
+            if kind != 'other':
+                for _ in range(rng.randint(0, max_beers)):
+                    beer = self.random_beer(rng, beer_id, brewery, max_ratings, review_rate)
+                    self.beers[beer_id] = beer
+                    brewery['beers'].append(beer)
+                    beer_id += 1
+
+            self.breweries[id_] = brewery
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                              Generation of the data                                ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def random_date(self, rng, first_year=2005, last_year=2017):
+        """
+        Random date (at noon)
+
+        :param rng: Random generator
+        :param first_year: First year
+        :param last_year: Last year
+        :return: datetime
+        """
+
+        start = datetime.datetime(first_year, 1, 1, 12, 0)
+        end = datetime.datetime(last_year, 12, 31, 12, 0)
+
+        return start + datetime.timedelta(days=rng.randint(0, (end - start).days))
+
+    def random_text(self, rng, nbr_char):
+        """
+        Random text
+
+        :param rng: Random generator
+        :param nbr_char: Approximate number of characters
+        :return: str
+        """
+
+        words = []
+        while sum(len(w) + 1 for w in words) < nbr_char:
+            words.append(rng.choice(self.words))
+
+        return ' '.join(words).capitalize() + '.'
+
+    def random_beer(self, rng, beer_id, brewery, max_ratings, review_rate):
+        """
+        Random beer with its ratings
+
+        :param rng: Random generator
+        :param beer_id: ID of the beer
+        :param brewery: Brewery of the beer
+        :param max_ratings: Maximum number of ratings
+        :param review_rate: Proportion of the ratings with a review
+        :return: dict
+        """
+
+        # Most beers have a few ratings, some of them have a lot
+        nbr_ratings = min(int(max_ratings * rng.random() ** 4), len(self.users))
+
+        ratings = []
+        for user in rng.sample(self.users, nbr_ratings):
+            aspects = None
+            if rng.random() < 0.7:
+                aspects = [rng.choice([1, 1.5, 2, 2.5, 3, 3.25, 3.5, 3.75, 4, 4.25, 4.5, 5]) for _ in range(5)]
+
+            text = None
+            r = rng.random()
+            if r < review_rate:
+                text = self.random_text(rng, rng.randint(150, 600))
+            elif r < review_rate + 0.1:
+                text = self.random_text(rng, rng.randint(10, 100))
+
+            ratings.append({'user': user,
+                            'rating': round(rng.uniform(1, 5), 2),
+                            'aspects': aspects,
+                            'text': text,
+                            'date': self.random_date(rng)})
+
+        abv = rng.choice([None, round(rng.uniform(3, 13), 2)])
+
+        return {'id': beer_id,
+                'brewery': brewery,
+                'name': 'Beer {:d}'.format(beer_id),
+                'style': rng.choice(self.styles),
+                'style_id': rng.randint(1, 200),
+                'abv': abv,
+                'ba_score': rng.choice([None, rng.randint(60, 100)]),
+                'bros_score': rng.choice([None, rng.randint(60, 100)]),
+                'retired': rng.random() < 0.2,
+                'ratings': ratings}
+
+    def open_breweries(self, place):
+        """
+        Open breweries of a place
+
+        :param place: (country, code of the country, region, code of the region)
+        :return: List of breweries sorted by name
+        """
+
+        breweries = [b for b in self.breweries.values() if b['kind'] == 'open' and b['place'] == place]
+        return sorted(breweries, key=lambda b: b['name'])
+
+    def expected(self):
+        """
+        What the pipeline should find
+
+        :return: Dict with the numbers of breweries, beers, ratings, reviews and users
+        """
+
+        breweries = [b for b in self.breweries.values() if b['kind'] != 'other']
+        beers = [beer for b in breweries for beer in b['beers']]
+        ratings = [r for beer in beers for r in beer['ratings']]
+
+        return {'breweries': len(breweries),
+                'beers': len(beers),
+                'ratings': len(ratings),
+                'reviews': sum(1 for r in ratings if r['text'] is not None and len(r['text']) >= 150),
+                'users': len(set(r['user']['user_id'] for r in ratings))}
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                Render the pages                                    ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def render(self, url, cookies=''):
+        """
+        Render a page
+
+        :param url: Path and query of the request
+        :param cookies: Cookie header of the request
+        :return: (status code, body in bytes)
+        """
+
+        parsed = urlparse(url)
+        path = parsed.path
+        query = dict((key, values[0]) for key, values in parse_qs(parsed.query, keep_blank_values=True).items())
+
+        html = None
+
+        if path == '/place/directory/':
+            html = self.render_directory()
+
+        m = re.match(r'^/place/directory/0/(\w+)/(?:(\w+)/)?$', path)
+        if m is not None:
+            html = self.render_place(m.group(1), m.group(2))
+
+        if path == '/place/list/':
+            html = self.render_list(query.get('c_id'), query.get('s_id'), int(query.get('start', 0)))
+
+        m = re.match(r'^/beer/profile/(\d+)/$', path)
+        if m is not None and int(m.group(1)) in self.breweries:
+            html = self.render_brewery(self.breweries[int(m.group(1))])
+
+        m = re.match(r'^/beer/profile/(\d+)/(\d+)/?$', path)
+        if m is not None and int(m.group(2)) in self.beers:
+            html = self.render_beer(self.beers[int(m.group(2))], query.get('sort', ''), int(query.get('start', 0)))
+
+        m = re.match(r'^/community/members/([^/]+)/$', path)
+        if m is not None:
+            users = [u for u in self.users if u['user_id'] == m.group(1)]
+            if len(users) > 0:
+                html = self.render_member(users[0], 'xf_session=' in cookies)
+
+        if html is None:
+            return 404, self.pad('<html><body><h1>Not Found</h1></body></html>').encode('utf-8')
+
+        return 200, self.pad(html).encode('utf-8')
+
+    def pad(self, html):
+        """
+        Pad a page up to the size of the pages (at the end, after the information used by the parser)
+
+        :param html: HTML
+        :return: HTML
+        """
+
+        missing = self.page_size - len(html) - 9
+        if missing > 0:
+            html = html.replace('</body>', '<!--' + 'x' * missing + '--></body>')
+
+        return html
+
+    def render_directory(self):
+        places = {}
+        for country, code, _, _ in self.places:
+            places[(country, code)] = places.get((country, code), 0) + 1
+
+        lines = ['<html><body><h1>Places</h1>']
+        for (country, code), nbr in sorted(places.items()):
+            lines.append('<a href="/place/directory/0/{}/">{} ({:d})</a><br>'.format(code, country, nbr))
+        lines.append('</body></html>')
+
+        return '\n'.join(lines)
+
+    def render_place(self, code, code_region):
+        places = [p for p in self.places if p[1] == code]
+        if len(places) == 0:
+            return None
+
+        lines = ['<html><body><h1>{}</h1>'.format(places[0][0])]
+
+        if places[0][2] is not None and code_region is None:
+            # Country with regions
+            for place in places:
+                lines.append('<a href="/place/directory/0/{}/{}/">{} ({:d})</a><br>'.format(
+                    code, place[3], place[2], len(self.open_breweries(place))))
+        else:
+            if code_region is not None:
+                places = [p for p in places if p[3] == code_region]
+                if len(places) == 0:
+                    return None
+
+            lines.append('<a href="/place/list/?c_id={}&brewery=Y">Brewery ({:d})</a><br>'.format(
+                code, len(self.open_breweries(places[0]))))
+            lines.append('<a href="/place/list/?c_id={}&bar=Y">Bar ({:d})</a><br>'.format(code, 0))
+
+        lines.append('</body></html>')
+
+        return '\n'.join(lines)
+
+    def render_list(self, code, code_region, start):
+        places = [p for p in self.places if p[1] == code and p[3] == code_region]
+        if len(places) == 0:
+            return None
+
+        breweries = self.open_breweries(places[0])
+
+        query = 'c_id={}&'.format(code)
+        if code_region is not None:
+            query += 's_id={}&'.format(code_region)
+
+        lines = ['<html><body><h1>Breweries</h1>',
+                 '<a href="/place/list/?start={:d}&{}brewery=Y&sort=name">Next</a>'.format(start + 20, query),
+                 '<b>{:d}-{:d}</b> (out of {:d})'.format(start + 1, min(start + 20, len(breweries)), len(breweries)),
+                 '<table>']
+        for brewery in breweries[start:start + 20]:
+            lines.append('<tr><td><a href="/beer/profile/{:d}/"><b>{}</b></a></td></tr>'.format(brewery['id'],
+                                                                                               brewery['name']))
+        lines.append('</table></body></html>')
+
+        return '\n'.join(lines)
+
+    def render_brewery(self, brewery):
+        country, code, region, code_region = brewery['place']
+
+        if region is not None:
+            address = 'City, <a href="/place/directory/9/{}/{}/">{}</a>, <br>'.format(code, code_region, region)
+        else:
+            address = 'City, <br>'
+        address += '<a href="/place/directory/9/{}/">{}</a> <br><br>'.format(code, country)
+
+        type_ = 'Bar, Eatery' if brewery['kind'] == 'other' else 'Brewery, Bar'
+
+        current = [beer for beer in brewery['beers'] if not beer['retired']]
+        archived = [beer for beer in brewery['beers'] if beer['retired']]
+
+        lines = ['<html><body>',
+                 '<h1>{}</h1>'.format(brewery['name']),
+                 '<div id="info_box">Street {:d}<br>{}'.format(brewery['id'], address),
+                 '\t\t<b>Type:</b> {}\n\t\t<br>'.format(type_),
+                 '</div>',
+                 '<a href="?view=beers&show=current">Current ({:d})</a> | '
+                 '<a href="?view=beers&show=arch">Arch ({:d})</a>'.format(len(current), len(archived)),
+                 '<table>']
+
+        for beer in current + archived:
+            avg = self.average(beer)
+            lines.append('<tr><td align="left" valign="top" class="hr_bottom_light">'
+                         '<a href="/beer/profile/{:d}/{:d}/"><b>{}</b></a></td>'
+                         '<td valign=top class="hr_bottom_light"><a href="/beer/style/{:d}/">{}</a></td>'
+                         '<td align="left" valign="top" class="hr_bottom_light">'
+                         '<span style="color: #999999; font-weight: bold;">{}</span></td>'
+                         '<td align="left" valign="top" class="hr_bottom_light"><b>{}</b></td>'
+                         '<td align="left" valign="top" class="hr_bottom_light">{:d}</td></tr>'.format(
+                             brewery['id'], beer['id'], beer['name'], beer['style_id'], beer['style'],
+                             '?' if beer['abv'] is None else '{:.2f}%'.format(beer['abv']),
+                             '-' if avg is None else '{:.2f}'.format(avg), len(beer['ratings'])))
+
+        lines.append('</table></body></html>')
+
+        return '\n'.join(lines)
+
+    def average(self, beer):
+        if len(beer['ratings']) == 0:
+            return None
+        return sum(r['rating'] for r in beer['ratings']) / len(beer['ratings'])
+
+    def render_beer(self, beer, sort, start):
+        ratings = beer['ratings']
+        if sort == 'time':
+            ratings = sorted(ratings, key=lambda r: r['date'], reverse=True)
+
+        nbr_ratings = len(ratings)
+        nbr_reviews = sum(1 for r in ratings if r['text'] is not None and len(r['text']) >= 150)
+        avg = self.average(beer)
+
+        lines = ['<html><body>',
+                 '<h1>{} <span>| {}</span></h1>'.format(beer['name'], beer['brewery']['name']),
+                 '<div id="score_box">',
+                 '\t\t<b>BA SCORE</b>\n\t\t\t<br>\n\t\t\t<span class="BAscore_big ba-score">{}</span>'.format(
+                     '-' if beer['ba_score'] is None else beer['ba_score']),
+                 '\t\t<b>THE BROS</b>\n\t\t\t<br>\n\t\t\t<span class="BAscore_big ba-bro_score">{}</span>'.format(
+                     '-' if beer['bros_score'] is None else beer['bros_score']),
+                 '</div>',
+                 '<dl>',
+                 '\t\t\t\t<dt>Reviews:</dt>\n\t\t\t\t\t<dd><span class="ba-reviews">{:,}</span></dd>'.format(
+                     nbr_reviews),
+                 '\t\t\t\t<dt>Ratings:</dt>\n\t\t\t\t\t<dd><span class="ba-ratings">{:,}</span></dd>'.format(
+                     nbr_ratings),
+                 '\t\t\t\t<dt>Avg:</dt>\n\t\t\t\t\t<dd><span class="ba-ravg">{:.2f}</span></dd>'.format(
+                     0 if avg is None else avg),
+                 '</dl>',
+                 '<div id="info_box">',
+                 '\t\t<b>Style:</b> <a href="/beer/style/{:d}/"><b>{}</b></a>\n\t\t<br>'.format(beer['style_id'],
+                                                                                            beer['style']),
+                 '\t\t<b>Alcohol by volume (ABV):</b> {}\n\t\t<br>'.format(
+                     'not listed' if beer['abv'] is None else '{:.2f}%'.format(beer['abv'])),
+                 '</div>',
+                 '<div><b><i class="fa fa-star"></i> Ratings: {:,}</b></div>'.format(nbr_ratings)]
+
+        for rating in ratings[start:start + 25]:
+            lines.append(self.render_rating(beer, rating))
+
+        lines.append('</body></html>')
+
+        return '\n'.join(lines)
+
+    def render_rating(self, beer, rating):
+        user = rating['user']
+
+        aspects = '<span class="muted">rDev +1.5%</span>'
+        if rating['aspects'] is not None:
+            aspects += '<br><span class="muted">look: {:g} | smell: {:g} | taste: {:g} | feel: {:g} | ' \
+                       ' overall: {:g}</span>'.format(*rating['aspects'])
+
+        if rating['text'] is not None:
+            text = '\n\t\t{}<br><br><span class="muted">{:,} characters</span><br><br><div>'.format(
+                rating['text'], len(rating['text']))
+        else:
+            text = '<div>'
+
+        return '<div id="rating_fullview_container"><div class="user-comment"><div id="rating_fullview_user">' \
+               '<a href="/community/members/{0}/"><img src="/avatar.png" alt="Photo of {1}"></a></div></div>' \
+               '<div id="rating_fullview_content_2">\n\t\t<span class="BAscore_norm">{2:.2f}</span>' \
+               '<span class="rAvg_norm">/5</span>&nbsp;&nbsp;{3}<br><br>{4}</div>' \
+               '<span class="muted"><a href="/community/members/{0}/" class="username">{1}</a>, ' \
+               '<a href="/beer/profile/{5:d}/{6:d}/?ba={1}#review">{7}</a></span></div>'.format(
+                   user['user_id'], user['user_name'], rating['rating'], aspects, text, beer['brewery']['id'],
+                   beer['id'], rating['date'].strftime('%b %d, %Y'))
+
+    def render_member(self, user, logged_in):
+        lines = ['<html><body>']
+
+        if user['status'] == 'unavailable':
+            lines.append("<div class=\"errorPanel\">This user's profile is not available.</div>")
+        elif user['status'] == 'restricted' and not logged_in:
+            lines.append('<div class="errorPanel">This member limits who may view their full profile.</div>')
+        else:
+            lines.append('<div class="mast"><div class="section infoBlock">')
+            lines.append('<dl><dt>Joined:</dt>\n\t\t\t<dd>{}</dd></dl>'.format(user['joined'].strftime('%b %d, %Y')))
+            if user['location'] is not None:
+                lines.append('<dl><dt>Location:</dt>\n\t\t\t<dd><a href="/misc/location-info?location={0}" '
+                             'target="_blank" rel="nofollow" itemprop="address" class="concealed">{0}</a></dd>'
+                             '</dl>'.format(user['location']))
+            lines.append('</div></div>')
+            lines.append('<div class="mainProfileColumn"><h3>{}</h3></div>'.format(user['user_name']))
+
+        lines.append('</body></html>')
+
+        return '\n'.join(lines)
@@ -0,0 +1,297 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import threading
+import random
+import json
+import time
+import os
+
+
+class Tracer:
+    """
+    Tracing of the pipeline with timed spans
+
+    A span is a part of the work (a step, the fetch of a page, the read of a file, a regex, a write, ...) with its
+    start, its duration and some attributes (e.g. beer_id, bytes, pattern). The spans of a thread are nested: a span
+    started inside another one is its child. They are written in a JSONL file, one span per line, that can be exported
+    as a Chrome trace (chrome://tracing, Perfetto) or as folded stacks for a flamegraph.
+
+    The spans started with sample=True (e.g. one page) are only kept with the probability sample_rate, with all their
+    children. Without a file, the tracer does nothing.
+    """
+
+    def __init__(self, file=None, sample_rate=1.0, seed=None, buffer_size=1000):
+        """
+        Initialize the class
+
+        :param file: JSONL file where the spans are written (None to not trace anything)
+        :param sample_rate: Probability to keep a span started with sample=True
+        :param seed: Seed of the sampling
+        :param buffer_size: Number of spans kept in memory before they are written
+        """
+
+        self.file = file
+        self.enabled = file is not None
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.buffer = []
+        self.next_id = 1
+
+        # Times of the spans in microseconds since the epoch
+        self.origin = time.time() * 1e6 - time.perf_counter() * 1e6
+
+        if self.enabled:
+            folder = os.path.dirname(file)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            self.output = open(file, 'w')
+
+    def span(self, name, sample=False, **attrs):
+        """
+        Start a span, to use with a with statement:
+
+            with tracer.span('read', file=file) as span:
+                html = store.get(file)
+                span.set(bytes=len(html))
+
+        :param name: Name of the span
+        :param sample: The span is only kept with the probability sample_rate
+        :param attrs: Attributes of the span
+        :return: Context manager
+        """
+
+        if not self.enabled:
+            return _NULL
+
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        # Inside a span that was not sampled
+        if len(stack) > 0 and stack[-1] is None:
+            return _NULL
+
+        if sample and self.random.random() >= self.sample_rate:
+            return _Skipped(stack)
+
+        return _Span(self, stack, name, attrs)
+
+    def record(self, span):
+        """
+        Keep a finished span
+
+        :param span: _Span
+        """
+
+        line = json.dumps({'id': span.id, 'parent': span.parent, 'name': span.name, 'tid': span.tid,
+                           'ts': int(self.origin + span.start * 1e6), 'dur': int(span.duration * 1e6),
+                           'attrs': span.attrs}, separators=(',', ':'), default=str)
+
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= self.buffer_size:
+                self._flush()
+
+    def new_id(self):
+        with self.lock:
+            id_ = self.next_id
+            self.next_id += 1
+        return id_
+
+    def _flush(self):
+        """
+        Write the spans in memory. The lock must be held.
+        """
+
+        if len(self.buffer) > 0:
+            self.output.write('\n'.join(self.buffer) + '\n')
+            self.output.flush()
+            self.buffer = []
+
+    def flush(self):
+        """
+        Write the spans in memory in the file
+        """
+
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """
+        Write the last spans and close the file
+        """
+
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self._flush()
+            self.output.close()
+            self.enabled = False
+
+
+class _Span:
+    """
+    Span in progress
+    """
+
+    def __init__(self, tracer, stack, name, attrs):
+        self.tracer = tracer
+        self.stack = stack
+        self.name = name
+        self.attrs = attrs
+        self.id = tracer.new_id()
+        self.parent = stack[-1].id if len(stack) > 0 else None
+        self.tid = threading.get_ident()
+        self.start = 0.0
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        """
+        Add some attributes to the span
+
+        :param attrs: Attributes
+        """
+
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.stack.pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(self)
+        return False
+
+
+class _Skipped:
+    """
+    Span that was not sampled. Its children are not traced either.
+    """
+
+    def __init__(self, stack):
+        self.stack = stack
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        self.stack.append(None)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stack.pop()
+        return False
+
+
+class _NullSpan:
+    """
+    Span that does nothing (tracing disabled or inside a span that was not sampled)
+    """
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def read_trace(file):
+    """
+    Read the spans of a trace
+
+    :param file: JSONL file written by a Tracer
+    :return: List of dicts
+    """
+
+    spans = []
+    with open(file) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+
+    return spans
+
+
+def to_chrome(file, output):
+    """
+    Export a trace in the Chrome trace format (to open with chrome://tracing or Perfetto)
+
+    :param file: JSONL file written by a Tracer
+    :param output: JSON file of the Chrome trace
+    :return: Number of spans
+    """
+
+    spans = read_trace(file)
+
+    events = []
+    for span in spans:
+        events.append({'name': span['name'], 'ph': 'X', 'ts': span['ts'], 'dur': span['dur'], 'pid': 0,
+                       'tid': span['tid'], 'args': span['attrs']})
+
+    with open(output, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    return len(spans)
+
+
+def to_folded(file, output):
+    """
+    Export a trace as folded stacks (one line 'root;child;grandchild microseconds' per stack), the input of
+    flamegraph.pl or speedscope. The time of a span without the time of its children is given to its own stack.
+
+    :param file: JSONL file written by a Tracer
+    :param output: Text file of the folded stacks
+    :return: Number of stacks
+    """
+
+    spans = read_trace(file)
+    by_id = dict((span['id'], span) for span in spans)
+
+    children = {}
+    for span in spans:
+        if span['parent'] is not None:
+            children[span['parent']] = children.get(span['parent'], 0) + span['dur']
+
+    stacks = {}
+    for span in spans:
+        names = []
+        current = span
+        while current is not None:
+            names.append(current['name'])
+            # The parent may be missing if the trace was cut
+            current = by_id.get(current['parent'])
+        stack = ';'.join(reversed(names))
+
+        self_time = max(span['dur'] - children.get(span['id'], 0), 0)
+        stacks[stack] = stacks.get(stack, 0) + self_time
+
+    with open(output, 'w') as f:
+        for stack, us in sorted(stacks.items()):
+            f.write('{} {:d}\n'.format(stack, us))
+
+    return len(stacks)
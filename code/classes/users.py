@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.helpers import map_chunks, chunk_columns
+import pandas as pd
+import numpy as np
+
+
+class UserStats:
+    """
+    Users of the ratings with their numbers of ratings and reviews and the dates of their first and last ratings
+
+    The step 11 adds each rating when it is written, such that users.csv is ready without reading ratings.txt.gz
+    again. The users are kept in the order of their first rating and identified by their name, as in the step 12.
+    The stats of two consecutive parts of the ratings (e.g. the chunks of the file counted by several processes) are
+    combined with merge, which gives the same stats as adding all the ratings to one UserStats.
+    """
+
+    columns = ['user_name', 'nbr_ratings', 'nbr_reviews', 'user_id', 'first_date', 'last_date']
+
+    def __init__(self):
+        """
+        Initialize the class
+        """
+
+        # user_name -> [user_id, nbr_ratings, nbr_reviews, first_date, last_date]
+        self.users = {}
+
+    def __len__(self):
+        return len(self.users)
+
+    def add(self, user_name, user_id, review, date):
+        """
+        Add a rating
+
+        :param user_name: Name of the user
+        :param user_id: ID of the user
+        :param review: True if the rating is a review
+        :param date: Date of the rating (UNIX time)
+        """
+
+        user = self.users.get(user_name)
+        if user is None:
+            self.users[user_name] = [user_id, 1, 1 if review else 0, date, date]
+            return
+
+        user[1] += 1
+        if review:
+            user[2] += 1
+        if date < user[3]:
+            user[3] = date
+        if date > user[4]:
+            user[4] = date
+
+    def merge(self, other):
+        """
+        Add the stats of the ratings that come after the ones of this UserStats
+
+        :param other: UserStats
+        """
+
+        for user_name, (user_id, nbr_ratings, nbr_reviews, first_date, last_date) in other.users.items():
+            user = self.users.get(user_name)
+            if user is None:
+                self.users[user_name] = [user_id, nbr_ratings, nbr_reviews, first_date, last_date]
+                continue
+
+            user[1] += nbr_ratings
+            user[2] += nbr_reviews
+            user[3] = min(user[3], first_date)
+            user[4] = max(user[4], last_date)
+
+    def to_frame(self):
+        """
+        Stats in a DataFrame (columns of users.csv)
+
+        :return: DataFrame
+        """
+
+        values = dict((column, []) for column in self.columns)
+        for user_name, (user_id, nbr_ratings, nbr_reviews, first_date, last_date) in self.users.items():
+            values['user_name'].append(user_name)
+            values['nbr_ratings'].append(nbr_ratings)
+            values['nbr_reviews'].append(nbr_reviews)
+            values['user_id'].append(user_id)
+            values['first_date'].append(first_date)
+            values['last_date'].append(last_date)
+
+        return pd.DataFrame(values, columns=self.columns)
+
+    def save(self, filename):
+        """
+        Write the stats in a CSV file (e.g. users.csv)
+
+        :param filename: Name of the file
+        """
+
+        self.to_frame().to_csv(filename, index=False)
+
+
+def users_from_file(filename, processes=1):
+    """
+    Stats of the users of a file of ratings (e.g. ratings.txt.gz), counted by chunks
+
+    :param filename: Name of the file
+    :param processes: Number of processes counting the chunks (None for the number of CPUs)
+    :return: UserStats
+    """
+
+    stats = UserStats()
+    for part in map_chunks(filename, chunk_stats, (), processes):
+        stats.merge(part)
+
+    return stats
+
+
+def chunk_stats(chunk):
+    """
+    Stats of the users of a chunk of a file of ratings (see map_chunks)
+
+    :param chunk: bytes ending at the end of an entry
+    :return: UserStats
+    """
+
+    values = chunk_columns(chunk, ['user_name', 'user_id', 'review', 'date'])
+
+    stats = UserStats()
+    for user_name, user_id, review, date in zip(values['user_name'], values['user_id'], values['review'].tolist(),
+                                                values['date'].astype(np.int64).tolist()):
+        stats.add(user_name, user_id, review, date)
+
+    return stats
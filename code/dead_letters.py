@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##    This file lists the pages in the dead-letter queue of the frontier (pages       ##
+##     that could not be fetched) and crawls them again once the website is back.     ##
+##                                                                                    ##
+##   Number of dead pages per step, status and reason:                                ##
+##       python dead_letters.py                                                       ##
+##   List of the dead pages of a step:                                                ##
+##       python dead_letters.py --list 9                                              ##
+##   Crawl again the dead pages of a step (only the errors 500):                      ##
+##       python dead_letters.py --replay 9 --status 500                               ##
+##                                                                                    ##
+########################################################################################
+
+from classes.crawler import Crawler
+import argparse
+import datetime
+
+
+def run():
+    """
+    Parse the command line and list or replay the dead pages
+    """
+
+    parser = argparse.ArgumentParser(description='Dead-letter queue of the frontier')
+    parser.add_argument('--list', type=int, default=None, metavar='STEP', help='Print the dead pages of a step')
+    parser.add_argument('--replay', type=int, default=None, metavar='STEP',
+                        help='Crawl again the dead pages of a step (4, 5, 9 or 13)')
+    parser.add_argument('--status', type=int, default=None, help='Only the pages that died with this status code')
+    parser.add_argument('--data-folder', default='../data/')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight')
+    parser.add_argument('--max-rate', type=float, default=None, help='Ceiling of requests/s')
+    parser.add_argument('--base-url', default=None)
+    args = parser.parse_args()
+
+    crawler = Crawler(1, data_folder=args.data_folder, concurrency=args.concurrency, max_rate=args.max_rate,
+                      base_url=args.base_url)
+
+    if args.replay is not None:
+        nbr = crawler.replay_dead_letters(args.replay, args.status)
+        print('{:d} pages replayed, {:d} still dead'.format(nbr, len(crawler.frontier.dead_letters(args.replay))))
+    elif args.list is not None:
+        for step, url, file, status, reason, died_at in crawler.frontier.dead_letters(args.list):
+            if args.status is None or status == args.status:
+                print('{}\t{}\t{}\t{}\t{}'.format(datetime.datetime.fromtimestamp(died_at).strftime('%Y-%m-%d %H:%M'),
+                                                  status, reason, url, file))
+    else:
+        counts = {}
+        for step, url, file, status, reason, died_at in crawler.frontier.dead_letters():
+            counts[(step, status, reason)] = counts.get((step, status, reason), 0) + 1
+
+        print('{:>4s} {:>6s} {:>10s} {:>8s}'.format('Step', 'Status', 'Reason', 'Pages'))
+        for (step, status, reason), nbr in sorted(counts.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            print('{:4d} {:>6s} {:>10s} {:8d}'.format(step, str(status), reason, nbr))
+
+
+if __name__ == '__main__':
+    run()
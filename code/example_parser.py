@@ -24,24 +24,42 @@ def parse(filename):
     :param filename: name of the file
     :return: Generator to go through the file
     """
-    file = gzip.open(filename, 'rb')
-    entry = {}
-    # Go through all the lines
-    for line in file:
-        # Transform the string-bytes into a string
-        line = line.decode("utf-8").strip()
-
-        # We check for a colon in each line
-        colon_pos = line.find(":")
-        if colon_pos == -1:
-            # if no, we yield the entry
-            yield entry
-            entry = {}
-            continue
-        # otherwise, we add the key-value pair to the entry
-        key = line[:colon_pos]
-        value = line[colon_pos + 2:]
-        entry[key] = value
+    # The file is closed at the end (or when the generator is closed)
+    with gzip.open(filename, 'rb') as file:
+        entry = {}
+        rest = b''
+        while True:
+            # Read 32 MB at once
+            data = file.read(32 * 1024 * 1024)
+            if len(data) == 0:
+                # Last line of the file, without line break
+                lines = [rest.decode("utf-8")] if len(rest) > 0 else []
+            else:
+                # Transform the string-bytes into a string and split the lines, up to the last line break
+                data = rest + data
+                end = data.rfind(b'\n') + 1
+                lines = data[:end].decode("utf-8").split('\n')
+                lines.pop()
+                rest = data[end:]
+
+            # Go through all the lines
+            for line in lines:
+                line = line.strip()
+
+                # We check for a colon in each line
+                colon_pos = line.find(":")
+                if colon_pos == -1:
+                    # if no, we yield the entry
+                    yield entry
+                    entry = {}
+                    continue
+                # otherwise, we add the key-value pair to the entry
+                key = line[:colon_pos]
+                value = line[colon_pos + 2:]
+                entry[key] = value
+
+            if len(data) == 0:
+                break
 
 
 def run():
@@ -0,0 +1,238 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##     This file migrates the HTML files of an existing data folder to a packed       ##
+##   page store (folder store). Once done, the Crawler and the Parser use the store   ##
+##         automatically. The HTML files are not deleted by this script.              ##
+##                                                                                    ##
+##   The pages are written in the order in which the parser reads them, such that     ##
+##   the parse steps read the segments sequentially. A store filled by a crawl has    ##
+##   the pages in the order of the crawl: --repack writes it again in this order.     ##
+##                                                                                    ##
+########################################################################################
+
+from classes.pagestore import PackedPageStore
+import pandas as pd
+import argparse
+import random
+import shutil
+import os
+
+
+# Folders of the data folder with HTML pages
+FOLDERS = ['misc', 'places', 'breweries', 'beers', 'users']
+
+
+def list_pages(data_folder):
+    """
+    List all the HTML pages of a data folder
+
+    :param data_folder: Folder with the data
+    :return: List of keys (paths relative to the data folder)
+    """
+
+    keys = []
+    for folder in FOLDERS:
+        for root, dirs, files in os.walk(data_folder + folder):
+            for file in files:
+                if file.endswith('.html'):
+                    keys.append(os.path.join(root, file)[len(data_folder):])
+
+    return keys
+
+
+def csv_order(filename, column):
+    """
+    Position of each value of a column in a CSV file of the folder parsed
+
+    :param filename: CSV file
+    :param column: Column of the IDs
+    :return: Dict ID (str) -> position (empty if the file does not exist)
+    """
+
+    if not os.path.exists(filename):
+        return {}
+
+    order = {}
+    for id_ in pd.read_csv(filename, usecols=[column])[column].astype(str):
+        if id_ not in order:
+            order[id_] = len(order)
+
+    return order
+
+
+def parse_order(data_folder, keys):
+    """
+    Sort the pages in the order in which the parser reads them: the folders in the order of the steps, the breweries
+    in the order of breweries.csv (steps 7 and 8), the beers in the order of beers.csv with their pages sorted as in
+    the step 11 and the users in the order of users.csv (step 14). The pages that are not in the CSV files come after
+    the other ones of their folder, sorted by path.
+
+    :param data_folder: Folder with the data
+    :param keys: List of keys
+    :return: Sorted list of keys
+    """
+
+    breweries = csv_order(data_folder + 'parsed/breweries.csv', 'id')
+    beers = csv_order(data_folder + 'parsed/beers.csv', 'beer_id')
+    users = csv_order(data_folder + 'parsed/users.csv', 'user_id')
+
+    def order(key):
+        parts = key.split('/')
+        folder = FOLDERS.index(parts[0]) if parts[0] in FOLDERS else len(FOLDERS)
+
+        position = None
+        if parts[0] == 'breweries' and len(parts) == 2:
+            position = breweries.get(parts[1][:-len('.html')])
+        elif parts[0] == 'beers' and len(parts) == 4:
+            position = beers.get(parts[2])
+        elif parts[0] == 'users' and len(parts) == 2:
+            position = users.get(parts[1][:-len('.html')])
+
+        if position is None:
+            return folder, 1, 0, key
+
+        # The pages of a beer are sorted by their names, as in the step 11
+        return folder, 0, position, key
+
+    return sorted(keys, key=order)
+
+
+def migrate(data_folder, codec, level, nbr_samples):
+    """
+    Migrate the HTML files of a data folder to a store
+
+    :param data_folder: Folder with the data
+    :param codec: 'zstd' or 'zlib' (default: zstd if available)
+    :param level: Compression level
+    :param nbr_samples: Number of pages to train the dictionary
+    """
+
+    keys = parse_order(data_folder, list_pages(data_folder))
+    print('{:d} pages to migrate'.format(len(keys)))
+
+    store = PackedPageStore(data_folder + 'store/', codec=codec, level=level)
+
+    # Train the dictionary on a sample of all types of pages
+    samples = []
+    for key in random.sample(keys, min(nbr_samples, len(keys))):
+        with open(data_folder + key, 'rb') as input_:
+            samples.append(input_.read())
+    store.train_dictionary(samples)
+
+    size = 0
+    for i, key in enumerate(keys):
+        with open(data_folder + key, 'rb') as input_:
+            content = input_.read()
+        store.put(key, content, os.path.getmtime(data_folder + key), commit=False)
+        size += len(content)
+
+        if (i + 1) % 10000 == 0:
+            store.commit()
+            print('{:d} pages migrated'.format(i + 1))
+
+    store.commit()
+
+    # Check that everything is in the store
+    for key in keys:
+        if store.size(key) != os.stat(data_folder + key).st_size:
+            store.close()
+            raise IOError('The page {} was not migrated correctly'.format(key))
+
+    store.close()
+
+    packed = sum(os.stat(data_folder + 'store/' + file).st_size for file in os.listdir(data_folder + 'store/'))
+
+    print('Done: {:.1f} MB of HTML in {:.1f} MB'.format(size / 1e6, packed / 1e6))
+    print('The HTML files can now be removed (folders {})'.format(', '.join(FOLDERS)))
+
+
+def repack(data_folder):
+    """
+    Write the pages of the store again in the order of the parser (store.new), then replace the store by it. The
+    pages are copied without being compressed again. The old store is kept in the folder store.old.
+
+    :param data_folder: Folder with the data
+    """
+
+    folder = data_folder + 'store/'
+    new_folder = data_folder + 'store.new/'
+    old_folder = data_folder + 'store.old/'
+
+    if os.path.exists(new_folder) or os.path.exists(old_folder):
+        print('Remove the folders {} and {} first'.format(new_folder, old_folder))
+        return
+
+    store = PackedPageStore(folder)
+    keys = parse_order(data_folder, store.keys())
+    print('{:d} pages to repack'.format(len(keys)))
+
+    # Same codec and same dictionary, such that the compressed pages can be copied
+    os.makedirs(new_folder)
+    if os.path.exists(folder + 'dictionary.zstd'):
+        shutil.copy(folder + 'dictionary.zstd', new_folder + 'dictionary.zstd')
+    new_store = PackedPageStore(new_folder, segment_size=store.segment_size, codec=store.codec, level=store.level)
+
+    for i, key in enumerate(keys):
+        data, size, fetched_at = store.get_record(key)
+        new_store.put_record(key, data, size, fetched_at, commit=False)
+
+        if (i + 1) % 10000 == 0:
+            new_store.commit()
+            print('{:d} pages repacked'.format(i + 1))
+
+    new_store.commit()
+
+    # Check that everything is in the new store
+    for key in keys:
+        if new_store.size(key) != store.size(key):
+            store.close()
+            new_store.close()
+            raise IOError('The page {} was not repacked correctly'.format(key))
+
+    store.close()
+    new_store.close()
+
+    os.rename(folder, old_folder)
+    os.rename(new_folder, folder)
+
+    print('Done: the old store is in {} and can now be removed'.format(old_folder))
+
+
+def run():
+    """
+    Migrate the data folder
+    """
+
+    parser = argparse.ArgumentParser(description='Migrate the HTML files to a packed page store')
+    parser.add_argument('--data-folder', default='../data/')
+    parser.add_argument('--codec', choices=['zstd', 'zlib'], default=None)
+    parser.add_argument('--level', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=2000, help='Number of pages to train the dictionary')
+    parser.add_argument('--repack', action='store_true',
+                        help='Write the pages of an existing store again in the order of the parser')
+    args = parser.parse_args()
+
+    if args.repack:
+        if not os.path.exists(args.data_folder + 'store/index.sqlite'):
+            print('There is no store in {}store/'.format(args.data_folder))
+            return
+
+        repack(args.data_folder)
+        return
+
+    if os.path.exists(args.data_folder + 'store/index.sqlite'):
+        print('There is already a store in {}store/'.format(args.data_folder))
+        return
+
+    migrate(args.data_folder, args.codec, args.level, args.samples)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,58 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##    This file estimates the number of requests, the size and the time of the        ##
+##   crawl steps that are left, with a given rate and concurrency. No request is      ##
+##                                     sent.                                          ##
+##                                                                                    ##
+##   Estimates of all the crawl steps:                                                ##
+##       python plan_crawl.py --max-rate 10 --concurrency 8                           ##
+##   Estimates for one worker out of 4:                                               ##
+##       python plan_crawl.py --steps 9 --shards 4 --shard 0                          ##
+##   List of the urls still to crawl for a step:                                      ##
+##       python plan_crawl.py --dry-run 13 > urls.txt                                 ##
+##                                                                                    ##
+########################################################################################
+
+from classes.planner import CrawlPlanner
+from classes.crawler import Crawler
+import argparse
+
+
+def run():
+    """
+    Parse the command line and print the plan
+    """
+
+    parser = argparse.ArgumentParser(description='Estimates of the crawl steps 4, 5, 9, 13 and 15')
+    parser.add_argument('--steps', type=int, nargs='+', default=[4, 5, 9, 13, 15])
+    parser.add_argument('--dry-run', type=int, default=None, metavar='STEP', help='Print the urls left for a step')
+    parser.add_argument('--data-folder', default='../data/')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight per worker')
+    parser.add_argument('--max-rate', type=float, default=10, help='Ceiling of requests/s for all the workers')
+    parser.add_argument('--latency', type=float, default=0.5, help='Average time of a request in seconds')
+    parser.add_argument('--shards', type=int, default=1, help='Total number of workers')
+    parser.add_argument('--shard', type=int, default=0, help='Worker to plan')
+    parser.add_argument('--base-url', default=None)
+    args = parser.parse_args()
+
+    crawler = Crawler(data_folder=args.data_folder, concurrency=args.concurrency,
+                      max_rate=args.max_rate / args.shards, shard=args.shard, nbr_shards=args.shards,
+                      base_url=args.base_url)
+
+    planner = CrawlPlanner(crawler, args.latency)
+
+    if args.dry_run is not None:
+        planner.dry_run(args.dry_run)
+    else:
+        planner.print_plan(args.steps)
+
+
+if __name__ == '__main__':
+    run()
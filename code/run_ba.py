@@ -7,11 +7,67 @@
 
 from classes.crawler import *
 from classes.parser import *
+from classes.metrics import Metrics, MetricsServer
+from classes.tracing import Tracer
+from classes.fused import FusedBeerCrawl
+from classes.dedup import RatingIndex
 import time
 import datetime
 import os
 
 
+def run_steps(crawler, parser, steps=range(1, 17), fused=False, archive=True):
+    """
+    Run some steps of the pipeline
+
+    :param crawler: Crawler (its metrics and its tracer are used for the steps)
+    :param parser: Parser
+    :param steps: Steps to run (from 1 to 16)
+    :param fused: Run the steps 9, 10 and 11 in one pass (FusedBeerCrawl). The step 9 does the three of them and
+                  the steps 10 and 11 are skipped.
+    :param archive: Keep the pages of the beers in the page store in the fused mode
+    :return: Dict with the time in seconds of each step
+    """
+
+    pipeline = [('Crawling the places', crawler.crawl_all_places),
+                ('Crawling the breweries from the places', crawler.crawl_breweries_from_places),
+                ('Parsing the breweries from the places', parser.parse_breweries_from_places),
+                ('Crawling the remaining pages from the breweries', crawler.crawl_all_breweries),
+                ('Crawling the closed breweries', crawler.crawl_all_closed_breweries),
+                ('Parsing the missing breweries', parser.parse_missing_breweries),
+                ('Parsing the breweries files to get the number of beers', parser.parse_breweries_files_for_number),
+                ('Parsing the breweries files to get the beers', parser.parse_breweries_files_for_beers),
+                ('Crawling all the beers and their reviews', crawler.crawl_all_beers_and_reviews),
+                ('Parsing all the beer files to update the beers.csv file', parser.parse_beer_files_for_information),
+                ('Parsing all the beer files to get the reviews', parser.parse_beer_files_for_reviews),
+                ('Getting the users from the ratings', parser.get_users_from_ratings),
+                ('Crawling all the users', crawler.crawl_all_users),
+                ('Parsing the users for some information', parser.parse_all_users),
+                ('Crawling user with the cookies... (On personal computer)', crawler.crawl_users_with_cookies),
+                ('Parsing the users that have been crawler with cookies', parser.parse_users_crawler_with_cookies)]
+
+    if fused:
+        pipeline[8] = ('Crawling and parsing all the beers and their reviews (steps 9, 10 and 11)',
+                       FusedBeerCrawl(crawler, parser, archive).run)
+        steps = [step for step in steps if step not in [10, 11]]
+
+    times = {}
+    for step in steps:
+        text, function = pipeline[step - 1]
+        print('{:d}. {}...'.format(step, text))
+
+        crawler.metrics.set('ba_step', step)
+
+        start = time.time()
+        with crawler.tracer.span('step_{:d}'.format(step)):
+            function()
+        times[step] = time.time() - start
+
+        crawler.metrics.set('ba_step_seconds', times[step], step=step)
+
+    return times
+
+
 def run():
 
     # Create directory for the data
@@ -24,63 +80,46 @@ def run():
     start = time.time()
 
     # Initialize classes
-    delta_t = 0.2
-    crawler = Crawler(delta_t, data_folder)
-    parser = Parser(data_folder)
-
-    print('1. Crawling the places...')
-    #crawler.crawl_all_places()
-
-    print('2. Crawling the breweries from the places...')
-    #crawler.crawl_breweries_from_places()
-
-    print('3. Parsing the breweries from the places...')
-    #parser.parse_breweries_from_places()
-
-    print('4. Crawling the remaining pages from the breweries...')
-    #crawler.crawl_all_breweries()
-
-    print('5. Crawling the closed breweries...')
-    #crawler.crawl_all_closed_breweries()
-
-    print('6. Parsing the missing breweries...')
-    #parser.parse_missing_breweries()
-
-    print('7. Parsing the breweries files to get the number of beers...')
-    #parser.parse_breweries_files_for_number()
-
-    print('8. Parsing the breweries files to get the beers...')
-    #parser.parse_breweries_files_for_beers()
-
-    print('9. Crawling all the beers and their reviews...')
-    #crawler.crawl_all_beers_and_reviews()
-
-    print('10. Parsing all the beer files to update the beers.csv file...')
-    #parser.parse_beer_files_for_information()
-
-    print('11. Parsing all the beer files to get the reviews...')
-    #parser.parse_beer_files_for_reviews()
-
-    print('12. Getting the users from the ratings...')
-    #parser.get_users_from_ratings()
-
-    print('13. Crawling all the users...')
-    #crawler.crawl_all_users()
-
-    print('14. Parsing the users for some information...')
-    parser.parse_all_users()
-
-    print('15. Crawling user with the cookies... (On personal computer)')
-    #crawler.crawl_users_with_cookies()
-
-    print('16. Parsing the users that have been crawler with cookies...')
-    parser.parse_users_crawler_with_cookies()
+    # The rate starts at one request per second and adapts itself to the server, up to this ceiling
+    max_rate = 10
+    # Number of requests in flight at the same time (1 for the sequential mode)
+    concurrency = 1
+    # Snapshots of the metrics in misc/metrics.json. To also serve them live (e.g. on http://127.0.0.1:9100/metrics),
+    # give a free port.
+    metrics_port = None
+    metrics = Metrics()
+    # No tracing by default. To find where the time goes, e.g. data_folder + 'misc/trace.jsonl' for the spans of 1% of
+    # the pages (see trace_export.py)
+    trace_file = None
+    tracer = Tracer(trace_file, sample_rate=0.01)
+    # Cookies of the connection with an account for the step 15 !!! You may have to change them according to your
+    # browser !!!
+    cookies = dict(xf_session="0ce9764fc5c68bbbf7f258ef233c7a74", OX_plg="pm", OX_sd="1",
+                   __cfduid="decaf5d8d30f4fce5c2afd076a806a7501501757826", _ga="GA1.3.804066691.1501757842",
+                   _gat="1", _gid="GA1.3.1441985684.1501858687")
+    crawler = Crawler(data_folder=data_folder, concurrency=concurrency, max_rate=max_rate, metrics=metrics,
+                      tracer=tracer, cookies=cookies)
+    # The beers of the step 11 are parsed by one process per CPU, the duplicates of ratings are removed with an index
+    # on disk (the memory stays bounded with millions of ratings)
+    index = RatingIndex(data_folder + 'misc/ratings_index.sqlite')
+    parser = Parser(data_folder, metrics=metrics, tracer=tracer, processes=None, index=index)
+    exporter = MetricsServer(metrics, port=metrics_port, snapshot_file=data_folder + 'misc/metrics.json')
+    exporter.start()
+
+    # Steps 1 to 13 and 15 were already done
+    run_steps(crawler, parser, [14, 16])
+
+    exporter.stop()
+    index.close()
+    tracer.close()
 
     stop = time.time()
 
     elapsed = str(datetime.timedelta(seconds=stop-start))
 
     print('Time to complete the crawling: {}'.format(elapsed))
+    print(crawler.rate)
+    print(crawler.fetcher.cache)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##      This file runs the 16 steps of the pipeline against a synthetic website       ##
+##       served locally, checks the parsed data and prints the time of each step.     ##
+##                                                                                    ##
+########################################################################################
+
+from classes.crawler import Crawler, PROFILE_COLUMN
+from classes.parser import Parser
+from classes.stub_server import StubServer
+from classes.stub_site import SyntheticSite
+from classes.metrics import Metrics, MetricsServer
+from classes.tracing import Tracer
+from classes.dedup import RatingIndex
+from classes.helpers import read_ratings
+from run_ba import run_steps
+import pandas as pd
+import argparse
+import tempfile
+import datetime
+
+
+def check(data_folder, site, columnar=None):
+    """
+    Compare the parsed data with what the synthetic site contains
+
+    :param data_folder: Folder with the data
+    :param site: SyntheticSite
+    :param columnar: Format of the columnar files to check as well (None to only check the CSV files)
+    :return: True if everything was found
+    """
+
+    expected = site.expected()
+
+    df_breweries = pd.read_csv(data_folder + 'parsed/breweries.csv')
+    df_beers = pd.read_csv(data_folder + 'parsed/beers.csv')
+    df_users = pd.read_csv(data_folder + 'parsed/users.csv')
+
+    found = {'breweries': len(df_breweries),
+             'beers': len(df_beers),
+             'ratings': int(df_beers['nbr_ratings'].sum()),
+             'reviews': int(df_beers['nbr_reviews'].sum()),
+             'users': len(df_users)}
+
+    keys = ['breweries', 'beers', 'ratings', 'reviews', 'users']
+    if columnar is not None:
+        for name in ['ratings', 'reviews']:
+            key = name + '.' + columnar
+            found[key] = len(read_ratings(data_folder + 'parsed/' + key, ['beer_id']))
+            expected[key] = expected[name]
+            keys.append(key)
+
+    ok = True
+    for key in keys:
+        status = 'OK' if found[key] == expected[key] else 'MISMATCH'
+        print('{:15s} {:8d} found, {:8d} expected  {}'.format(key, found[key], expected[key], status))
+        ok = ok and found[key] == expected[key]
+
+    return ok
+
+
+def run():
+    """
+    Run the pipeline against the synthetic site
+    """
+
+    parser = argparse.ArgumentParser(description='Run the pipeline against a local synthetic BeerAdvocate website.')
+    parser.add_argument('--data-folder', default=None, help='Folder for the data (default: temporary folder)')
+    parser.add_argument('--breweries', type=int, default=60, help='Number of open breweries')
+    parser.add_argument('--users', type=int, default=300, help='Number of users')
+    parser.add_argument('--max-ratings', type=int, default=120, help='Maximum number of ratings per beer')
+    parser.add_argument('--page-size', type=int, default=0, help='Minimum size in bytes of the pages')
+    parser.add_argument('--latency', type=float, default=0.01, help='Latency of the server in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion of errors 500')
+    parser.add_argument('--server-rate', type=float, default=None,
+                        help='Requests per second above which the server answers 429')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of requests in flight')
+    parser.add_argument('--max-rate', type=float, default=200, help='Ceiling of the requests per second')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic site')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Port of the Prometheus endpoint of the metrics (default: no endpoint)')
+    parser.add_argument('--fused', action='store_true', help='Run the steps 9, 10 and 11 in one pass')
+    parser.add_argument('--no-archive', action='store_true', help='Do not keep the pages of the beers (fused mode)')
+    parser.add_argument('--processes', type=int, default=1, help='Processes parsing the beers in the step 11')
+    parser.add_argument('--backend', default='regex', choices=['regex', 'dom'],
+                        help='Backend of the extraction of the fields (dom needs lxml)')
+    parser.add_argument('--index-file', default=None,
+                        help='SQLite file of the index of the ratings (default: in memory)')
+    parser.add_argument('--columnar', default=None, choices=['parquet', 'arrow'],
+                        help='Also write the ratings and the reviews in columnar files (needs pyarrow)')
+    parser.add_argument('--codec', default='gzip', choices=['gzip', 'zstd', 'lz4', 'none'],
+                        help='Compression of the files of ratings and reviews')
+    parser.add_argument('--stop-users', action='store_true',
+                        help='Only download the pages of the users until the main column of the profile')
+    parser.add_argument('--trace', default=None, help='JSONL file for the spans of the pipeline (default: no trace)')
+    parser.add_argument('--sample-rate', type=float, default=1.0, help='Proportion of the pages traced')
+    args = parser.parse_args()
+
+    data_folder = args.data_folder
+    if data_folder is None:
+        data_folder = tempfile.mkdtemp(prefix='ba_stub_') + '/'
+
+    site = SyntheticSite(nbr_breweries=args.breweries, nbr_users=args.users, max_ratings=args.max_ratings,
+                         page_size=args.page_size, seed=args.seed)
+
+    server = StubServer(latency=args.latency, site=site, error_rate=args.error_rate, max_rate=args.server_rate)
+    server.start()
+
+    print('Synthetic site at {} ({}), data in {}'.format(server.url, site.expected(), data_folder))
+
+    metrics = Metrics()
+    tracer = Tracer(args.trace, sample_rate=args.sample_rate)
+    crawler = Crawler(0.01, data_folder=data_folder, concurrency=args.concurrency, max_rate=args.max_rate,
+                      base_url=server.url, progress=False, metrics=metrics, tracer=tracer,
+                      cookies=dict(xf_session='stub'), user_stop_after=PROFILE_COLUMN if args.stop_users else None)
+    parser = Parser(data_folder, metrics=metrics, tracer=tracer, processes=args.processes, backend=args.backend,
+                    index=RatingIndex(args.index_file), columnar=args.columnar, codec=args.codec)
+
+    exporter = MetricsServer(metrics, port=args.metrics_port, snapshot_file=data_folder + 'misc/metrics.json')
+    exporter.start()
+    if exporter.url is not None:
+        print('Metrics at {}'.format(exporter.url))
+
+    times = run_steps(crawler, parser, fused=args.fused, archive=not args.no_archive)
+
+    exporter.stop()
+    tracer.close()
+    parser.index.close()
+    server.stop()
+
+    print('')
+    for step, seconds in times.items():
+        print('Step {:2d}: {}'.format(step, datetime.timedelta(seconds=seconds)))
+    print('Total: {} for {:d} requests on {:d} connections ({:d} errors 500, {:d} throttled)'.format(
+        datetime.timedelta(seconds=sum(times.values())), server.nbr_requests, server.nbr_connections,
+        server.nbr_errors, server.nbr_throttled))
+    print(crawler.rate)
+    print('Duplicate ratings: {:d} {}'.format(parser.index.total_duplicates(), parser.index.duplicates))
+    print('')
+
+    if not check(data_folder, site, args.columnar):
+        print('---------------------------------------------------------------------')
+        print('')
+        print('THE PARSED DATA DO NOT MATCH THE SYNTHETIC SITE')
+        print('---------------------------------------------------------------------')
+        print('')
+
+
+if __name__ == '__main__':
+    run()
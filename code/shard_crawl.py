@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       This file runs the steps 9 (beers) and 13 (users) with several workers.      ##
+##    Each worker crawls a deterministic partition of the beers or of the users.      ##
+##                                                                                    ##
+##   Several processes on this host:                                                  ##
+##       python shard_crawl.py run --step 9 --shards 4                                ##
+##   One worker per host (shared data folder):                                        ##
+##       python shard_crawl.py run --step 9 --shards 4 --shard 0                      ##
+##   Merge the frontiers of the workers and check the coverage:                       ##
+##       python shard_crawl.py verify --step 9 --shards 4                             ##
+##                                                                                    ##
+########################################################################################
+
+from classes.shard import verify_coverage
+from classes.crawler import Crawler
+from classes.metrics import Metrics, MetricsServer
+import multiprocessing
+import argparse
+import sys
+
+
+def crawl_shard(args, shard):
+    """
+    Run the crawl of one shard
+
+    :param args: Arguments of the command line
+    :param shard: Shard to crawl
+    """
+
+    # The ceiling of the rate is shared between all the workers. The progress lines of several processes would
+    # overwrite each other.
+    crawler = Crawler(data_folder=args.data_folder, concurrency=args.concurrency,
+                      max_rate=args.max_rate / args.shards, shard=shard, nbr_shards=args.shards,
+                      base_url=args.base_url, progress=args.shard is not None, metrics=Metrics())
+
+    # One endpoint per worker
+    exporter = None
+    if args.metrics_port is not None:
+        exporter = MetricsServer(crawler.metrics, port=args.metrics_port + shard,
+                                 snapshot_file=args.data_folder + 'misc/metrics_{:d}.json'.format(shard))
+        exporter.start()
+
+    if args.step == 9:
+        crawler.crawl_all_beers_and_reviews()
+    else:
+        crawler.crawl_all_users()
+
+    if exporter is not None:
+        exporter.stop()
+
+
+def run():
+    """
+    Parse the command line and run the workers or the verification
+    """
+
+    parser = argparse.ArgumentParser(description='Sharded crawl of the beers (step 9) or the users (step 13)')
+    parser.add_argument('command', choices=['run', 'verify'])
+    parser.add_argument('--step', type=int, choices=[9, 13], required=True)
+    parser.add_argument('--shards', type=int, required=True, help='Total number of workers')
+    parser.add_argument('--shard', type=int, default=None, help='Only run this worker (default: all of them)')
+    parser.add_argument('--data-folder', default='../data/')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight per worker')
+    parser.add_argument('--max-rate', type=float, default=10, help='Ceiling of requests/s for all the workers')
+    parser.add_argument('--base-url', default=None)
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Port of the metrics of the first worker (the worker i uses this port + i)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.shard is not None:
+            crawl_shard(args, args.shard)
+        else:
+            processes = [multiprocessing.Process(target=crawl_shard, args=(args, shard))
+                         for shard in range(args.shards)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+
+    res = verify_coverage(args.data_folder, args.step, args.shards)
+
+    print('Expected: {:d}'.format(res['expected']))
+    for shard, nbr in enumerate(res['missing']):
+        print('Shard {:d}: {:d} missing'.format(shard, nbr))
+    print('Pages not done: {:d}'.format(res['not_done']))
+
+    if sum(res['missing']) > 0 or res['not_done'] > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
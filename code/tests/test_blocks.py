@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.blocks import BlockWriter, open_blocks, output_file, codec_of, extensions
+import pytest
+import gzip
+
+CODECS = ['gzip', 'zstd', 'lz4', 'none']
+
+
+def records(nbr, start=0):
+    return [('beer_id: {:d}\nuser_id: user.{:d}\ntext: {}\n\n'.format(i, i % 97, 'x' * (i % 50))).encode('utf-8')
+            for i in range(start, start + nbr)]
+
+
+def filename(tmp_path, codec):
+    return str(tmp_path / ('ratings.txt' + extensions[codec]))
+
+
+def skip_without(codec):
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+    elif codec == 'lz4':
+        pytest.importorskip('lz4.frame')
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_with_many_blocks(tmp_path, codec):
+    skip_without(codec)
+
+    data = records(5000)
+    with BlockWriter(filename(tmp_path, codec), block_size=4096, threads=3) as f:
+        for record in data:
+            f.write(record)
+
+    with open_blocks(filename(tmp_path, codec)) as f:
+        assert f.read() == b''.join(data)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_append_after_flush(tmp_path, codec):
+    skip_without(codec)
+
+    first = records(300)
+    second = records(300, 300)
+
+    f = BlockWriter(filename(tmp_path, codec), block_size=1000)
+    for record in first:
+        f.write(record)
+    f.flush()
+
+    # Complete blocks: the file can be read up to there before it is closed
+    with open_blocks(filename(tmp_path, codec)) as reader:
+        assert reader.read() == b''.join(first)
+    f.close()
+
+    with BlockWriter(filename(tmp_path, codec), block_size=1000, mode='ab') as f:
+        for record in second:
+            f.write(record)
+
+    with open_blocks(filename(tmp_path, codec)) as reader:
+        assert reader.read() == b''.join(first + second)
+
+
+def test_gzip_readable_by_gzip_open_and_deterministic(tmp_path):
+    data = b''.join(records(2000))
+
+    for name in ['a.txt.gz', 'b.txt.gz']:
+        with BlockWriter(str(tmp_path / name), block_size=2048, threads=2) as f:
+            f.write(data)
+
+    with gzip.open(str(tmp_path / 'a.txt.gz'), 'rb') as f:
+        assert f.read() == data
+
+    assert (tmp_path / 'a.txt.gz').read_bytes() == (tmp_path / 'b.txt.gz').read_bytes()
+
+
+def test_unknown_codec(tmp_path):
+    with pytest.raises(ValueError):
+        BlockWriter(str(tmp_path / 'ratings.txt'), codec='bzip2')
+
+
+def test_codec_of_and_output_file(tmp_path):
+    assert codec_of('ratings.txt.gz') == 'gzip'
+    assert codec_of('ratings.txt.zst') == 'zstd'
+    assert codec_of('ratings.txt.lz4') == 'lz4'
+    assert codec_of('ratings.txt') == 'none'
+
+    prefix = str(tmp_path / 'ratings.txt')
+
+    # gzip when there is no file yet
+    assert output_file(prefix) == prefix + '.gz'
+
+    (tmp_path / 'ratings.txt.lz4').write_bytes(b'')
+    assert output_file(prefix) == prefix + '.lz4'
@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.cache import ResponseCache
+import threading
+import pytest
+import time
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.001)
+
+
+def test_identical_requests_coalesced():
+    cache = ResponseCache()
+    release = threading.Event()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return FakeResponse(b'page')
+
+    results = []
+
+    def get():
+        results.append(cache.get('a', fetch))
+
+    leader = threading.Thread(target=get, daemon=True)
+    leader.start()
+    wait_for(lambda: 'a' in cache.in_flight)
+
+    followers = [threading.Thread(target=get, daemon=True) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    wait_for(lambda: cache.coalesced == 3)
+
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(fetches) == 1
+    assert len(results) == 4 and all(r is results[0] for r in results)
+    assert cache.stats()['misses'] == 1
+
+    # Then served from the cache
+    assert cache.get('a', fetch) is results[0]
+    assert cache.hits == 1 and len(fetches) == 1
+
+
+def test_leader_raising_releases_the_waiters():
+    cache = ResponseCache()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise KeyboardInterrupt
+
+    errors = []
+
+    def get():
+        try:
+            cache.get('a', fetch)
+        except BaseException as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=get, daemon=True)
+    leader.start()
+    wait_for(lambda: 'a' in cache.in_flight)
+    follower = threading.Thread(target=get, daemon=True)
+    follower.start()
+    wait_for(lambda: cache.coalesced == 1)
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert not leader.is_alive() and not follower.is_alive()
+    assert len(errors) == 2 and all(isinstance(e, KeyboardInterrupt) for e in errors)
+    assert cache.in_flight == {}
+
+    # Nothing cached, the next request is done again
+    assert cache.get('a', lambda: FakeResponse(b'page')).content == b'page'
+
+
+def test_lru_bounded_in_size():
+    cache = ResponseCache(max_bytes=30)
+    for url in ['a', 'b', 'c']:
+        cache.get(url, lambda: FakeResponse(b'x' * 10))
+
+    # a is used again, b is the least recently used
+    cache.get('a', lambda: pytest.fail('a is in the cache'))
+    cache.get('d', lambda: FakeResponse(b'x' * 10))
+
+    assert list(cache.entries) == ['c', 'a', 'd']
+    assert cache.evictions == 1
+    assert cache.size == 30
+
+    # Larger than the cache: never kept
+    cache.get('e', lambda: FakeResponse(b'x' * 31))
+    assert 'e' not in cache.entries
+
+
+def test_responses_expire():
+    cache = ResponseCache(ttl=0.05)
+    cache.get('a', lambda: FakeResponse(b'old'))
+    time.sleep(0.1)
+
+    assert cache.get('a', lambda: FakeResponse(b'new')).content == b'new'
+    assert cache.expirations == 1
+
+
+def test_bad_responses_not_cached():
+    cache = ResponseCache()
+    cache.get('a', lambda: FakeResponse(b'', 500))
+
+    assert cache.get('a', lambda: FakeResponse(b'page')).content == b'page'
+    assert cache.misses == 2
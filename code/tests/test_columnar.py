@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.stub_server import StubServer
+from classes.stub_site import SyntheticSite
+from classes.crawler import Crawler
+from classes.parser import Parser
+from classes.helpers import read_ratings, RATING_COLUMNS
+from classes.columnar import convert
+from classes.blocks import output_file
+from run_ba import run_steps
+import pandas as pd
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+DTYPES = {'int': np.dtype(np.int64), 'float': np.dtype(np.float64), 'date': np.dtype('datetime64[s]'),
+          'bool': np.dtype(bool)}
+
+
+def same_type(dtype, type_):
+    # Object or string dtype for the strings, depending on the version of pandas
+    if type_ == 'str':
+        return pd.api.types.is_string_dtype(dtype)
+    return dtype == DTYPES[type_]
+
+
+@pytest.fixture(scope='module')
+def parsed(tmp_path_factory):
+    site = SyntheticSite(nbr_breweries=12, nbr_users=40, max_ratings=30)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path_factory.mktemp('columnar')) + '/'
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    # The parser writes the Parquet files record by record, the Arrow files are converted from the txt.gz files
+    parser = Parser(data_folder, columnar='parquet')
+    try:
+        run_steps(crawler, parser, steps=range(1, 12))
+        parser.convert_columnar(format_='arrow')
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    return data_folder + 'parsed/'
+
+
+@pytest.mark.parametrize('name', ['ratings', 'reviews'])
+@pytest.mark.parametrize('format_', ['parquet', 'arrow'])
+def test_same_columns_as_the_text_file(parsed, name, format_):
+    text = read_ratings(output_file(parsed + name + '.txt'))
+    columnar = read_ratings(parsed + name + '.' + format_)
+
+    assert len(text) > 100
+    assert list(columnar.columns) == list(text.columns)
+
+    types = dict(RATING_COLUMNS)
+    for column in columnar.columns:
+        assert same_type(columnar[column].dtype, types[column]), column
+        assert columnar[column].dtype == text[column].dtype, column
+        pd.testing.assert_series_equal(columnar[column], text[column], check_names=False)
+
+    # No 'nan' string: the missing values are nulls
+    for column in ['text', 'user_name', 'style']:
+        assert not (columnar[column] == 'nan').any()
+    if name == 'ratings':
+        assert columnar['text'].isnull().any()
+        assert columnar['review'].any() and not columnar['review'].all()
+    else:
+        assert 'review' not in columnar.columns
+
+
+def test_columns_read_alone(parsed):
+    columnar = read_ratings(parsed + 'ratings.arrow', ['user_id', 'date'])
+    text = read_ratings(output_file(parsed + 'ratings.txt'), ['user_id', 'date'])
+
+    assert list(columnar.columns) == ['user_id', 'date']
+    pd.testing.assert_frame_equal(columnar, text)
+
+
+def test_empty_file(tmp_path):
+    (tmp_path / 'ratings.txt').write_bytes(b'')
+
+    assert convert(str(tmp_path / 'ratings.txt'), str(tmp_path / 'ratings.parquet')) == 0
+    df = read_ratings(str(tmp_path / 'ratings.parquet'))
+    assert len(df) == 0
+    assert list(df.columns) == [name for name, type_ in RATING_COLUMNS]
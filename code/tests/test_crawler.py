@@ -0,0 +1,205 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.stub_server import StubServer
+from classes.stub_site import SyntheticSite
+from classes.crawler import Crawler, PROFILE_COLUMN, NEW_REVIEWS_STEP
+from classes.parser import Parser
+import pandas as pd
+import requests
+import pytest
+import time
+import os
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_user_pages_keep_the_connection(tmp_path, concurrency):
+    # The pages are padded after the main column of the profile, where the download stops
+    site = SyntheticSite(nbr_users=40, page_size=40000)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'user_name': [user['user_name'] for user in site.users],
+                  'user_id': [user['user_id'] for user in site.users]}).to_csv(data_folder + 'parsed/users.csv',
+                                                                             index=False)
+
+    crawler = Crawler(0, data_folder=data_folder, concurrency=concurrency, base_url=server.url, progress=False,
+                      user_stop_after=PROFILE_COLUMN)
+    try:
+        crawler.crawl_all_users()
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    assert crawler.frontier.count(13, 'done') == len(site.users)
+    assert server.nbr_requests == len(site.users)
+    assert server.nbr_connections <= concurrency
+
+    for user in site.users:
+        page = crawler.store.get('users/{}.html'.format(user['user_id']))
+        if user['status'] == 'normal':
+            assert b'<div class="mainProfileColumn">' in page
+            assert len(page) < 40000
+
+
+def test_cookies_only_for_the_restricted_users(tmp_path):
+    site = SyntheticSite(nbr_users=60)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'user_name': [user['user_name'] for user in site.users],
+                  'user_id': [user['user_id'] for user in site.users]}).to_csv(data_folder + 'parsed/users.csv',
+                                                                             index=False)
+
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False,
+                      cookies=dict(xf_session='stub'))
+    parser = Parser(data_folder, processes=1)
+    try:
+        crawler.crawl_all_users()
+        parser.parse_all_users()
+        crawler.crawl_users_with_cookies()
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    restricted = [user for user in site.users if user['status'] == 'restricted']
+    assert len(restricted) > 0
+
+    # The step 13 is anonymous, the cookies are only on the fetcher of the step 15 (without cache)
+    assert len(crawler.fetcher.session.cookies) == 0
+    assert crawler.cookie_fetcher.cache is None
+    assert crawler.frontier.count(15, 'done') == len(restricted)
+
+    for user in restricted:
+        page = crawler.store.get('users/{}.html'.format(user['user_id']))
+        assert b'<div class="mainProfileColumn">' in page
+
+
+@pytest.mark.parametrize('max_drain', [262144, 1000])
+def test_closed_breweries_probed_once(tmp_path, max_drain):
+    site = SyntheticSite(nbr_breweries=12, nbr_users=10, max_ratings=5, page_size=40000)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    open_ids = [id_ for id_, brewery in site.breweries.items() if brewery['kind'] == 'open']
+    pd.DataFrame({'id': open_ids}).to_csv(data_folder + 'parsed/breweries.csv', index=False)
+    closed_ids = [id_ for id_, brewery in site.breweries.items() if brewery['kind'] == 'closed']
+
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    crawler.fetcher.max_drain = max_drain
+    try:
+        crawler.crawl_all_closed_breweries()
+        nbr_requests = server.nbr_requests
+        pages = dict((id_, requests.get(server.url + '/beer/profile/{:d}/?view=beers&show=all'.format(id_)).content)
+                     for id_ in closed_ids)
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    nbr_probes = max(open_ids) - len(open_ids)
+    if max_drain > 40000:
+        # The rest of the pages was read after the Type line: the probes got the whole pages of the breweries
+        assert nbr_requests == nbr_probes
+    else:
+        assert nbr_requests == nbr_probes + len(closed_ids)
+
+    assert crawler.frontier.count(5, 'done') == len(closed_ids)
+    for id_ in closed_ids:
+        assert crawler.store.get('breweries/{}.html'.format(id_)) == pages[id_]
+
+
+def test_new_reviews_stop_at_the_first_known_review(tmp_path):
+    site = SyntheticSite(nbr_breweries=12, nbr_users=60, max_ratings=120)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'brewery_id': [beer['brewery']['id'] for beer in site.beers.values()],
+                  'beer_id': list(site.beers.keys())}).to_csv(data_folder + 'parsed/beers.csv', index=False)
+
+    # The newest ratings of each beer are not known yet
+    known = set()
+    nbr_pages = 0
+    for beer_id, beer in site.beers.items():
+        ratings = sorted(beer['ratings'], key=lambda r: r['date'], reverse=True)
+        nbr_new = (beer_id * 17) % (len(ratings) + 1)
+        known |= set((rating['user']['user_id'], beer_id) for rating in ratings[nbr_new:])
+        # Full pages of new reviews, then the page with the first known review (or the last page)
+        nbr_pages += nbr_new // 25 + 1
+    assert nbr_pages > len(site.beers)
+
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    try:
+        delta = crawler.crawl_new_reviews(known)
+        nbr_requests = server.nbr_requests
+
+        # Next run: everything is known, only the first pages in a new delta
+        known |= set((rating['user']['user_id'], beer_id) for beer_id, beer in site.beers.items()
+                     for rating in beer['ratings'])
+        time.sleep(1)
+        next_delta = crawler.crawl_new_reviews(known)
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    assert nbr_requests == nbr_pages
+    assert sum(len(crawler.store.list(delta + 'beers/{}/'.format(brewery_id)))
+               for brewery_id in crawler.store.list(delta + 'beers/')) == len(site.beers)
+
+    assert next_delta != delta
+    assert server.nbr_requests == nbr_pages + len(site.beers)
+    assert crawler.frontier.count(NEW_REVIEWS_STEP) == len(site.beers)
+    assert crawler.frontier.count(NEW_REVIEWS_STEP, 'done') == len(site.beers)
+
+
+def test_refresh_with_conditional_requests(tmp_path):
+    site = SyntheticSite(nbr_users=30)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'user_name': [user['user_name'] for user in site.users],
+                  'user_id': [user['user_id'] for user in site.users]}).to_csv(data_folder + 'parsed/users.csv',
+                                                                             index=False)
+
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    try:
+        crawler.crawl_all_users()
+        assert server.nbr_conditional == 0
+        files = dict((user['user_id'], 'users/{}.html'.format(user['user_id'])) for user in site.users)
+        pages = dict((file, crawler.store.get(file)) for file in files.values())
+
+        # Nothing changed: every request has the ETag and the server answers 304
+        assert crawler.refresh(13) == set()
+        assert server.nbr_conditional == len(site.users)
+        assert server.nbr_not_modified == len(site.users)
+        assert crawler.frontier.count(13, 'done') == len(site.users)
+        assert all(crawler.store.get(file) == page for file, page in pages.items())
+
+        # One user moved: new ETag and new content
+        user = next(user for user in site.users if user['status'] == 'normal')
+        user['location'] = 'Lausanne, Switzerland'
+        assert crawler.refresh(13) == {files[user['user_id']]}
+        assert server.nbr_conditional == 2 * len(site.users)
+        assert server.nbr_not_modified == 2 * len(site.users) - 1
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    for file, page in pages.items():
+        if file == files[user['user_id']]:
+            assert b'Lausanne, Switzerland' in crawler.store.get(file)
+        else:
+            assert crawler.store.get(file) == page
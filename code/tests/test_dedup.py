@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.dedup import RatingIndex, rating_key
+from classes.blocks import BlockWriter
+import pytest
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def index(request, tmp_path):
+    if request.param == 'memory':
+        index = RatingIndex()
+    else:
+        # Small batches and filter: the keys go on disk and the filter has false positives
+        index = RatingIndex(str(tmp_path / 'misc' / 'index.sqlite'), expected=100, batch_size=7)
+    yield index
+    index.close()
+
+
+def test_one_rating_per_user_and_beer(index):
+    assert index.add('a.1', 10)
+    assert index.add('a.1', 11)
+    assert index.add('b.2', 10)
+    assert not index.add('a.1', 10)
+    assert not index.add('a.1', '10', source='delta')
+    assert not index.add('b.2', 10, source='delta')
+
+    assert ('a.1', 10) in index
+    assert ('b.2', 11) not in index
+    assert len(index) == 3
+    assert index.added == 3
+    assert index.duplicates == {'pages': 1, 'delta': 2}
+    assert index.total_duplicates() == 3
+
+
+def test_many_keys_exact(index):
+    for i in range(2000):
+        assert index.add('user.{:d}'.format(i), i % 50)
+
+    # The filter is full (100 expected keys), the answers stay exact
+    for i in range(2000):
+        assert ('user.{:d}'.format(i), i % 50) in index
+        assert ('user.{:d}'.format(i), i % 50 + 1) not in index
+    assert index.total_duplicates() == 0
+    assert len(index) == 2000
+
+
+def test_update_does_not_count_the_duplicates(index):
+    assert index.update([('a.1', 1), ('a.1', 1), ('b.1', 1)]) == 2
+    assert index.duplicates == {}
+    assert not index.add('b.1', 1)
+
+
+def test_clear(index):
+    index.add('a.1', 1)
+    index.add('a.1', 1)
+    index.clear()
+
+    assert len(index) == 0
+    assert index.duplicates == {}
+    assert index.add('a.1', 1)
+
+
+def test_load(index, tmp_path):
+    filename = str(tmp_path / 'ratings.txt.gz')
+    with BlockWriter(filename) as f:
+        for user_id, beer_id in [('a.1', 1), ('b.2', 1), ('a.1', 2)]:
+            f.write('beer_id: {:d}\nuser_id: {}\nreview: False\n\n'.format(beer_id, user_id).encode('utf-8'))
+
+    assert index.load(filename) == 3
+    assert index.load(str(tmp_path / 'missing.txt.gz')) == 0
+    assert not index.add('b.2', 1)
+    assert index.add('b.2', 2)
+
+
+def test_keys_kept_on_disk(tmp_path):
+    file = str(tmp_path / 'index.sqlite')
+
+    index = RatingIndex(file, expected=100, batch_size=7)
+    for i in range(50):
+        index.add('user.{:d}'.format(i), i)
+    index.close()
+
+    # The filter is filled again with the keys of the file
+    index = RatingIndex(file, expected=100)
+    assert len(index) == 50
+    assert not index.add('user.3', 3)
+    assert index.add('user.3', 4)
+    index.close()
+
+
+def test_rating_key_stable():
+    assert rating_key('a.1', 10) == rating_key('a.1', '10')
+    assert rating_key('a.1', 10) != rating_key('a.1', 11)
+    assert -2 ** 63 <= rating_key('a.1', 10) < 2 ** 63
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.engine import FetchEngine
+from classes.retry import RetryPolicy, CircuitBreaker
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'page'):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+def engine(concurrency, attempts=3):
+    return FetchEngine(concurrency, policy=RetryPolicy(attempts=attempts, base=0.01, seed=0),
+                       breaker=CircuitBreaker(min_requests=1000, verbose=False))
+
+
+def test_concurrency_bounded():
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'max': 0}
+
+    def get(url):
+        with lock:
+            state['in_flight'] += 1
+            state['max'] = max(state['max'], state['in_flight'])
+        time.sleep(0.02)
+        with lock:
+            state['in_flight'] -= 1
+        return FakeResponse()
+
+    tasks = [('http://ba/{:d}'.format(i), i) for i in range(40)]
+    results = list(engine(4).fetch(iter(tasks), get))
+
+    # Every task once, with the rest of its tuple
+    assert sorted((task for task, r in results), key=lambda task: task[1]) == tasks
+    assert state['max'] == 4
+
+
+def test_results_as_they_finish():
+    def get(url):
+        if url.endswith('/slow'):
+            time.sleep(0.3)
+        return FakeResponse(content=url.encode('utf-8'))
+
+    tasks = ['http://ba/slow'] + ['http://ba/{:d}'.format(i) for i in range(5)]
+    results = list(engine(2).fetch(tasks, get))
+
+    assert [task for task, r in results][-1] == 'http://ba/slow'
+    assert all(r.content == task.encode('utf-8') for task, r in results)
+
+
+def test_bad_responses_fetched_again():
+    calls = {}
+
+    def get(url):
+        calls[url] = calls.get(url, 0) + 1
+        if url.endswith('/flaky') and calls[url] < 3:
+            return FakeResponse(500)
+        if url.endswith('/down'):
+            raise IOError('connection refused')
+        if url.endswith('/missing'):
+            return FakeResponse(404)
+        return FakeResponse()
+
+    results = dict(engine(3).fetch(['http://ba/flaky', 'http://ba/down', 'http://ba/missing', 'http://ba/ok'], get))
+
+    assert results['http://ba/flaky'].status_code == 200 and calls['http://ba/flaky'] == 3
+    # All the attempts failed: None for an exception
+    assert results['http://ba/down'] is None and calls['http://ba/down'] == 3
+    # Terminal status: not fetched again
+    assert results['http://ba/missing'].status_code == 404 and calls['http://ba/missing'] == 1
+    assert calls['http://ba/ok'] == 1
+
+
+def test_cached_pages_not_fetched():
+    fetched = []
+
+    def get(url):
+        fetched.append(url)
+        return FakeResponse()
+
+    def cached(url):
+        return FakeResponse(content=b'cached') if url.endswith('/0') else None
+
+    results = dict(engine(2).fetch(['http://ba/0', 'http://ba/1'], get, cached=cached))
+
+    assert results['http://ba/0'].content == b'cached'
+    assert fetched == ['http://ba/1']
@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.extract import Extractor, SPECS
+from classes.stub_site import SyntheticSite
+from benchmark_extract import synthetic_pages
+import pytest
+
+pytest.importorskip('lxml')
+
+
+@pytest.fixture(scope='module')
+def site():
+    return SyntheticSite(nbr_breweries=20, nbr_users=80, max_ratings=60)
+
+
+@pytest.fixture(scope='module')
+def pages(site):
+    pages = synthetic_pages(site)
+
+    # Reviews sorted by time (incremental step) and full profiles of the restricted users (cookies)
+    for beer in site.beers.values():
+        url = '/beer/profile/{:d}/{:d}/?view=beer&sort=time&start=0'.format(beer['brewery']['id'], beer['id'])
+        pages['beer'].append(site.render(url)[1].decode('utf-8'))
+    for user in site.users:
+        url = '/community/members/{}/'.format(user['user_id'])
+        pages['member'].append(site.render(url, 'xf_session=1')[1].decode('utf-8'))
+
+    return pages
+
+
+@pytest.mark.parametrize('page', list(SPECS))
+def test_same_records_with_both_backends(pages, page):
+    dom = Extractor('dom')
+    regex = Extractor('regex')
+
+    assert len(pages[page]) > 0
+    for html_txt in pages[page]:
+        assert dom.extract(page, html_txt) == regex.extract(page, html_txt)
+
+    # All the fields are found on some pages
+    for field in SPECS[page]:
+        assert any(regex.extract(page, html_txt, [field])[field] for html_txt in pages[page]), field
+
+
+def test_records_of_a_beer(pages):
+    records = [record for html_txt in pages['beer'] for record in Extractor('dom').extract('beer', html_txt)['ratings']]
+
+    assert any(record['text'] is not None for record in records)
+    assert any(record['text'] is None for record in records)
+    assert all(record['user_id'] is not None and record['rating'] is not None for record in records)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Extractor('bs4')
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.stub_server import StubServer
+from classes.fetcher import Fetcher
+from classes.prober import BreweryProber
+import pytest
+
+
+@pytest.fixture
+def server():
+    server = StubServer(latency=0.0, page_size=20000)
+    server.start()
+    yield server
+    server.stop()
+
+
+class Writer:
+    """
+    Writer of a page in memory (see PageStore.writer)
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.chunks = []
+
+
+class Response:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+def test_keep_alive(server):
+    fetcher = Fetcher()
+    for i in range(10):
+        r = fetcher.get(server.url + '/{:d}'.format(i))
+        assert len(r.content) == 20000
+    fetcher.close()
+
+    assert server.nbr_connections == 1
+
+
+def test_stop_after_keeps_the_connection(server):
+    fetcher = Fetcher()
+    for i in range(10):
+        r = fetcher.get(server.url + '/{:d}'.format(i), stop_after=b'xxxx', tail=100)
+        assert r.truncated
+        assert r.content.startswith(b'<html>xxxx')
+        assert len(r.content) < 20000
+    fetcher.close()
+
+    assert server.nbr_requests == 10
+    assert server.nbr_connections == 1
+
+
+def test_stop_after_closes_large_pages(server):
+    server.page_size = 2000000
+
+    fetcher = Fetcher(max_drain=1000)
+    for i in range(3):
+        r = fetcher.get(server.url + '/{:d}'.format(i), stop_after=b'xxxx', tail=100)
+        assert r.truncated
+    fetcher.close()
+
+    assert server.nbr_connections == 3
+
+
+def test_sink(server):
+    fetcher = Fetcher()
+    writer = Writer()
+    r = fetcher.get(server.url + '/page', sink=lambda: writer)
+    fetcher.close()
+
+    assert r.streamed
+    assert r.size == 20000
+    assert writer.closed
+    assert len(b''.join(writer.chunks)) == 20000
+
+
+def test_classify_probe():
+    prober = BreweryProber(None)
+
+    page = '<div>\n\t\t<b>Type:</b> Brewery, Bar, Café\n\t\t<br>\n'.encode('utf-8')
+    assert prober.classify(Response(200, page)) == 'brewery'
+    assert prober.classify(Response(200, page.replace(b'Brewery, ', b''))) == 'other'
+
+    # Cut in the middle of a character: probed again
+    assert prober.classify(Response(200, page[:page.index(b'\xa9')])) is None
+
+    assert prober.classify(Response(404, b'')) == 'not-found'
+    assert prober.classify(Response(500, b'')) is None
+    assert prober.classify(None) is None
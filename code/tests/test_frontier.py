@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.frontier import Frontier
+import pytest
+
+
+class FakeStore:
+    """
+    Store with some pages already crawled, counting the lookups
+    """
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.lookups = []
+
+    def size(self, file):
+        self.lookups.append(file)
+        return self.sizes.get(file)
+
+    def fetched_at(self, file):
+        return 123.0
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = Frontier(str(tmp_path / 'frontier.sqlite'))
+    yield frontier
+    frontier.close()
+
+
+def test_add_ignores_known_pages(frontier):
+    assert frontier.add(9, [('a', 'f/a'), ('b', 'f/b')]) == 2
+    assert frontier.add(9, [('a', 'f/a'), ('c', 'f/c'), ('c', 'f/c')]) == 1
+    assert frontier.count(9) == 3
+    assert frontier.count(9, 'pending') == 3
+
+    # Same url in another step
+    assert frontier.add(13, [('a', 'f/a')]) == 1
+
+
+def test_add_checks_the_store_only_for_new_pages(frontier):
+    frontier.add(9, [('a', 'f/a')])
+
+    store = FakeStore({'f/a': 10, 'f/b': 20})
+    assert frontier.add(9, [('a', 'f/a'), ('b', 'f/b'), ('c', 'f/c')], store) == 2
+    assert store.lookups == ['f/b', 'f/c']
+
+    assert frontier.count(9, 'done') == 1
+    assert frontier.fetched_at('f/b') == 123.0
+    assert frontier.count(9, 'pending') == 2
+
+
+def test_files_of_a_state(frontier):
+    frontier.add(9, [('a', 'f/a'), ('b', 'f/b')], FakeStore({'f/a': 10}))
+    frontier.add(13, [('c', 'f/c')], FakeStore({'f/c': 10}))
+
+    assert frontier.files(9) == ['f/a']
+    assert frontier.files(9, 'pending') == ['f/b']
+    assert frontier.files(13) == ['f/c']
+
+
+def test_claim_by_priority_then_cost(frontier):
+    frontier.add(9, [('low', 'f/low', 0, 5), ('high', 'f/high', 1, 1), ('big', 'f/big', 1, 10)])
+
+    assert frontier.claim(9, 2) == [('big', 'f/big'), ('high', 'f/high')]
+    assert frontier.count(9, 'in-flight') == 2
+    assert list(frontier.pending(9)) == [('low', 'f/low')]
+    assert frontier.claim(9) == []
+
+
+def test_states(frontier):
+    frontier.add(9, [('a', 'f/a'), ('b', 'f/b'), ('c', 'f/c'), ('d', 'f/d')])
+    frontier.claim(9, 4)
+
+    frontier.done(9, 'a', 200, 100)
+    frontier.failed(9, 'b', 500)
+    frontier.dead(9, 'c', 404, 'terminal')
+
+    assert frontier.count(9, 'done') == 1
+    assert frontier.count(9, 'failed') == 1
+    assert frontier.count(9, 'dead') == 1
+    assert frontier.count(9, 'in-flight') == 1
+    assert frontier.fetched_at('f/a') is not None
+
+    # Interrupted crawl: the pages in flight and the failed ones are pending again, not the dead ones
+    frontier.reset(9)
+    assert frontier.count(9, 'pending') == 2
+    assert sorted(frontier.claim(9)) == [('b', 'f/b'), ('d', 'f/d')]
+
+    letters = frontier.dead_letters(9)
+    assert [(step, url, file, status, reason) for step, url, file, status, reason, _ in letters] == \
+        [(9, 'c', 'f/c', 404, 'terminal')]
+
+    assert frontier.replay(9, status=500) == 0
+    assert frontier.replay(9) == 1
+    assert frontier.dead_letters() == []
+    assert frontier.count(9, 'pending') == 1
+
+
+def test_reset_keeps_failed(frontier):
+    frontier.add(9, [('a', 'f/a'), ('b', 'f/b')])
+    frontier.claim(9)
+    frontier.failed(9, 'a')
+
+    frontier.reset(9, failed=False)
+    assert frontier.count(9, 'failed') == 1
+    assert frontier.count(9, 'pending') == 1
+
+
+def test_claims_shared_by_two_connections(tmp_path):
+    first = Frontier(str(tmp_path / 'frontier.sqlite'))
+    second = Frontier(str(tmp_path / 'frontier.sqlite'))
+    first.add(9, [('u{:d}'.format(i), 'f/{:d}'.format(i)) for i in range(10)])
+
+    claimed = first.claim(9, 4) + second.claim(9, 4) + first.claim(9, 4) + second.claim(9, 4)
+    assert sorted(claimed) == sorted(set(claimed))
+    assert len(claimed) == 10
+
+    first.close()
+    second.close()
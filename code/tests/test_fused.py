@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.stub_server import StubServer
+from classes.stub_site import SyntheticSite
+from classes.crawler import Crawler
+from classes.parser import Parser
+from classes.fused import FusedBeerCrawl
+from classes.helpers import read_ratings
+from run_ba import run_steps
+import pandas as pd
+import pytest
+import json
+
+
+class Interrupted(FusedBeerCrawl):
+    """
+    Fused crawl killed after a number of pages
+    """
+
+    def __init__(self, crawler, parser, nbr_pages, **kwargs):
+        FusedBeerCrawl.__init__(self, crawler, parser, **kwargs)
+        self.nbr_pages = nbr_pages
+
+    def save(self, file, r):
+        if self.nbr_pages == 0:
+            raise KeyboardInterrupt
+        self.nbr_pages -= 1
+        FusedBeerCrawl.save(self, file, r)
+
+
+@pytest.fixture
+def site_folder(tmp_path):
+    site = SyntheticSite(nbr_breweries=12, nbr_users=40, max_ratings=30)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path) + '/'
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    parser = Parser(data_folder)
+    run_steps(crawler, parser, steps=range(1, 9))
+
+    yield site, crawler, parser
+
+    crawler.fetcher.close()
+    server.stop()
+
+
+def test_interrupted_run_writes_every_rating_once(site_folder):
+    site, crawler, parser = site_folder
+
+    fused = Interrupted(crawler, parser, 7, checkpoint_pages=3, checkpoint_seconds=3600)
+    with pytest.raises(KeyboardInterrupt):
+        fused.run()
+
+    # The log only has the pages of complete checkpoints (plus the last one, written when the crawl stopped)
+    with open(fused.log_file) as f:
+        assert len([json.loads(line) for line in f]) == 7
+
+    FusedBeerCrawl(crawler, parser, checkpoint_pages=3, checkpoint_seconds=3600).run()
+
+    expected = site.expected()
+    df_beers = pd.read_csv(crawler.data_folder + 'parsed/beers.csv')
+    assert len(df_beers) == expected['beers']
+    assert int(df_beers['nbr_ratings'].sum()) == expected['ratings']
+    assert int(df_beers['nbr_reviews'].sum()) == expected['reviews']
+
+    ratings = read_ratings(crawler.data_folder + 'parsed/ratings.txt.gz', ['beer_id', 'user_id'])
+    assert len(ratings) == expected['ratings']
+    assert not ratings.duplicated().any()
+
+
+def test_outputs_flushed_at_the_checkpoints(site_folder):
+    site, crawler, parser = site_folder
+
+    fused = FusedBeerCrawl(crawler, parser, checkpoint_pages=1000, checkpoint_seconds=3600)
+    flushes = []
+    checkpoint = fused.checkpoint
+
+    def count():
+        flushes.append(len(fused.entries))
+        checkpoint()
+
+    fused.checkpoint = count
+    fused.run()
+
+    # One checkpoint at the end for the small site, instead of a flush per page
+    assert flushes == [crawler.frontier.count(9, 'done')]
@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.helpers import parse, parse_chunks, read_columns, map_chunks, known_ratings, RATING_COLUMNS
+from classes.blocks import BlockWriter
+import numpy as np
+import pytest
+import math
+
+COLUMNS = [name for name, type_ in RATING_COLUMNS]
+
+
+def entry(i):
+    text = 'Nice beer number {:d} '.format(i)
+    if i % 7 == 0:
+        text = 'nan'
+    elif i % 11 == 0:
+        # A line break in the text with a line that looks like a key
+        text = 'Two lines\nuser_id: not.a.user'
+
+    values = ['Beer {:d}'.format(i), i % 40, 'Brewery {:d}'.format(i % 9), i % 9, 'Stout',
+              'nan' if i % 5 == 0 else '{:.1f}'.format(4 + i % 6), 1400000000 + i * 3600, 'user{:d}'.format(i % 13),
+              'user{:d}.{:d}'.format(i % 13, i), 'nan' if i % 3 else '4.0', 4.25, 3.5, 4.0, 4.5,
+              '{:.2f}'.format(3 + (i % 20) / 10), text, i % 4 == 0]
+
+    return ''.join('{}: {}\n'.format(name, value) for name, value in zip(COLUMNS, values)) + '\n'
+
+
+@pytest.fixture
+def ratings(tmp_path):
+    filename = str(tmp_path / 'ratings.txt.gz')
+    with BlockWriter(filename, block_size=3000) as f:
+        for i in range(500):
+            f.write(entry(i).encode('utf-8'))
+    return filename
+
+
+def expected(filename, columns):
+    """
+    Values of parse with the types of read_columns
+    """
+
+    types = dict(RATING_COLUMNS)
+    values = dict((column, []) for column in columns)
+    for entry_ in parse(filename):
+        for column in columns:
+            value = entry_[column]
+            if types[column] == 'int':
+                value = int(value)
+            elif types[column] == 'float':
+                value = float(value)
+            elif types[column] == 'date':
+                value = np.datetime64(int(value), 's')
+            elif types[column] == 'bool':
+                value = value == 'True'
+            elif value == 'nan':
+                value = None
+            values[column].append(value)
+
+    return values
+
+
+def same(a, b):
+    return a == b or (isinstance(a, float) and math.isnan(a) and math.isnan(b))
+
+
+@pytest.mark.parametrize('processes,chunk_size', [(1, 32 * 1024 * 1024), (1, 1000), (2, 1000)])
+def test_read_columns_same_as_parse(ratings, processes, chunk_size):
+    values = read_columns(ratings, COLUMNS, processes, chunk_size)
+    reference = expected(ratings, COLUMNS)
+
+    assert len(values['beer_id']) == 500
+    for column in COLUMNS:
+        assert len(values[column]) == len(reference[column])
+        assert all(same(a, b) for a, b in zip(values[column].tolist(), reference[column])), column
+
+    assert values['abv'].dtype == np.float64
+    assert values['date'].dtype == np.dtype('datetime64[s]')
+    assert np.isnan(values['abv'][0])
+    assert values['text'][7] is None
+
+
+def test_read_columns_default_columns(ratings):
+    assert list(read_columns(ratings).keys()) == COLUMNS
+
+
+def test_map_chunks_in_the_order_of_the_file(ratings):
+    def nbr_entries(chunk):
+        return chunk.count(b'\n\nbeer_name: ') + 1
+
+    assert sum(map_chunks(ratings, nbr_entries, chunk_size=1000)) == 500
+
+    firsts = list(map_chunks(ratings, first_beer, (), 2, 1000))
+    assert len(firsts) > 10
+    assert firsts == sorted(firsts, key=lambda name: int(name.split()[1]))
+
+
+def first_beer(chunk):
+    # At the top of the module for the processes
+    return next(parse_chunks([chunk]))['beer_name']
+
+
+def test_known_ratings(ratings):
+    reference = expected(ratings, ['user_id', 'beer_id'])
+    assert known_ratings(ratings) == set(zip(reference['user_id'], reference['beer_id']))
@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.metrics import Metrics, MetricsServer
+import requests
+import json
+
+
+def test_endpoint_text_format(tmp_path):
+    metrics = Metrics()
+    metrics.inc('ba_requests_total', status=200)
+    metrics.inc('ba_requests_total', 2, status=200)
+    metrics.inc('ba_requests_total', status=500)
+    metrics.observe('ba_request_seconds', 0.02)
+    metrics.observe('ba_request_seconds', 0.3)
+    metrics.observe('ba_request_seconds', 100.0)
+    metrics.gauge('ba_rate', lambda: 2.5)
+
+    exporter = MetricsServer(metrics, port=0, snapshot_file=str(tmp_path / 'metrics.json'))
+    exporter.start()
+    try:
+        r = requests.get(exporter.url, timeout=5)
+        assert requests.get(exporter.url.replace('/metrics', '/other'), timeout=5).status_code == 404
+    finally:
+        exporter.stop()
+
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+
+    lines = r.text.splitlines()
+    assert '# TYPE ba_requests_total counter' in lines
+    assert 'ba_requests_total{status="200"} 3' in lines
+    assert 'ba_requests_total{status="500"} 1' in lines
+
+    # Cumulated buckets, sum and count of the histogram
+    assert '# TYPE ba_request_seconds histogram' in lines
+    assert 'ba_request_seconds_bucket{le="0.01"} 0' in lines
+    assert 'ba_request_seconds_bucket{le="0.025"} 1' in lines
+    assert 'ba_request_seconds_bucket{le="0.5"} 2' in lines
+    assert 'ba_request_seconds_bucket{le="30"} 2' in lines
+    assert 'ba_request_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'ba_request_seconds_sum 100.32' in lines
+    assert 'ba_request_seconds_count 3' in lines
+
+    assert '# TYPE ba_rate gauge' in lines
+    assert 'ba_rate 2.5' in lines
+
+    # Last snapshot written when the exporter stops
+    with open(str(tmp_path / 'metrics.json')) as f:
+        assert json.load(f)['totals']['ba_requests_total'] == 4
+
+
+def test_no_endpoint_by_default(tmp_path):
+    exporter = MetricsServer(Metrics(), snapshot_file=str(tmp_path / 'metrics.json'))
+    exporter.start()
+    exporter.stop()
+
+    assert exporter.url is None
+    assert (tmp_path / 'metrics.json').exists()
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.pagestore import PackedPageStore, FilePageStore, open_store, zstandard
+import multiprocessing
+import pytest
+
+codecs = ['zlib', pytest.param('zstd', marks=pytest.mark.skipif(zstandard is None, reason='zstandard is needed'))]
+
+
+def page(name, i):
+    return '<html><body>{} {:d}</body></html>'.format(name, i).encode('utf-8') * (i + 1)
+
+
+def write_pages(folder, name, nbr):
+    """
+    Write some pages in the store from another process
+    """
+
+    store = PackedPageStore(folder)
+    for i in range(nbr):
+        store.put('{}/{:d}.html'.format(name, i), page(name, i))
+    store.close()
+
+
+@pytest.mark.parametrize('codec', codecs)
+def test_round_trip(tmp_path, codec):
+    folder = str(tmp_path / 'store') + '/'
+    store = PackedPageStore(folder, codec=codec)
+    if codec == 'zstd':
+        store.train_dictionary([page('sample', i) for i in range(200)], dict_size=4096)
+
+    store.put('beers/1/2/0.html', page('a', 1), fetched_at=10.0)
+    store.put('beers/1/2/25.html', page('b', 2))
+
+    writer = store.writer('users/x.html', fetched_at=20.0)
+    for i in range(10):
+        writer.write(page('c', i))
+    writer.close()
+
+    aborted = store.writer('users/y.html')
+    aborted.write(b'partial')
+    aborted.abort()
+
+    store.close()
+
+    # The codec and the dictionary are the ones of the store
+    store = open_store(str(tmp_path) + '/')
+    assert isinstance(store, PackedPageStore)
+    assert store.codec == codec
+
+    assert store.get('beers/1/2/0.html') == page('a', 1)
+    assert store.get('beers/1/2/25.html') == page('b', 2)
+    assert store.get('users/x.html') == b''.join(page('c', i) for i in range(10))
+    assert store.size('users/x.html') == len(store.get('users/x.html'))
+    assert store.size('users/y.html') is None
+    assert store.fetched_at('beers/1/2/0.html') == 10.0
+    assert store.fetched_at('users/x.html') == 20.0
+
+    assert store.list('beers/') == ['1']
+    assert store.list('beers/1/2/') == ['0.html', '25.html']
+    assert store.keys() == ['beers/1/2/0.html', 'beers/1/2/25.html', 'users/x.html']
+
+    with pytest.raises(FileNotFoundError):
+        store.get('users/y.html')
+
+    store.close()
+
+
+def test_rewrite_and_segments(tmp_path):
+    folder = str(tmp_path / 'store') + '/'
+    store = PackedPageStore(folder, segment_size=100, codec='zlib')
+    for i in range(20):
+        store.put('p/{:d}.html'.format(i), page('p', i))
+    store.put('p/0.html', b'new version')
+    store.close()
+
+    store = PackedPageStore(folder)
+    assert store.get('p/0.html') == b'new version'
+    assert all(store.get('p/{:d}.html'.format(i)) == page('p', i) for i in range(1, 20))
+    assert store.db.execute('SELECT COUNT(DISTINCT segment) FROM pages').fetchone()[0] > 1
+
+    # A store that only reads does not start a segment
+    segments = store.db.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+    store.close()
+    PackedPageStore(folder).close()
+    store = PackedPageStore(folder)
+    assert store.db.execute('SELECT COUNT(*) FROM segments').fetchone()[0] == segments
+    store.close()
+
+
+def test_records_copied(tmp_path):
+    store = PackedPageStore(str(tmp_path / 'a') + '/', codec='zlib')
+    store.put('p/0.html', page('p', 3), fetched_at=5.0)
+
+    copy = PackedPageStore(str(tmp_path / 'b') + '/', codec='zlib')
+    copy.put_record('p/0.html', *store.get_record('p/0.html'))
+    assert copy.get('p/0.html') == page('p', 3)
+    assert copy.fetched_at('p/0.html') == 5.0
+
+    store.close()
+    copy.close()
+
+
+def test_concurrent_append(tmp_path):
+    folder = str(tmp_path / 'store') + '/'
+    PackedPageStore(folder, codec='zlib').close()
+
+    # Several processes write in the same store at the same time (e.g. the shards of shard_crawl.py)
+    names = ['w', 'x', 'y', 'z']
+    processes = [multiprocessing.Process(target=write_pages, args=(folder, name, 100)) for name in names]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    store = PackedPageStore(folder)
+    for name in names:
+        for i in range(100):
+            assert store.get('{}/{:d}.html'.format(name, i)) == page(name, i)
+
+    # One segment per writer
+    assert store.db.execute('SELECT COUNT(DISTINCT segment) FROM pages').fetchone()[0] == len(names)
+    store.close()
+
+
+def test_file_store(tmp_path):
+    store = open_store(str(tmp_path) + '/')
+    assert isinstance(store, FilePageStore)
+
+    store.put('beers/1/2/0.html', b'page')
+    writer = store.writer('beers/1/2/25.html')
+    writer.write(b'pa')
+    writer.write(b'ge')
+    writer.close()
+
+    assert store.get('beers/1/2/25.html') == b'page'
+    assert store.size('beers/1/2/0.html') == 4
+    assert store.size('beers/1/2/50.html') is None
+    assert sorted(store.list('beers/1/2/')) == ['0.html', '25.html']
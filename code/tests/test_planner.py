@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.planner import CrawlPlanner
+from classes.crawler import Crawler
+import pandas as pd
+import pytest
+import io
+import os
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'user_name': ['u{:d}'.format(i) for i in range(10)],
+                  'user_id': ['u{:d}.{:d}'.format(i, i) for i in range(10)]}).to_csv(data_folder + 'parsed/users.csv',
+                                                                                   index=False)
+
+    crawler = Crawler(0.5, data_folder=data_folder, concurrency=4, max_rate=8, base_url='http://ba', progress=False)
+    yield crawler
+    crawler.frontier.close()
+
+
+def test_estimate_from_the_frontier(crawler):
+    planner = CrawlPlanner(crawler, latency=1.0)
+
+    # Nothing crawled yet: the default size of a page of the step
+    est = planner.estimate(13)
+    assert est['pages'] == 10 and est['requests'] == 10
+    assert est['bytes'] == 10 * CrawlPlanner.default_sizes[13]
+
+    # 4 users done with known sizes, 1 failed and 1 page added by the crawl itself
+    tasks = crawler.user_tasks()
+    crawler.frontier.add(13, tasks[:5] + [('http://ba/extra/', 'users/extra.html')])
+    for (url, file, priority, cost), size in zip(tasks[:4], [1000, 2000, 3000, 6000]):
+        crawler.frontier.done(13, url, 200, size)
+    crawler.frontier.failed(13, tasks[4][0], 500)
+
+    assert crawler.frontier.average_size(13) == 3000
+    assert crawler.frontier.urls(13) == set(task[0] for task in tasks[:4])
+    assert len(crawler.frontier.unfinished(13)) == 2
+
+    est = planner.estimate(13)
+    assert est['pages'] == 10
+    assert est['requests'] == 7
+    assert est['bytes'] == 7 * 3000
+
+    # 4 requests in flight of 1 second each, capped by the rate of 8 requests/s
+    assert planner.throughput() == 4
+    assert est['seconds'] == 7 / 4
+
+    output = io.StringIO()
+    assert planner.dry_run(13, output) == 7
+    assert 'http://ba/extra/' in output.getvalue().split()
+    assert tasks[0][0] not in output.getvalue().split()
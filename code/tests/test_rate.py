@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.rate import RateController, RateLimiter
+from classes.crawler import Crawler
+
+
+def controller():
+    return RateController(initial_rate=10, max_rate=40, verbose=False)
+
+
+def test_increase_up_to_the_ceiling():
+    rate = controller()
+    for i in range(10000):
+        rate.record(200, 0.05)
+
+    assert rate.rate == 40
+    assert rate.events == []
+
+
+def test_429_backs_off():
+    rate = controller()
+    rate.record(429)
+
+    assert rate.rate == 5
+    assert len(rate.events) == 1
+
+
+def test_isolated_errors_do_not_back_off():
+    rate = controller()
+    for i in range(500):
+        rate.record(500 if i % 10 == 0 else 200, 0.05)
+
+    assert rate.events == []
+    assert rate.rate > 10
+
+
+def test_many_errors_back_off():
+    rate = controller()
+    for i in range(11):
+        rate.record(None, error=True)
+
+    assert len(rate.events) == 1
+    assert rate.rate == 5
+
+
+def test_latency():
+    rate = controller()
+    for i in range(100):
+        rate.record(200, 0.03)
+
+    # Slower, but below the floor
+    for i in range(100):
+        rate.record(200, 0.09)
+    assert rate.events == []
+
+    # Much slower than usual
+    for i in range(50):
+        rate.record(200, 2.0)
+    assert len(rate.events) == 1
+    assert rate.events[0][1].startswith('p95 latency')
+
+
+def test_default_ceiling_above_the_start_rate(tmp_path):
+    crawler = Crawler(0.5, data_folder=str(tmp_path) + '/', progress=False)
+
+    assert crawler.rate.rate == 2
+    assert crawler.rate.max_rate > crawler.rate.rate
+
+
+def test_default_start_rate(tmp_path):
+    crawler = Crawler(data_folder=str(tmp_path) + '/', progress=False)
+    assert crawler.rate.rate == 1
+    assert crawler.rate.max_rate == 4
+
+    # No waiting at all
+    crawler = Crawler(0, data_folder=str(tmp_path) + '/', progress=False)
+    assert isinstance(crawler.rate, RateLimiter)
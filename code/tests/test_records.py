@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.stub_server import StubServer
+from classes.stub_site import SyntheticSite
+from classes.crawler import Crawler
+from classes.parser import Parser
+from classes.blocks import open_blocks, output_file
+from run_ba import run_steps
+import pandas as pd
+import pytest
+import shutil
+import io
+
+
+def legacy_record(f, row, rating, with_review):
+    """
+    Record written line by line, as the step 11 did before the pool of processes
+    """
+
+    f.write('beer_name: {}\n'.format(row['beer_name']).encode('utf-8'))
+    f.write('beer_id: {:d}\n'.format(row['beer_id']).encode('utf-8'))
+    f.write('brewery_name: {}\n'.format(row['brewery_name']).encode('utf-8'))
+    f.write('brewery_id: {:d}\n'.format(row['brewery_id']).encode('utf-8'))
+    f.write('style: {}\n'.format(row['style']).encode('utf-8'))
+    f.write('abv: {}\n'.format(row['abv']).encode('utf-8'))
+    f.write('date: {:d}\n'.format(rating['date']).encode('utf-8'))
+    f.write('user_name: {}\n'.format(rating['user_name']).encode('utf-8'))
+    f.write('user_id: {}\n'.format(rating['user_id']).encode('utf-8'))
+    f.write('appearance: {}\n'.format(rating['appearance']).encode('utf-8'))
+    f.write('aroma: {}\n'.format(rating['aroma']).encode('utf-8'))
+    f.write('palate: {}\n'.format(rating['palate']).encode('utf-8'))
+    f.write('taste: {}\n'.format(rating['taste']).encode('utf-8'))
+    f.write('overall: {}\n'.format(rating['overall']).encode('utf-8'))
+    f.write('rating: {:.2f}\n'.format(rating['rating']).encode('utf-8'))
+    f.write('text: {}\n'.format(rating['text']).encode('utf-8'))
+    if with_review:
+        f.write('review: {}\n'.format(rating['review']).encode('utf-8'))
+
+    f.write('\n'.encode('utf-8'))
+
+
+def legacy_step_11(parser):
+    """
+    Ratings and reviews of the step 11 before the pool of processes (one beer after the other, one rating per user)
+
+    :return: (bytes of ratings.txt, bytes of reviews.txt)
+    """
+
+    df = pd.read_csv(parser.data_folder + 'parsed/beers.csv')
+    df = df.drop_duplicates('beer_id', keep='first')
+
+    f_ratings = io.BytesIO()
+    f_reviews = io.BytesIO()
+
+    for i in df.index:
+        row = df.loc[i]
+        if row['nbr_ratings'] > 0:
+            folder = 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+            list_users = []
+            for file in sorted(parser.store.list(folder)):
+                for rating in parser.parse_review_page(folder + file):
+                    if rating['user_name'] in list_users:
+                        continue
+                    list_users.append(rating['user_name'])
+                    legacy_record(f_ratings, row, rating, True)
+                    if rating['review']:
+                        legacy_record(f_reviews, row, rating, False)
+
+    return f_ratings.getvalue(), f_reviews.getvalue()
+
+
+def read_output(data_folder, name):
+    with open_blocks(output_file(data_folder + 'parsed/' + name)) as f:
+        return f.read()
+
+
+@pytest.fixture(scope='module')
+def crawled(tmp_path_factory):
+    site = SyntheticSite(nbr_breweries=12, nbr_users=40, max_ratings=30)
+    server = StubServer(latency=0.0, site=site)
+    server.start()
+
+    data_folder = str(tmp_path_factory.mktemp('stub')) + '/'
+    crawler = Crawler(0, data_folder=data_folder, base_url=server.url, progress=False)
+    try:
+        run_steps(crawler, Parser(data_folder), steps=range(1, 11))
+    finally:
+        crawler.fetcher.close()
+        server.stop()
+
+    # beers.csv before the step 11 (which corrects the numbers of ratings)
+    shutil.copy(data_folder + 'parsed/beers.csv', data_folder + 'parsed/beers_step_10.csv')
+
+    return data_folder
+
+
+@pytest.mark.parametrize('processes,codec', [(1, 'gzip'), (2, 'gzip'), (1, 'zstd'), (2, 'none')])
+def test_step_11_same_records_as_before(crawled, processes, codec):
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+
+    shutil.copy(crawled + 'parsed/beers_step_10.csv', crawled + 'parsed/beers.csv')
+    parser = Parser(crawled, processes=processes, codec=codec)
+    ratings, reviews = legacy_step_11(parser)
+    assert len(ratings) > 0 and len(reviews) > 0
+
+    parser.parse_beer_files_for_reviews()
+
+    assert read_output(crawled, 'ratings.txt') == ratings
+    assert read_output(crawled, 'reviews.txt') == reviews
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.retry import CircuitBreaker
+from classes.crawler import Crawler
+import pytest
+
+
+def breaker():
+    return CircuitBreaker(window=10, threshold=0.5, min_requests=4, pause=30.0, verbose=False)
+
+
+def half_open(breaker_):
+    # The pause is over
+    breaker_.open_until = 0.0
+
+
+def test_opens_on_errors():
+    breaker_ = breaker()
+    for failure in [False, True, True, False]:
+        breaker_.record(failure)
+    assert breaker_.state == 'open'
+    assert breaker_.wait_time() > 0
+
+
+def test_probe():
+    breaker_ = breaker()
+    breaker_.trip(30.0, 1.0)
+
+    half_open(breaker_)
+    assert breaker_.wait_time() == 0
+    assert breaker_.state == 'half-open'
+
+    # Only one request probes the server
+    assert breaker_.wait_time() > 0
+
+    # Failed probe: twice the pause
+    breaker_.record(True)
+    assert breaker_.state == 'open'
+    assert breaker_.current_pause == 60.0
+
+    half_open(breaker_)
+    assert breaker_.wait_time() == 0
+    breaker_.record(False)
+    assert breaker_.state == 'closed'
+    assert breaker_.wait_time() == 0
+
+
+def test_probe_raising_does_not_block_the_crawl(tmp_path):
+    crawler = Crawler(0, data_folder=str(tmp_path) + '/', progress=False, breaker=breaker())
+    crawler.breaker.trip(30.0, 1.0)
+    half_open(crawler.breaker)
+
+    def request_and_wait(*args):
+        raise OSError('disk full')
+
+    crawler.request_and_wait = request_and_wait
+
+    with pytest.raises(OSError):
+        list(crawler.fetch_pages(['http://localhost/a']))
+
+    # The probe counts as a failure and the next one is allowed after the pause
+    assert crawler.breaker.state == 'open'
+    half_open(crawler.breaker)
+    assert crawler.breaker.wait_time() == 0
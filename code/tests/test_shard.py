@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.shard import frontier_file, merge_frontiers, verify_coverage, shard_of, beer_key
+from classes.frontier import Frontier
+import pandas as pd
+import os
+
+
+def test_merge_keeps_the_dead_letters(tmp_path):
+    data_folder = str(tmp_path) + '/'
+
+    for shard in range(2):
+        frontier = Frontier(frontier_file(data_folder, shard, 2))
+        frontier.add(9, [('url_{:d}'.format(shard), 'file_{:d}'.format(shard)),
+                         ('ok_{:d}'.format(shard), 'ok_{:d}'.format(shard))])
+        frontier.dead(9, 'url_{:d}'.format(shard), 500 + shard, 'exhausted')
+        frontier.done(9, 'ok_{:d}'.format(shard), 200, 10)
+        frontier.close()
+
+    frontier = merge_frontiers(data_folder, 2)
+
+    assert [(url, status, reason) for step, url, file, status, reason, died_at in frontier.dead_letters(9)] == \
+        [('url_0', 500, 'exhausted'), ('url_1', 501, 'exhausted')]
+    assert frontier.count(9, 'dead') == 2
+    assert frontier.count(9, 'done') == 2
+
+    # The dead pages of the shards can be replayed from the main frontier
+    assert frontier.replay(9, 501) == 1
+    assert frontier.files(9, 'pending') == ['file_1']
+
+    frontier.close()
+
+
+def test_verify_coverage(tmp_path):
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    pd.DataFrame({'brewery_id': [1, 1, 2, 3], 'beer_id': [10, 11, 20, 30]}).to_csv(data_folder + 'parsed/beers.csv',
+                                                                                    index=False)
+
+    beers = [(1, 10), (1, 11), (2, 20), (3, 30)]
+    for shard in range(2):
+        frontier = Frontier(frontier_file(data_folder, shard, 2))
+        for brewery_id, beer_id in beers:
+            if shard_of(beer_key(brewery_id, beer_id), 2) != shard:
+                continue
+            url = 'http://ba/beer/profile/{}/{}/'.format(brewery_id, beer_id)
+            frontier.add(9, [(url, 'beers/{}/{}/0.html'.format(brewery_id, beer_id))])
+            # The beer 30 was not crawled
+            if beer_id != 30:
+                frontier.done(9, url, 200, 10)
+        frontier.close()
+
+    coverage = verify_coverage(data_folder, 9, 2)
+
+    missing = [0, 0]
+    missing[shard_of(beer_key(3, 30), 2)] = 1
+    assert coverage == {'expected': 4, 'missing': missing, 'not_done': 1}
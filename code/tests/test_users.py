@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.users import UserStats, users_from_file
+from classes.parser import Parser
+import pandas as pd
+import pytest
+import os
+
+BEER = {'beer_name': 'Stout', 'beer_id': 1, 'brewery_name': 'Brewery', 'brewery_id': 2, 'style': 'Stout', 'abv': 8.0}
+
+
+def rating(user, date, review=False):
+    return {'user_name': user, 'user_id': user.lower() + '.1', 'appearance': 4.0, 'aroma': 4.0, 'palate': 4.0,
+            'taste': 4.0, 'overall': 4.0, 'rating': 4.0, 'text': 'Good', 'date': date, 'review': review}
+
+
+def write_ratings(parser, name, ratings):
+    f_ratings = parser.open_output(name)
+    f_reviews = parser.open_output(name.replace('ratings', 'reviews'))
+    for rating_ in ratings:
+        parser.write_records(f_ratings, f_reviews, BEER, rating_)
+    f_ratings.close()
+    f_reviews.close()
+
+
+@pytest.fixture
+def parser(tmp_path):
+    data_folder = str(tmp_path) + '/'
+    os.makedirs(data_folder + 'parsed')
+    return Parser(data_folder)
+
+
+def test_merge_same_as_adding_everything():
+    ratings = [rating('A', 5), rating('B', 3, True), rating('A', 1, True), rating('C', 9), rating('B', 7)]
+
+    full = UserStats()
+    for rating_ in ratings:
+        full.add(rating_['user_name'], rating_['user_id'], rating_['review'], rating_['date'])
+
+    merged = UserStats()
+    for part in [ratings[:2], ratings[2:3], ratings[3:]]:
+        stats = UserStats()
+        for rating_ in part:
+            stats.add(rating_['user_name'], rating_['user_id'], rating_['review'], rating_['date'])
+        merged.merge(stats)
+
+    assert merged.users == full.users
+    assert full.users['A'] == ['a.1', 2, 1, 1, 5]
+    assert list(full.to_frame()['user_name']) == ['A', 'B', 'C']
+
+
+def test_users_from_file(parser):
+    write_ratings(parser, 'ratings.txt', [rating('A', 5), rating('B', 3, True), rating('A', 1, True)])
+
+    stats = users_from_file(parser.output('ratings.txt'))
+    assert stats.users == {'A': ['a.1', 2, 1, 1, 5], 'B': ['b.1', 1, 1, 3, 3]}
+
+
+def test_step_12_only_when_the_ratings_changed(parser):
+    users_file = parser.data_folder + 'parsed/users.csv'
+
+    write_ratings(parser, 'ratings.txt', [rating('A', 5), rating('B', 3)])
+    parser.get_users_from_ratings()
+    assert list(pd.read_csv(users_file)['user_name']) == ['A', 'B']
+
+    # Nothing changed, even if users.csv was written again (e.g. by the step 14)
+    pd.DataFrame({'user_name': ['edited']}).to_csv(users_file, index=False)
+    parser.get_users_from_ratings()
+    assert list(pd.read_csv(users_file)['user_name']) == ['edited']
+
+    # New ratings of the incremental step
+    write_ratings(parser, 'ratings_new.txt', [rating('C', 8), rating('A', 9, True)])
+    parser.get_users_from_ratings()
+    df = pd.read_csv(users_file)
+    assert list(df['user_name']) == ['A', 'B', 'C']
+    assert list(df['nbr_ratings']) == [2, 1, 1]
+    assert list(df['last_date']) == [9, 3, 8]
+
+    # The ratings are written again
+    write_ratings(parser, 'ratings.txt', [rating('D', 5)])
+    parser.get_users_from_ratings()
+    assert list(pd.read_csv(users_file)['user_name']) == ['D', 'C', 'A']
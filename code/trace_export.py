@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       This file exports a trace of the pipeline (JSONL file of the Tracer) as a    ##
+##         Chrome trace and/or as folded stacks for a flamegraph, and prints the      ##
+##                        time spent in each type of span.                            ##
+##                                                                                    ##
+##   python trace_export.py ../data/misc/trace.jsonl --chrome trace.json              ##
+##   python trace_export.py ../data/misc/trace.jsonl --folded trace.folded            ##
+##   flamegraph.pl trace.folded > trace.svg                                           ##
+##                                                                                    ##
+########################################################################################
+
+from classes.tracing import read_trace, to_chrome, to_folded
+import argparse
+
+
+def summary(file):
+    """
+    Print the number of spans and the total time of each name (and pattern for the regexes, page for the extractions)
+
+    :param file: JSONL file written by a Tracer
+    """
+
+    totals = {}
+    for span in read_trace(file):
+        name = span['name']
+        for key in ['pattern', 'page']:
+            if key in span['attrs']:
+                name += ' ' + span['attrs'][key]
+        count, dur = totals.get(name, (0, 0))
+        totals[name] = (count + 1, dur + span['dur'])
+
+    for name, (count, dur) in sorted(totals.items(), key=lambda x: -x[1][1]):
+        print('{:20s} {:8d} spans {:10.3f} s'.format(name, count, dur / 1e6))
+
+
+def run():
+    """
+    Parse the command line and export the trace
+    """
+
+    parser = argparse.ArgumentParser(description='Export a trace of the pipeline')
+    parser.add_argument('trace', help='JSONL file written by the Tracer')
+    parser.add_argument('--chrome', default=None, help='JSON file for chrome://tracing or Perfetto')
+    parser.add_argument('--folded', default=None, help='Folded stacks for flamegraph.pl or speedscope')
+    args = parser.parse_args()
+
+    summary(args.trace)
+
+    if args.chrome is not None:
+        print('{:d} spans written in {}'.format(to_chrome(args.trace, args.chrome), args.chrome))
+
+    if args.folded is not None:
+        print('{:d} stacks written in {}'.format(to_folded(args.trace, args.folded), args.folded))
+
+
+if __name__ == '__main__':
+    run()